@@ -1,17 +1,37 @@
 import dash
-from dash import html, Input, Output, State, ctx, dcc
+from dash import html, Input, Output, State, ctx, dcc, ClientsideFunction
 import dash_bootstrap_components as dbc
 import pandas as pd
 import numpy as np
-from sqlalchemy import create_engine, text
-from flask import request
+from sqlalchemy import text
+from flask import request, jsonify, abort
 from datetime import datetime
 import os
 import logging
 import dash.exceptions
 import dash_ag_grid as dag
 import re
-from credentials import get_host_environment, get_credentials, create_dash_app
+import uuid
+import json
+import hashlib
+import time
+from credentials import get_host_environment, get_credentials, get_engine_settings, create_dash_app
+from offline_sync import apply_sync_ops, normalize_row, MAX_SYNC_OPS
+from kit_registration import KitRequestError, register_kits
+from single_flight import read_sql_shared, shared_reads
+from identity import UserDirectory, current_identity
+from profiling import configure_profiling
+from callback_trace import configure_callback_trace
+from db_executor import DatabaseBusy, offload
+from health import DatabaseProbe, WarmUp
+from tracking_api import TrackingQueryError, parse_page_args, tracking_page, build_page_query, split_page
+from typeahead import DistinctValueIndex, TYPEAHEAD_FIELDS
+from snapshot_cache import TableSnapshot
+from kit_summary import KitStatusSummary
+from working_set import TRACKING_SCHEMA, to_working_set, to_grid_records
+from exports import EXPORT_COLUMNS, EXPORT_FORMATS, build_export_query, is_unfiltered, write_export
+from archive import ArchiveCatalog
+from storage import open_storage, text_in
 from pandas.api.types import DatetimeTZDtype
 
 # Version number to display
@@ -46,103 +66,162 @@ host = get_host_environment(COMPUTER)
 # initialize the app based on host, specify the url_prefix if needed
 app, server = create_dash_app(host, path_prefix, URL_PREFIX)
 
-# empty dictionary to hold headers
-request_headers = {}
+# cProfile capture of selected callback requests (only when PROFILE_TOKEN is set)
+configure_profiling(app, 'logs')
+
+# Get the engines for the configured backend (storage.py): Postgres, where reads
+# use the viewer account (optionally on a replica) and writes the editor account,
+# or the embedded SQLite file
+engine_settings = get_engine_settings(SERVER)
+storage = open_storage(engine_settings, SERVER, (VIEWER_USER, VIEWER_PASSWORD), (EDITOR_USER, EDITOR_PASSWORD))
+dcp_sql_engine = storage.dcp_engine
+mercury_read_engine = storage.read_engine
+mercury_sql_engine = storage.write_engine
+
+# dcp users, matched against the Dh-User header of each request
+user_directory = UserDirectory(dcp_sql_engine)
+
+# Snapshot frames are typed and sorted by sampleid (api/tracking pages by sampleid)
+def load_tracking_frame(df):
+    return to_working_set(df).sort_values("sampleid", ignore_index=True)
+
+# The snapshot and kit summary reload right after writes, so they must see them.
+# They run on the read pool, which leaves the editor pool to writes. Only when
+# reads go to a replica (READ_SERVER) do they use the primary, since replica lag
+# would otherwise cache the old table under the new version.
+fresh_read_engine = mercury_sql_engine if engine_settings["read_server"] != SERVER else mercury_read_engine
+
+# Whole-table snapshot shared by all workers through cache/, invalidated by every write below
+tracking_snapshot = TableSnapshot(
+    fresh_read_engine,
+    "SELECT * FROM pas_tracking",
+    os.path.join(parent_dir, 'cache'),
+    storage.snapshot_name,
+    transform=load_tracking_frame
+)
 
-# Get connection string
-dcp_sql_engine_string = ('postgresql://{}:{}@{}/{}?sslmode=require').format(EDITOR_USER,EDITOR_PASSWORD,SERVER,'dcp')
-dcp_sql_engine = create_engine(dcp_sql_engine_string)
+# Distinct shipped locations / kit IDs / sampler IDs for suggestions (loaded on first
+# use), reloaded when the snapshot version shows a write from another worker
+typeahead_index = DistinctValueIndex(fresh_read_engine, version=tracking_snapshot.version)
 
-mercury_sql_engine_string = ('postgresql://{}:{}@{}/{}?sslmode=require').format(EDITOR_USER,EDITOR_PASSWORD,SERVER,'mercury_passive')
-mercury_sql_engine = create_engine(mercury_sql_engine_string)
+# Archived (fully returned, older) kits live in pas_tracking_archive; screens read
+# the hot table only, exports and api/tracking can opt in to the archive
+tracking_archive = ArchiveCatalog(mercury_read_engine)
 
-# Global storage for the new dataframe
-database_df = pd.DataFrame(columns=[
-    'sample_start', 'sample_end', 'sampleid', 'kitid', 'samplerid',
-    'siteid', 'shipped_location', 'shipped_date', 'return_date',
-    'sample_type', 'note', 'screen_sampling_rate','delete'
-])
+# Kit status panel, recomputed when the snapshot version changes
+kit_summary = KitStatusSummary(fresh_read_engine, tracking_snapshot)
 
-# Global table headers dict
-headerNames = {
-    "sample_start": "Sample Start",
-    "sample_end": "Sample End",
-    "sampleid": "Sample ID",
-    "kitid": "Kit ID",
-    "samplerid": "Sampler ID",
-    "siteid": "Site ID",
-    "shipped_location": "Shipped Location",
-    "shipped_date": "Shipped Date",
-    "return_date": "Return Date",
-    "sample_type": "Sample Type",
-    "note": "Note"
-}
+# Columns users can edit; rows loaded from the database keep their loaded values
+# under "original" so upload can tell which rows (and which columns) changed
+EDITABLE_COLUMNS = [
+    'sample_start', 'sample_end', 'kitid', 'samplerid', 'siteid', 'shipped_location',
+    'shipped_date', 'return_date', 'sample_type', 'note'
+]
 
 # Define the placeholder for date/time columns
 DATE_TIME_PLACEHOLDER = "YYYY-MM-DD HH:MM"
 
-# Table div
-global tablehtml
-
-# %% Layout function, useful for having two UI options (e.g., mobile vs desktop)
-def serve_layout():
-    global databases
-    global users
+# Most recent kit containing a sampler: open kits (no return date) first, then
+# the latest shipped, and return every row of that shipment. Kit IDs are reused
+# once a kit comes back, so the shipment is (kitid, shipped_date), not kitid alone.
+# Served by the pas_tracking_samplerid_idx / pas_tracking_kitid_idx indexes (sql/pas_tracking_indexes.sql)
+CURRENT_KIT_FOR_SAMPLER_QUERY = text("""
+    WITH sampler_kits AS (
+        SELECT
+            kitid,
+            shipped_date,
+            ROW_NUMBER() OVER (
+                PARTITION BY samplerid
+                ORDER BY (return_date IS NULL) DESC,
+                         shipped_date DESC NULLS LAST,
+                         sample_start DESC NULLS LAST
+            ) AS kit_rank
+        FROM pas_tracking
+        WHERE samplerid = :samplerid
+          AND kitid IS NOT NULL
+    )
+    SELECT t.*
+    FROM pas_tracking t
+    JOIN sampler_kits k ON k.kitid = t.kitid AND t.shipped_date IS NOT DISTINCT FROM k.shipped_date
+    WHERE k.kit_rank = 1
+    ORDER BY t.sampleid
+""")
+
+# %% Reference data (mercury sites) from the dcp database
+def load_reference_data():
     global sites
     global sites_clean
-    global tablehtml
-    
-    logger.info('starting serve_layout')
+    global reference_loaded_at
 
-    # Pull required data from tables
-    users = pd.read_sql_table("users", dcp_sql_engine)
     sites = pd.read_sql_query("select * from stations", dcp_sql_engine)
     
     sites_clean = sorted([
         f"{row.description} ({row.siteid})"
         for _, row in sites.query("projectid == 'MERCURY_PASSIVE'").iterrows()
     ])
-    dcp_sql_engine.dispose()
-    mercury_sql_engine.dispose()
-    
-    tablehtml = html.Div(
-        dag.AgGrid(
-            id="database-table",
-            enableEnterpriseModules=True,
-            columnDefs=[
-                {"field": "sample_start", "headerName": "Sample Start", "editable": True,"cellEditor": {"function": "DateTimePicker"}, "suppressSizeToFit": True, "width": 145},
-                {"field": "sample_end", "headerName": "Sample End", "editable": True,"cellEditor": {"function": "DateTimePicker"}, "suppressSizeToFit": True, "width": 145},
-                {"field": "sampleid", "headerName": "Sample ID", "editable": False, "suppressSizeToFit": True, "width": 156,"hide": True},
-                {"field": "kitid", "headerName": "Kit ID", "editable": True, "suppressSizeToFit": True, "width": 100},
-                {"field": "samplerid", "headerName": "Sampler ID", "editable": True, "suppressSizeToFit": True, "width": 127},
-                {"field": "siteid", "headerName": "Site", "editable": True, "suppressSizeToFit": True, "width": 150,
-                 "cellEditor": {"function": "SearchableDropdownEditor"},"cellEditorParams": {"values": sites_clean}},
-                {"field": "shipped_location", "headerName": "Shipped Location", "editable": True, "suppressSizeToFit": True, "width": 165},
-                {"field": "shipped_date","headerName": "Shipped Date","editable": True,"cellEditor": {"function": "DatePicker"},"suppressSizeToFit": True, "width": 146},
-                {"field": "return_date", "headerName": "Return Date", "editable": True,"cellEditor": {"function": "DatePicker"},"suppressSizeToFit": True, "width": 133},
-                {"field": "sample_type", "headerName": "Sample Type", "editable": True, "cellEditor": "agSelectCellEditor", "cellEditorParams": {"values": ["Sample", "Blank"]}, "suppressSizeToFit": True, "width": 130},
-                {"field": "note", "headerName": "Note", "editable": True, "suppressSizeToFit": True, "width": 100},
-                {"field": "delete","width": 100,"cellRenderer": "DBC_Button_Simple","cellRendererParams": {"color": "danger"}},
-                {"field": "original_sampleid","hide": True}
-            ],
-            defaultColDef={"resizable": True, "sortable": False,"editable": True},
-            columnSize="sizeToFit",
-            dashGridOptions={"rowSelection":"single",
-                             "animateRows": True,
-                             "editable": True,
-                             "enableRangeSelection": True,
-                             "enableFillHandle": True,
-                             "undoRedoCellEditing": True,
-                             "undoRedoCellEditingLimit": 20,
-                             "suppressClipboardPaste": False,
-                             "loading": False
-            },
-            className="ag-theme-alpine-dark",
-            style={"height": "400px", "width": "100%"}
-        ),
-        style={"padding": "0 40px"}
+    reference_loaded_at = time.time()
+
+# Stations change rarely; reload them at most every REFERENCE_MAX_AGE seconds
+REFERENCE_MAX_AGE = 600
+
+def ensure_reference_data():
+    if "sites" not in globals() or time.time() - reference_loaded_at > REFERENCE_MAX_AGE:
+        shared_reads.do("reference_data", load_reference_data)
+
+# %% Map grid site labels ("Description (SITEID)") back to siteid
+def get_siteid_map():
+    ensure_reference_data()
+    return {
+        f"{row.description} ({row.siteid})": row.siteid
+        for _, row in sites.query("projectid == 'MERCURY_PASSIVE'").iterrows()
+    }
+
+# %% Edit grid, mounted into grid-container after the first paint (see mount_grid)
+def build_grid():
+    return dag.AgGrid(
+        id="database-table",
+        enableEnterpriseModules=True,
+        columnDefs=[
+            {"field": "sample_start", "headerName": "Sample Start", "editable": True,"cellEditor": {"function": "DateTimePicker"}, "valueSetter": {"function": "setSampleDatetime(params)"}, "suppressSizeToFit": True, "width": 145},
+            {"field": "sample_end", "headerName": "Sample End", "editable": True,"cellEditor": {"function": "DateTimePicker"}, "valueSetter": {"function": "setSampleDatetime(params)"}, "suppressSizeToFit": True, "width": 145},
+            {"field": "sampleid", "headerName": "Sample ID", "editable": False, "suppressSizeToFit": True, "width": 156,"hide": True},
+            {"field": "kitid", "headerName": "Kit ID", "editable": True, "valueSetter": {"function": "setSampleIdPart(params)"}, "suppressSizeToFit": True, "width": 100},
+            {"field": "samplerid", "headerName": "Sampler ID", "editable": True, "valueSetter": {"function": "setSampleIdPart(params)"}, "suppressSizeToFit": True, "width": 127},
+            {"field": "siteid", "headerName": "Site", "editable": True, "suppressSizeToFit": True, "width": 150,
+             "cellEditor": {"function": "SearchableDropdownEditor"},"cellEditorParams": {"optionsUrl": "api/sites"}},
+            {"field": "shipped_location", "headerName": "Shipped Location", "editable": True, "suppressSizeToFit": True, "width": 165},
+            {"field": "shipped_date","headerName": "Shipped Date","editable": True,"cellEditor": {"function": "DatePicker"},"suppressSizeToFit": True, "width": 146},
+            {"field": "return_date", "headerName": "Return Date", "editable": True,"cellEditor": {"function": "DatePicker"},"suppressSizeToFit": True, "width": 133},
+            {"field": "sample_type", "headerName": "Sample Type", "editable": True, "cellEditor": "agSelectCellEditor", "cellEditorParams": {"values": ["Sample", "Blank"]}, "suppressSizeToFit": True, "width": 130},
+            {"field": "note", "headerName": "Note", "editable": True, "suppressSizeToFit": True, "width": 100},
+            {"field": "delete","width": 100,"cellRenderer": "DBC_Button_Simple","cellRendererParams": {"color": "danger"}},
+            {"field": "original_sampleid","hide": True}
+        ],
+        getRowId="params.data.rowid",
+        rowClassRules={"row-dirty": "isRowDirty(params.data)"},
+        defaultColDef={"resizable": True, "sortable": False,"editable": True},
+        columnSize="sizeToFit",
+        dashGridOptions={"rowSelection": {"mode": "multiRow", "checkboxes": True, "headerCheckbox": True, "enableClickSelection": False},
+                         "animateRows": True,
+                         "editable": True,
+                         "enableRangeSelection": True,
+                         "enableFillHandle": True,
+                         "undoRedoCellEditing": True,
+                         "undoRedoCellEditingLimit": 20,
+                         "suppressClipboardPaste": False,
+                         "loading": False
+        },
+        className="ag-theme-alpine-dark",
+        style={"height": "400px", "width": "100%"}
     )
 
+# %% Layout function, useful for having two UI options (e.g., mobile vs desktop)
+# Nothing here reads the database, so the page paints without waiting on it
+def serve_layout():
+    global databases
+
+    logger.info('starting serve_layout')
+
     return [html.Div(id="display", style={'textAlign': 'center'},children = [
         dbc.Row([
             html.H1('SampleTrack - Passive Mercury'),
@@ -201,15 +280,42 @@ def serve_layout():
             justify="center",
             className="buttons_div"
         ),
+        dbc.Row(
+            dbc.Col(
+                html.Div([
+                    dbc.Switch(
+                        id="offline-mode",
+                        label="Offline mode",
+                        value=False,
+                        persistence=True,
+                        persistence_type="local",
+                        className="d-inline-block me-3"
+                    ),
+                    dbc.Button("Sync now", id="btn-sync-offline", color="info", size="sm", className="me-3"),
+                    html.Span(id="offline-queue-status", className="text-muted"),
+                    dbc.Tooltip("Queue edits and new kits on this device and send them when the connection is back", target="offline-mode", placement="bottom"),
+                ], className="d-flex align-items-center mt-2"),
+                width="auto",
+            ),
+            justify="center"
+        ),
         dcc.Loading(
             id="db-loading-wrapper",
             type="default",  # You can also use "circle" or "dot"
             children=html.Div(id="db-loading-output", style={"display": "inline-block"})
         ),
         html.Hr(),
-        tablehtml,
+        html.Div(id="grid-container", style={"padding": "0 40px", "minHeight": "400px"}),
         html.Div(id="edit-confirmation", style={"textAlign": "center", "color": "green", "marginTop": "10px"}),
         html.Div(id="overwrite-confirmation", style={"textAlign": "center", "color": "green", "marginTop": "10px"}),
+        dbc.Card(
+            [
+                dbc.CardHeader("Kit Status"),
+                dbc.CardBody(id="kit-summary", children=[])
+            ],
+            className="mt-3"
+        ),
+        dcc.Interval(id="kit-summary-interval", interval=60000),
         dbc.Modal(
             id="new-entry-modal",
             is_open=False,
@@ -277,6 +383,7 @@ def serve_layout():
                             id="update-kitid-textinput",
                             type="text",
                             autoComplete="off",
+                            list="update-id-suggestions",
                             placeholder="EC-XXXX",
                             className="text-center",
                             persistence=True,
@@ -292,7 +399,8 @@ def serve_layout():
                             persistence=True,
                             persistence_type='session',
                             style={'width': '250px', 'margin': '0 auto', 'display': 'none'}
-                        )
+                        ),
+                        html.Datalist(id="update-id-suggestions", children=[])
                     ], id="update-id-input-container"),
                     html.Div(id="update-kitid-feedback", className="mt-3 text-center")
                 ]),
@@ -305,23 +413,30 @@ def serve_layout():
         dcc.Store(id="entry-store", data=[]),
         dcc.Store(id="editing", data=False),
         dcc.Store(id="entry-counter", data=1),
-        dcc.Store(id='database-store', data=[]),
-        dcc.Store(id="kitid-filtered-data", data=None),
         dcc.Interval(id='log_updater', interval=5000),
         html.Div(
-            dbc.Button(
-                "Upload Data to Database",
-                id="btn-upload-data",
-                color="success",
-                className="mt-4",
-                style={'display': 'none'} 
-            ),
+            [
+                dbc.Button(
+                    "Upload Data to Database",
+                    id="btn-upload-data",
+                    color="success",
+                    className="mt-4",
+                    style={'display': 'none'} 
+                ),
+                dbc.Button(
+                    "Delete Selected",
+                    id="btn-delete-selected",
+                    color="danger",
+                    className="mt-4 ms-2",
+                    disabled=True
+                ),
+            ],
             className="d-flex justify-content-center"
         ),
         
         html.Div(
             dbc.Button(
-                "Download Database as CSV",
+                "Export Data",
                 id="btn-download-db",
                 color="info",
                 className="mt-2",
@@ -330,6 +445,74 @@ def serve_layout():
         ),
         
         dcc.Download(id="download-db-csv"),
+        dbc.Modal(
+            id="export-modal",
+            is_open=False,
+            size="lg",
+            children=[
+                dbc.ModalHeader("Export Data"),
+                dbc.ModalBody([
+                    html.H6("Sampling dates", className="mb-2"),
+                    dcc.DatePickerRange(
+                        id="export-date-range",
+                        display_format="YYYY-MM-DD",
+                        clearable=True,
+                        className="mb-3"
+                    ),
+                    html.H6("Sites", className="mb-2"),
+                    dcc.Dropdown(
+                        id="export-sites",
+                        options=[],  # To be set when the modal opens
+                        multi=True,
+                        placeholder="All sites",
+                        className="mb-3"
+                    ),
+                    html.H6("Kit IDs", className="mb-2"),
+                    dbc.Input(
+                        id="export-kitids",
+                        type="text",
+                        autoComplete="off",
+                        placeholder="All kits, or EC-XXXX, EC-XXXX, ...",
+                        className="mb-3"
+                    ),
+                    html.H6("Shipped locations", className="mb-2"),
+                    dcc.Dropdown(
+                        id="export-locations",
+                        options=[],  # To be set when the modal opens
+                        multi=True,
+                        placeholder="All locations",
+                        className="mb-3"
+                    ),
+                    html.H6("Columns", className="mb-2"),
+                    dbc.Checklist(
+                        id="export-columns",
+                        options=[{"label": col, "value": col} for col in EXPORT_COLUMNS],
+                        value=EXPORT_COLUMNS,
+                        inline=True,
+                        className="mb-3"
+                    ),
+                    html.H6("Format", className="mb-2"),
+                    dbc.RadioItems(
+                        id="export-format",
+                        options=[{"label": label, "value": fmt} for fmt, (label, _) in EXPORT_FORMATS.items()],
+                        value="csv",
+                        inline=True
+                    ),
+                    dbc.Checklist(
+                        id="export-include-archive",
+                        options=[{"label": "Include archived kits", "value": "archive"}],
+                        value=[],
+                        switch=True,
+                        className="mt-3"
+                    ),
+                    html.Div(id="export-feedback", className="mt-3 text-center")
+                ]),
+                dbc.ModalFooter([
+                    dbc.Button("Download", id="btn-export-download", color="success", className="me-2"),
+                    dbc.Button("Close", id="btn-export-close", color="secondary")
+                ])
+            ]
+        ),
         dbc.Modal(
             id="overwrite-confirm-modal",
             is_open=False,
@@ -359,11 +542,38 @@ def serve_layout():
             ]
         ),
         dcc.Store(id="duplicate-rows", data=[]),
+        dcc.Store(id="upload-request"),
         dcc.Store(id="overwrite-confirmed", data=False),
-        dcc.Store(id="row-pending-delete")
+        dcc.Store(id="rows-pending-delete"),
+        # pas_tracking snapshot version after the last write from this page (upload,
+        # overwrite, delete, offline sync); refreshes the kit summary
+        dcc.Store(id="write-committed", data=0)
     ])
     ]
 
+# %% Mount the grid once the page has painted. Its bundle is only fetched then; it
+# is not deferred further because many callbacks (and the offline queue) write to it,
+# and Dash skips callbacks whose outputs are not in the page.
+@app.callback(
+    Output("grid-container", "children"),
+    Input("grid-container", "id")
+)
+def mount_grid(_):
+    return build_grid()
+
+# %% Site labels for the grid's site editor, fetched once per page when it first opens
+@server.route(f"{app.config.routes_pathname_prefix}api/sites", methods=["GET"])
+def site_options():
+    try:
+        ensure_reference_data()
+    except Exception as e:
+        logging.error(f"Could not load sites: {e}")
+        abort(503)
+    response = jsonify({"values": sites_clean})
+    response.cache_control.private = True
+    response.cache_control.max_age = REFERENCE_MAX_AGE
+    return response
+
 # %% Function to create textbox rows
 def create_text_row(index: int, value="", editable=True, selection=None):
     return html.Div(
@@ -502,10 +712,13 @@ def delete_row(delete_clicks, entry_data):
     State("static-kit-id-input", "value"),
     State("entry-store", "data"),
     State("entry-container", "children"),
+    State("offline-mode", "value"),
     prevent_initial_call=True
 )
-def validate_and_build_df(n_clicks, kit_id_value, entry_data, current_components):
-    global database_df
+def validate_and_build_df(n_clicks, kit_id_value, entry_data, current_components, offline):
+    # Offline mode: the kit is queued in the browser instead (assets/offlineQueue.js)
+    if offline:
+        raise dash.exceptions.PreventUpdate
 
     # Validate Kit ID
     if not kit_id_value or not re.fullmatch(r"EC-\d{4}", kit_id_value.strip()):
@@ -539,82 +752,23 @@ def validate_and_build_df(n_clicks, kit_id_value, entry_data, current_components
             'note': None,
             'screen_sampling_rate': None,
             'delete': 'Delete',
-            'original_sampleid': None
+            'original_sampleid': None,
+            'original': None,
+            'rowid': uuid.uuid4().hex
         })
 
-    database_df = pd.DataFrame(records)
-    return database_df.to_dict("records"), {'display': 'block', 'margin-top': '20px'}, "", {"color": "green"}, False, current_components, entry_data
+    return records, {'display': 'block', 'margin-top': '20px'}, "", {"color": "green"}, False, current_components, entry_data
 
 
-# %% Update df whenever user edits the datatable
-@app.callback(
-    Output("edit-confirmation", "children",allow_duplicate=True),
-    Output("database-table", "rowData"),
+# %% Edit feedback, rendered in the browser (validation and sampleid derivation
+# happen in the grid's valueSetters, see assets/dashAgGridFunctions.js)
+app.clientside_callback(
+    ClientsideFunction(namespace="grid", function_name="editFeedback"),
+    Output("edit-confirmation", "children", allow_duplicate=True),
     Output("overwrite-confirmation", "children", allow_duplicate=True),
     Input("database-table", "cellValueChanged"),
-    State("database-table", "rowData"),
     prevent_initial_call=True
 )
-def sync_table_edits(cellValueChanged, current_grid_data):
-    global database_df
-    
-    if not cellValueChanged:
-        raise dash.exceptions.PreventUpdate
-
-    changed_col = cellValueChanged[0]['colId']
-    user_friendly_col = headerNames.get(changed_col, changed_col)
-    changed_row_index = cellValueChanged[0]['rowIndex']
-    user_friendly_row = changed_row_index + 1
-    new_value_raw = cellValueChanged[0]['value']
-    old_value = cellValueChanged[0]['oldValue']
-
-    updated_grid_data = list(current_grid_data)
-
-    feedback_message = ""
-    feedback_style = {"color": "green"}
-
-    # Update the value in the grid data first
-    if changed_col in ['sample_start', 'sample_end']:
-        if new_value_raw:
-            strict_dt_regex = r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}$"
-
-            if not re.fullmatch(strict_dt_regex, str(new_value_raw)):
-                updated_grid_data[changed_row_index][changed_col] = old_value if old_value is not None else ""
-                feedback_message = f"Invalid datetime format for {user_friendly_col} at Row {user_friendly_row}. Expected format: YYYY-MM-DD HH:MM."
-                feedback_style = {"color": "red"}
-            else:
-                updated_grid_data[changed_row_index][changed_col] = new_value_raw
-                feedback_message = f"{user_friendly_col} at Row {user_friendly_row}, changed from '{old_value}' to '{new_value_raw}'."
-                feedback_style = {"color": "green"}
-        else:
-            updated_grid_data[changed_row_index][changed_col] = "" # Keep as empty string if user clears it in UI
-            feedback_message = f"{user_friendly_col} at Row {user_friendly_row}, value cleared."
-            feedback_style = {"color": "green"}
-    else:
-        updated_grid_data[changed_row_index][changed_col] = new_value_raw
-        feedback_message = f"{user_friendly_col} at Row {user_friendly_row}, changed from '{old_value}' to '{new_value_raw}'."
-        feedback_style = {"color": "green"}
-
-    # After updating the changed cell, check if sampleid needs to be updated
-    if changed_col in ['kitid', 'samplerid']:
-        row = updated_grid_data[changed_row_index]
-        current_kitid = row.get('kitid') if row.get('kitid') is not None else ""
-        current_samplerid = row.get('samplerid') if row.get('samplerid') is not None else ""
-        
-        # Construct the new sampleid
-        new_sampleid = f"{current_kitid}_{current_samplerid}"
-        
-        # Only update if the sampleid actually changes to avoid unnecessary re-renders
-        if row.get('sampleid') != new_sampleid:
-            updated_grid_data[changed_row_index]['sampleid'] = new_sampleid
-            # Also update feedback message to indicate sampleid was updated
-            feedback_message += f" Sample ID updated to '{new_sampleid}'."
-
-
-    database_df = pd.DataFrame(updated_grid_data)
-    #database_df.to_csv("debug_database_df.csv",index =False)
-
-    return html.Div(feedback_message, style=feedback_style), updated_grid_data,[]
 
 # %% Grab user email from headers
 @app.callback(
@@ -624,16 +778,12 @@ def sync_table_edits(cellValueChanged, current_grid_data):
     Input('user', 'id')
 )
 def display_headers(_):
-    if request_headers.get('Dh-User'):
-        return [request.headers.get('Dh-User'), True, {'display': 'none'}]
+    identity = current_identity(user_directory)
+    if identity:
+        return [identity["user_id"], True, {'display': 'none'}]
     else:
         return [None, False, {'display': 'none'}]
 
-@app.server.before_request
-def before_request():
-    global request_headers
-    request_headers = dict(request.headers)  # Capture headers before processing any request
-
 # %% javascript used to autofocus newly created textboxes in "New" modal
 app.clientside_callback(
     """
@@ -657,32 +807,218 @@ app.clientside_callback(
     prevent_initial_call=True
 )
 
-# %% Upload Data button with duplicates checking
+# %% Offline edit queue (assets/offlineQueue.js)
+app.clientside_callback(
+    ClientsideFunction(namespace="offline", function_name="queueGridEdit"),
+    Output("offline-queue-status", "children", allow_duplicate=True),
+    Input("database-table", "cellValueChanged"),
+    State("offline-mode", "value"),
+    prevent_initial_call=True
+)
+
+app.clientside_callback(
+    ClientsideFunction(namespace="offline", function_name="queueNewKit"),
+    Output("offline-queue-status", "children", allow_duplicate=True),
+    Output("database-table", "rowTransaction", allow_duplicate=True),
+    Output("new-kitid-feedback", "children", allow_duplicate=True),
+    Output("new-kitid-feedback", "style", allow_duplicate=True),
+    Output("new-entry-modal", "is_open", allow_duplicate=True),
+    Input("new-done-button", "n_clicks"),
+    State("static-kit-id-input", "value"),
+    State("entry-store", "data"),
+    State("offline-mode", "value"),
+    prevent_initial_call=True
+)
+
+app.clientside_callback(
+    ClientsideFunction(namespace="offline", function_name="sync"),
+    Output("offline-queue-status", "children", allow_duplicate=True),
+    Output("database-table", "rowTransaction", allow_duplicate=True),
+    Output("write-committed", "data", allow_duplicate=True),
+    Input("btn-sync-offline", "n_clicks"),
+    prevent_initial_call=True
+)
+
+# %% Batched, idempotent sync endpoint for the offline queue
+@server.route(f"{app.config.routes_pathname_prefix}api/sync", methods=["POST"])
+@offload
+def sync_offline_edits():
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or not isinstance(payload.get("ops"), list):
+        return jsonify({"error": "Expected a JSON object with an 'ops' list."}), 400
+    if len(payload["ops"]) > MAX_SYNC_OPS:
+        return jsonify({"error": f"At most {MAX_SYNC_OPS} operations per sync."}), 413
+
+    try:
+        siteid_map = get_siteid_map()
+        with mercury_sql_engine.begin() as conn:
+            results, applied_rows = apply_sync_ops(conn, payload["ops"], siteid_map)
+    except Exception as e:
+        logging.error(f"Offline sync failed: {e}")
+        return jsonify({"error": f"Sync failed: {e}"}), 500
+
+    snapshot_version = tracking_snapshot.bump() if applied_rows else None
+    typeahead_index.add_rows(applied_rows)
+    logger.info(f"Offline sync: {len(applied_rows)} applied, {len(results) - len(applied_rows)} skipped")
+    return jsonify({"results": results, "version": snapshot_version})
+
+# %% Batch kit registration for the scanner station and scripts
+@server.route(f"{app.config.routes_pathname_prefix}api/kits", methods=["POST"])
+@offload
+def register_kits_api():
+    payload = request.get_json(silent=True)
+    idempotency_key = (request.headers.get("Idempotency-Key") or "").strip() or None
+    try:
+        with mercury_sql_engine.begin() as conn:
+            response, applied_rows, replayed = register_kits(conn, payload, idempotency_key)
+    except KitRequestError as e:
+        return jsonify({"error": str(e)}), e.status
+    except Exception as e:
+        logging.error(f"Kit registration failed: {e}")
+        return jsonify({"error": f"Registration failed: {e}"}), 500
+
+    if applied_rows:
+        tracking_snapshot.bump()
+        typeahead_index.add_rows(applied_rows)
+    logger.info(f"Kit registration: {response['counts']}{' (replayed)' if replayed else ''}")
+    result = jsonify(response)
+    if replayed:
+        result.headers["Idempotent-Replayed"] = "true"
+    return result
+
+# %% Requests refused by the bounded database executor
+@server.errorhandler(DatabaseBusy)
+def database_busy(e):
+    response = jsonify({"error": str(e)})
+    response.status_code = 503
+    response.headers["Retry-After"] = "5"
+    return response
+
+# %% Health and readiness
+database_probe = DatabaseProbe(
+    {"dcp": dcp_sql_engine, "mercury_read": mercury_read_engine, "mercury_write": mercury_sql_engine},
+    max_overflow={"dcp": storage.read_max_overflow, "mercury_read": storage.read_max_overflow, "mercury_write": storage.write_max_overflow}
+)
+
+# Load reference data and caches before the first user does
+warmup = WarmUp([
+    ("reference_data", load_reference_data),
+    ("users", user_directory.refresh),
+    ("typeahead", typeahead_index.refresh),
+    ("tracking_snapshot", lambda: tracking_snapshot.read(copy=False)),
+])
+warmup.start()
+
+# Liveness: the process is up and serving, no database calls
+@server.route(f"{app.config.routes_pathname_prefix}healthz", methods=["GET"])
+def healthz():
+    return jsonify({"status": "ok", "version": version, "warmed_up": warmup.complete})
+
+# Readiness: databases reachable and warm-up done; pings are cached for a few seconds
+@server.route(f"{app.config.routes_pathname_prefix}readyz", methods=["GET"])
+def readyz():
+    databases = database_probe.check()
+    loaded_at = globals().get("reference_loaded_at")
+    ready = warmup.complete and all(db["ok"] for db in databases.values())
+    body = {
+        "status": "ready" if ready else "not ready",
+        "storage": storage.name,
+        "databases": databases,
+        "warm_up": {"complete": warmup.complete, "steps": warmup.status},
+        "caches": {
+            "reference_data_age_s": round(time.time() - loaded_at, 1) if loaded_at else None,
+            "tracking_snapshot": tracking_snapshot.status(),
+            "typeahead_age_s": round(time.monotonic() - typeahead_index.loaded_at, 1) if typeahead_index.loaded_at else None,
+        },
+        "coalesced_reads": shared_reads.stats,
+    }
+    response = jsonify(body)
+    response.status_code = 200 if ready else 503
+    response.cache_control.no_store = True
+    return response
+
+# %% Paginated read API (keyset on sampleid, conditional on ETag)
+@server.route(f"{app.config.routes_pathname_prefix}api/tracking", methods=["GET"])
+@offload
+def tracking_api():
+    try:
+        args = parse_page_args(request.args)
+        if args.pop("include_archive"):
+            if not tracking_archive.available():
+                raise TrackingQueryError("include_archive needs the archive tables (sql/pas_tracking_archive.sql).")
+            query, params = build_page_query(tracking_archive.source(include_archive=True), **args)
+            page, next_after = split_page(to_working_set(read_sql_shared(query, mercury_read_engine, params=params)), args["limit"])
+        else:
+            page, next_after = tracking_page(tracking_snapshot.read(copy=False), **args)
+    except TrackingQueryError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logging.error(f"Tracking API read failed: {e}")
+        return jsonify({"error": f"Read failed: {e}"}), 500
+
+    rows_json = page.to_json(orient="records", date_format="iso")
+    body = f'{{"rows":{rows_json},"count":{len(page)},"next_after":{json.dumps(next_after)}}}'
+    response = server.response_class(body, mimetype="application/json")
+    response.set_etag(hashlib.sha1(body.encode()).hexdigest())
+    response.cache_control.no_cache = True  # always revalidate, the ETag makes that a 304
+    return response.make_conditional(request)
+
+# %% Mark uploaded rows as clean: their current values become the new originals
+def mark_rows_clean(grid_rows):
+    clean = []
+    for row in grid_rows:
+        row = dict(row)
+        row["original_sampleid"] = row.get("sampleid")
+        row["original"] = {col: row.get(col) for col in EDITABLE_COLUMNS}
+        clean.append(row)
+    return clean
+
+# %% Columns whose value differs from the loaded one
+def changed_columns(row, siteid_map):
+    try:
+        current = normalize_row(row, siteid_map)
+        original = normalize_row(row.get("original") or {}, siteid_map)
+    except (ValueError, TypeError):
+        return list(EDITABLE_COLUMNS)
+    return [col for col in EDITABLE_COLUMNS if current[col] != original[col]]
+
+# %% Upload Data button: the browser sends only the changed rows
+app.clientside_callback(
+    ClientsideFunction(namespace="grid", function_name="collectUpload"),
+    Output("upload-request", "data"),
+    Input("btn-upload-data", "n_clicks"),
+    State("database-table", "rowData"),
+    prevent_initial_call=True
+)
+
 @app.callback(
-    Output("database-table",'rowData', allow_duplicate=True),
+    Output("database-table", "rowTransaction", allow_duplicate=True),
     Output("edit-confirmation", "children", allow_duplicate=True),
     Output("overwrite-confirm-modal", "is_open"),
     Output("duplicate-rows", "data"),
-    Input("btn-upload-data", "n_clicks"),
+    Output("write-committed", "data", allow_duplicate=True),
+    Input("upload-request", "data"),
     prevent_initial_call=True
 )
-def upload_data_to_database(n_clicks):
-    global database_df 
-
-    if n_clicks is None:
+@offload
+def upload_data_to_database(upload_request):
+    if not upload_request:
         raise dash.exceptions.PreventUpdate
+
+    # Rows that are new or differ from their loaded values (assets/dashAgGridFunctions.js)
+    dirty_rows = upload_request.get("rows") or []
+    clean_sampleids = set(upload_request.get("clean_sampleids") or [])
+
+    if not dirty_rows:
+        return dash.no_update, html.Div("No changes to upload.", style={"color": "orange"}), False, [], dash.no_update
     
-    siteid_map = {
-        f"{row.description} ({row.siteid})": row.siteid
-        for _, row in sites.query("projectid == 'MERCURY_PASSIVE'").iterrows()
-    }
+    siteid_map = get_siteid_map()
 
     # Prepare DataFrame for upload
-    df_to_upload = database_df.copy().drop(columns=["delete"], errors="ignore")
-
-    # Check if table is empty
-    if df_to_upload.empty:
-        return database_df.to_dict("records"),html.Div("No valid data to upload. All entries are missing kit and/or sampler IDs.", style={"color": "orange"}), False, []
+    df_to_upload = pd.DataFrame(dirty_rows).drop(columns=["delete", "original"], errors="ignore")
+    for col in EDITABLE_COLUMNS + ["sampleid", "original_sampleid"]:
+        if col not in df_to_upload.columns:
+            df_to_upload[col] = None
     
     # Validate Kit ID and Sampler ID formats
     kitid_mask = df_to_upload["kitid"].astype(str).str.match(r"^EC-\d{4}$")
@@ -693,10 +1029,11 @@ def upload_data_to_database(n_clicks):
         else:
             msg = f"Invalid Kit ID(s): {', '.join(invalid_kitids)} (expected format EC-XXXX)"
         return (
-            database_df.to_dict("records"),
+            dash.no_update,
             html.Div(msg,style={"color": "orange"}),
             False,
-            []
+            [],
+            dash.no_update
         )
     samplerid_mask = df_to_upload["samplerid"].astype(str).str.match(r"^ECCC\d{4}$")
     invalid_samplerids = df_to_upload.loc[~samplerid_mask, "samplerid"]
@@ -706,15 +1043,16 @@ def upload_data_to_database(n_clicks):
         else:
             msg = f"Invalid Sampler ID(s): {', '.join(invalid_samplerids)} (expected format ECCCXXXX)"
         return (
-                database_df.to_dict("records"),
+                dash.no_update,
                 html.Div(msg,style={"color": "orange"}),
                 False,
-                []
+                [],
+                dash.no_update
             )
 
 
-    # Find duplicates inside the table
-    duplicate_mask = df_to_upload["sampleid"].duplicated(keep=False)
+    # Find duplicates inside the table (changed rows against each other and against unchanged rows)
+    duplicate_mask = df_to_upload["sampleid"].duplicated(keep=False) | df_to_upload["sampleid"].isin(clean_sampleids)
     if duplicate_mask.any():
         duplicate_df = df_to_upload.loc[duplicate_mask].copy()
 
@@ -732,10 +1070,11 @@ def upload_data_to_database(n_clicks):
         )
 
         return (
-            database_df.to_dict("records"),
+            dash.no_update,
             html.Div(msg, style={"color": "red"}),
             False,
-            duplicate_df.to_dict("records"),
+            [],
+            dash.no_update
         )
 
     # Convert columns to datetime
@@ -754,72 +1093,82 @@ def upload_data_to_database(n_clicks):
         
     # Upload
     try:
-        existing_sampleids_df = pd.read_sql_query("SELECT sampleid FROM pas_tracking", mercury_sql_engine)
-        existing_sampleids = set(existing_sampleids_df['sampleid'].dropna().astype(str).tolist())
-        df_to_upload_sampleids = df_to_upload['sampleid'].astype(str)
         df_to_upload['siteid'] = df_to_upload['siteid'].map(siteid_map).fillna(df_to_upload['siteid']) # change column to only contain siteid
-        duplicate_mask = df_to_upload_sampleids.isin(existing_sampleids)
-        
-        # Check if sampleid was changed
-        id_changed = df_to_upload[
-            (df_to_upload["sampleid"] != df_to_upload["original_sampleid"]) &
-            (df_to_upload["original_sampleid"].notna()) &
-            (~duplicate_mask)
-        ]
+
+        # Only look up the sample IDs being written
+        existing_sampleids_df = pd.read_sql_query(
+            text_in("SELECT sampleid FROM pas_tracking WHERE sampleid IN :ids", "ids"),
+            mercury_sql_engine,
+            params={"ids": df_to_upload["sampleid"].dropna().astype(str).unique().tolist()}
+        )
+        existing_sampleids = set(existing_sampleids_df['sampleid'].dropna().astype(str).tolist())
+        is_new = df_to_upload["original_sampleid"].isna()
+        id_changed = df_to_upload["sampleid"] != df_to_upload["original_sampleid"]
+
+        # Archived samples cannot be overwritten from the Update screen
+        archived = tracking_archive.archived_sampleids(
+            df_to_upload.loc[is_new | id_changed, "sampleid"].dropna().astype(str).unique().tolist()
+        )
+        if archived:
+            return (
+                dash.no_update,
+                html.Div(f"Sample ID(s) already used by archived kits: {', '.join(sorted(archived))}", style={"color": "orange"}),
+                False,
+                [],
+                dash.no_update
+            )
+        # New rows, or edited rows renamed onto, a sample ID that is already in the database
+        duplicate_mask = df_to_upload['sampleid'].astype(str).isin(existing_sampleids) & (is_new | id_changed)
+
+        # Column-level diff for rows loaded from the database
+        updates = {}
+        for i in df_to_upload.index[~is_new & ~duplicate_mask]:
+            cols = changed_columns(dirty_rows[i], siteid_map)
+            if not cols:
+                continue
+            if df_to_upload.at[i, "sampleid"] != df_to_upload.at[i, "original_sampleid"]:
+                cols = cols + ["sampleid"]
+            updates.setdefault(tuple(cols), []).append(i)
+
         with mercury_sql_engine.begin() as conn:
             def nan_to_none(val):
                 return None if pd.isna(val) else val
 
-            # Update existing rows
+            # Update existing rows, one statement per set of changed columns
             updated_ids = []
-            for _, row in id_changed.iterrows():
+            for cols, idx in updates.items():
+                set_clause = ", ".join(f"{col} = :{col}" for col in cols)
                 conn.execute(
-                    text("""
-                        UPDATE pas_tracking
-                        SET
-                            sampleid = :new_sid,
-                            kitid = :kitid,
-                            samplerid = :samplerid,
-                            sample_start = :sample_start,
-                            sample_end = :sample_end,
-                            siteid = :siteid,
-                            shipped_location = :shipped_location,
-                            shipped_date = :shipped_date,
-                            return_date = :return_date,
-                            sample_type = :sample_type,
-                            note = :note
-                        WHERE sampleid = :old_sid
-                    """),
-                    {
-                        "old_sid": nan_to_none(row["original_sampleid"]),
-                        "new_sid": nan_to_none(row["sampleid"]),
-                        "kitid": nan_to_none(row["kitid"]),
-                        "samplerid": nan_to_none(row["samplerid"]),
-                        "sample_start": nan_to_none(row["sample_start"]),
-                        "sample_end": nan_to_none(row["sample_end"]),
-                        "siteid": nan_to_none(row["siteid"]),
-                        "shipped_location": nan_to_none(row["shipped_location"]),
-                        "shipped_date": nan_to_none(row["shipped_date"]),
-                        "return_date": nan_to_none(row["return_date"]),
-                        "sample_type": nan_to_none(row["sample_type"]),
-                        "note": nan_to_none(row["note"])
-                    }
+                    text(f"UPDATE pas_tracking SET {set_clause} WHERE sampleid = :old_sid"),
+                    [
+                        {"old_sid": df_to_upload.at[i, "original_sampleid"], **{col: nan_to_none(df_to_upload.at[i, col]) for col in cols}}
+                        for i in idx
+                    ]
                 )
-                updated_ids.append(row["sampleid"])
+                updated_ids += [f"{df_to_upload.at[i, 'sampleid']} ({', '.join(c for c in cols if c != 'sampleid')})" for i in idx]
 
             # Insert brand-new rows
-            new_rows = df_to_upload[df_to_upload["original_sampleid"].isna() & (~duplicate_mask)]
+            new_rows = df_to_upload[is_new & (~duplicate_mask)]
             new_ids = new_rows["sampleid"].tolist()
 
-            new_rows.drop(columns=["original_sampleid"]).to_sql(
+            new_rows.drop(columns=["original_sampleid", "rowid"], errors="ignore").to_sql(
                 "pas_tracking",
                 conn,
                 if_exists="append",
                 index=False
             )
 
-        # Update original_sampleid in the global dataframe for the rows that were changed
-        database_df["original_sampleid"] = database_df["sampleid"]
+        updated_idx = [i for idx in updates.values() for i in idx]
+        committed = tracking_snapshot.bump() if updated_idx or new_ids else dash.no_update
+        typeahead_index.update_rows(
+            (dirty_rows[i].get("original") or {}, {col: df_to_upload.at[i, col] for col in cols})
+            for cols, idx in updates.items() for i in idx
+        )
+        typeahead_index.add_rows(new_rows.to_dict("records"))
+
+        # Rows written (or found unchanged) are clean again
+        written = [dirty_rows[i] for i in df_to_upload.index[~duplicate_mask]]
+        row_transaction = {"update": mark_rows_clean(written), "async": False}
 
         # include timestamp in success message
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -834,79 +1183,85 @@ def upload_data_to_database(n_clicks):
         else:
             success_msg = ". ".join(messages) + f". Submitted at {timestamp}."
 
-        # Handle existing sampleid rows whose id did NOT change (i.e., duplicate overwriting)
+        # Handle new rows whose sampleid is already in the database (i.e., duplicate overwriting)
         if duplicate_mask.any():
             duplicate_df = df_to_upload[duplicate_mask].copy()
-            return database_df.to_dict("records"),success_msg, True, duplicate_df.to_dict("records")
+            return row_transaction, success_msg, True, {
+                "records": duplicate_df.drop(columns=["rowid"], errors="ignore").to_dict("records"),
+                "grid_rows": [dirty_rows[i] for i in df_to_upload.index[duplicate_mask]]
+            }, committed
 
-        return database_df.to_dict("records"),html.Div(success_msg, style={"color": "green"}), False, []
+        return row_transaction, html.Div(success_msg, style={"color": "green"}), False, [], committed
     except Exception as e:
         logging.error(f"Database upload error: {e}")
-        return database_df.to_dict("records"),html.Div(f"Error uploading data: {e}.", style={"color": "red"}), False, []
+        return dash.no_update, html.Div(f"Error uploading data: {e}.", style={"color": "red"}), False, [], dash.no_update
     
 # %% Update button callback
 @app.callback(
     Output("update-kitid-modal", "is_open", allow_duplicate=True),
-    Output("database-store", "data"),
     Output("db-loading-output", "children"),
     Input("btn-update", "n_clicks"),
     Input("update-done-button", "n_clicks"),
     State("update-kitid-modal", "is_open"),
-    State("database-store", "data"),
     prevent_initial_call=True
 )
-def toggle_update_modal(open_clicks, done_clicks, is_open, db_tracking_data):
+@offload
+def toggle_update_modal(open_clicks, done_clicks, is_open):
     triggered = ctx.triggered_id
 
     if triggered == "btn-update":
-        # Show loading while querying database
+        # The table stays on the server; warm the snapshot while the user types
         try:
-            db_df = pd.read_sql_query("SELECT * FROM pas_tracking", mercury_sql_engine)
-            for col in ["sample_start", "sample_end"]:
-                if col in db_df.columns:
-                    db_df[col] = pd.to_datetime(db_df[col], errors='coerce').dt.strftime("%Y-%m-%d %H:%M:%S")
-            db_df['delete'] = 'Delete' 
-            loading_msg = ""  # Hide loading spinner
+            tracking_snapshot.read(copy=False)
         except Exception as e:
             logging.error(f"Error loading pas_tracking table: {e}")
-            db_df = pd.DataFrame()
-            loading_msg = ""  # Hide loading even on error
-
-        return True, db_df.to_dict("records"), loading_msg
+        return True, ""
 
     elif triggered == "update-done-button":
-        return False, db_tracking_data, ""  # Closing modal, no DB call = no spinner
+        return False, ""
 
-    return is_open, db_tracking_data, ""
+    return is_open, ""
 
 # %% Confirm overwrite
 @app.callback(
     Output("overwrite-confirmation", "children",allow_duplicate=True),
     Output("overwrite-confirm-modal", "is_open",allow_duplicate=True),
+    Output("database-table", "rowTransaction", allow_duplicate=True),
+    Output("write-committed", "data", allow_duplicate=True),
     Input("confirm-overwrite", "n_clicks"),
     State("duplicate-rows", "data"),
     prevent_initial_call=True
 )
+@offload
 def confirm_overwrite(n_clicks, duplicates_data):
-    if not duplicates_data:
+    if not duplicates_data or not duplicates_data.get("records"):
         raise dash.exceptions.PreventUpdate
 
     try:
-        df_overwrite = pd.DataFrame(duplicates_data)
+        df_overwrite = pd.DataFrame(duplicates_data["records"])
         df_overwrite.replace('', np.nan, inplace=True)
 
         with mercury_sql_engine.begin() as conn:
             sampleids = df_overwrite['sampleid'].dropna().tolist()
-            for sid in sampleids:
-                conn.execute(text("DELETE FROM pas_tracking WHERE sampleid = :sid"), {"sid": sid})
-
-        df_overwrite.drop(columns=['original_sampleid']).to_sql('pas_tracking', mercury_sql_engine, if_exists='append', index=False)
+            replaced = conn.execute(
+                text_in("DELETE FROM pas_tracking WHERE sampleid IN :ids RETURNING *", "ids"), {"ids": sampleids}
+            ).mappings().all()
+            df_overwrite.drop(columns=['original_sampleid']).to_sql('pas_tracking', conn, if_exists='append', index=False)
+
+        committed = tracking_snapshot.bump()
+        typeahead_index.remove_rows(replaced)
+        typeahead_index.add_rows(df_overwrite.to_dict("records"))
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        return html.Div(f"Successfully overwrote {len(df_overwrite)} entries. Submitted at {timestamp}.", style={"color": "green"}), False
+        return (
+            html.Div(f"Successfully overwrote {len(df_overwrite)} entries. Submitted at {timestamp}.", style={"color": "green"}),
+            False,
+            {"update": mark_rows_clean(duplicates_data.get("grid_rows") or []), "async": False},
+            committed
+        )
 
     except Exception as e:
         logging.error(f"Overwrite failed: {e}")
-        return html.Div(f"Error overwriting: {e}", style={"color": "red"}), False
+        return html.Div(f"Error overwriting: {e}", style={"color": "red"}), False, dash.no_update, dash.no_update
 
 # %% Cancel overwrite
 @app.callback(
@@ -923,74 +1278,86 @@ def cancel_overwrite(n):
     Output("update-kitid-feedback", "style"),
     Output("update-kitid-modal", "is_open", allow_duplicate=True),
     Output("database-table", "rowData", allow_duplicate=True),
-    Output("kitid-filtered-data", "data"),
     Output("btn-upload-data", "style", allow_duplicate=True),
     Input("update-done-button", "n_clicks"),
     State("update-kitid-textinput", "value"),
     State("update-kitid-dropdown", "value"),
-    State("database-store", "data"),
     State("update-search-mode", "value"),
     prevent_initial_call=True
 )
-def validate_and_display_kitid(n_clicks, text_value, dropdown_value, db_tracking_data, search_mode):
-    entered_id = dropdown_value if search_mode == "location" else text_value
-    
-    db_tracking_data = pd.DataFrame(db_tracking_data)
-    
+@offload
+def validate_and_display_kitid(n_clicks, text_value, dropdown_value, search_mode):
+    entered_id = (dropdown_value if search_mode == "location" else text_value) or ""
+
+    # Kit and location searches filter the typed snapshot held on the server
+    if search_mode in ("kit", "location"):
+        try:
+            db_tracking_data = tracking_snapshot.read(copy=False)
+        except Exception as e:
+            logging.error(f"Error loading pas_tracking table: {e}")
+            return f"Error loading database: {e}", {"color": "red"}, True, dash.no_update, dash.no_update
+
     # Kit ID search logic
     if search_mode == "kit":
         if not re.fullmatch(r"EC-\d{4}", entered_id.strip()):
-            return "Invalid Kit ID", {"color": "red"}, True, dash.no_update, dash.no_update, dash.no_update
-        filtered_df = db_tracking_data[db_tracking_data['kitid'] == entered_id]
+            return "Invalid Kit ID", {"color": "red"}, True, dash.no_update, dash.no_update
+        filtered_df = db_tracking_data[db_tracking_data['kitid'] == entered_id.strip()]
     #Location search logic
     elif search_mode == "location":
         if not entered_id.strip():
-            return "Shipped Location cannot be empty.", {"color": "red"}, True, dash.no_update, dash.no_update, dash.no_update
-    
-        matches = db_tracking_data[
-            db_tracking_data["shipped_location"].str.strip().str.lower() == entered_id.strip().lower()
-        ].copy()
-    
+            return "Shipped Location cannot be empty.", {"color": "red"}, True, dash.no_update, dash.no_update
+
+        # compare against the distinct locations, not every row
+        locations = db_tracking_data["shipped_location"].astype("category").cat.categories
+        wanted = locations[locations.str.strip().str.lower() == entered_id.strip().lower()]
+        matches = db_tracking_data[db_tracking_data["shipped_location"].isin(wanted)]
+
         if matches.empty:
-            return f"No entries found for shipped location '{entered_id}'.", {"color": "orange"}, True, dash.no_update, dash.no_update, dash.no_update
-    
+            return f"No entries found for shipped location '{entered_id}'.", {"color": "orange"}, True, dash.no_update, dash.no_update
+
         filtered_df = matches
     # Sampler ID search logic 
     else:
         if not re.fullmatch(r"ECCC\d{4}", entered_id.strip()):
-            return "Invalid Sampler ID", {"color": "red"}, True, dash.no_update, dash.no_update, dash.no_update
+            return "Invalid Sampler ID", {"color": "red"}, True, dash.no_update, dash.no_update
     
-        matches = db_tracking_data[db_tracking_data['samplerid'] == entered_id].copy()
-    
-        if matches.empty:
-            return "No entries found for this Sampler ID.", {"color": "orange"}, True, dash.no_update, dash.no_update, dash.no_update
-        
-        recent_kitid = matches["kitid"].dropna()
-        filtered_df = db_tracking_data[(db_tracking_data["kitid"].isin(recent_kitid)) & (db_tracking_data["return_date"].isna())]
+        # Resolve the sampler's current kit in the database (one indexed round trip)
+        try:
+            filtered_df = read_sql_shared(
+                CURRENT_KIT_FOR_SAMPLER_QUERY,
+                mercury_read_engine,
+                params={"samplerid": entered_id.strip()}
+            )
+        except Exception as e:
+            logging.error(f"Error resolving current kit for sampler {entered_id}: {e}")
+            return f"Error searching for Sampler ID: {e}", {"color": "red"}, True, dash.no_update, dash.no_update
 
-        # if there are no entries with an empty return date, show all matches and their respective kits
         if filtered_df.empty:
-            matches_all = db_tracking_data[db_tracking_data["kitid"].isin(matches["kitid"])].copy()
-            filtered_df = matches_all
+            return "No entries found for this Sampler ID.", {"color": "orange"}, True, dash.no_update, dash.no_update
+
+        filtered_df = to_working_set(filtered_df)
 
     if filtered_df.empty:
-        return "No entries found.", {"color": "orange"}, True, dash.no_update, dash.no_update, dash.no_update
-    
-    # Update global dataframe
-    filtered_df["sample_start"] = filtered_df["sample_start"].str.slice(stop=16)
-    filtered_df["sample_end"] = filtered_df["sample_end"].str.slice(stop=16)
-    filtered_df["siteid"] = filtered_df["siteid"].apply(
-        lambda x: next(
-            (s for s in sites_clean if isinstance(x, str) and x.strip() and x in s),
-            x
-        )
-    )
-    global database_df
-    filtered_df["original_sampleid"] = filtered_df["sampleid"]
-    filtered_df["delete"] = "Delete"
-    database_df = filtered_df
+        return "No entries found.", {"color": "orange"}, True, dash.no_update, dash.no_update
+
+    # Show sites as their grid labels ("Description (SITEID)"), mapped once per distinct siteid
+    ensure_reference_data()
+    site_labels = {
+        siteid: next((s for s in sites_clean if siteid.strip() and siteid in s), siteid)
+        for siteid in filtered_df["siteid"].dropna().unique()
+    }
+
+    # One conversion from the typed frame to grid rows
+    records = to_grid_records(filtered_df[list(TRACKING_SCHEMA)])
+    for record in records:
+        if record["siteid"] is not None:
+            record["siteid"] = site_labels.get(record["siteid"], record["siteid"])
+        record["original_sampleid"] = record["sampleid"]
+        record["original"] = {col: record[col] for col in EDITABLE_COLUMNS}
+        record["delete"] = "Delete"
+        record["rowid"] = uuid.uuid4().hex
 
-    return "", {}, False, database_df.to_dict("records"), filtered_df.to_dict("records"),{"display": "block", "margin-top": "20px"}
+    return "", {}, False, records, {"display": "block", "margin-top": "20px"}
 
 
 
@@ -1000,18 +1367,20 @@ def validate_and_display_kitid(n_clicks, text_value, dropdown_value, db_tracking
     Output("update-kitid-dropdown", "style"),
     Output("update-kitid-textinput", "placeholder"),
     Output("update-kitid-dropdown", "options"),
-    Input("update-search-mode", "value"),
-    State("database-store", "data")
+    Input("update-search-mode", "value")
 )
-def toggle_update_input(search_mode, db_data):
+def toggle_update_input(search_mode):
     show_text = {'width': '150px', 'margin': '0 auto', 'display': 'block'}
     hide_text = {'width': '150px', 'margin': '0 auto', 'display': 'none'}
     show_dropdown = {'width': '250px', 'margin': '0 auto', 'display': 'block'}
     hide_dropdown = {'width': '250px', 'margin': '0 auto', 'display': 'none'}
 
     if search_mode == "location":
-        db_df = pd.DataFrame(db_data)
-        locations = sorted(db_df["shipped_location"].dropna().unique().tolist())
+        try:
+            locations = typeahead_index.values("shipped_location")
+        except Exception as e:
+            logging.error(f"Error loading shipped locations: {e}")
+            locations = []
         return hide_text, show_dropdown, dash.no_update, [{"label": loc, "value": loc} for loc in locations]
 
     elif search_mode == "sampler":
@@ -1020,53 +1389,189 @@ def toggle_update_input(search_mode, db_data):
     # default to Kit ID
     return show_text, hide_dropdown, "EC-XXXX", []
 
-# %% Callback to trigger download of most recent database contents
+# %% Kit ID / Sampler ID suggestions for the update modal
 @app.callback(
-    Output("download-db-csv", "data"),
+    Output("update-id-suggestions", "children"),
+    Input("update-kitid-textinput", "value"),
+    State("update-search-mode", "value"),
+    prevent_initial_call=True
+)
+def suggest_update_ids(text_value, search_mode):
+    if search_mode not in ("kit", "sampler") or not text_value:
+        return []
+    field = "kitid" if search_mode == "kit" else "samplerid"
+    try:
+        matches = typeahead_index.search(field, text_value)
+    except Exception as e:
+        logging.error(f"Error searching {field} suggestions: {e}")
+        return []
+    return [html.Option(value=v) for v in matches]
+
+# %% Typeahead endpoint for shipped locations, kit IDs and sampler IDs
+@server.route(f"{app.config.routes_pathname_prefix}api/typeahead/<field>")
+def typeahead(field):
+    if field not in TYPEAHEAD_FIELDS:
+        abort(404)
+    prefix = request.args.get("q", "")
+    limit = min(request.args.get("limit", 20, type=int), 200)
+    try:
+        matches = typeahead_index.search(field, prefix, limit=limit)
+    except Exception as e:
+        logging.error(f"Typeahead lookup failed for {field}: {e}")
+        abort(503)
+    return jsonify({"field": field, "q": prefix, "values": matches})
+
+# %% Export modal
+@app.callback(
+    Output("export-modal", "is_open"),
+    Output("export-sites", "options"),
+    Output("export-locations", "options"),
     Input("btn-download-db", "n_clicks"),
+    Input("btn-export-close", "n_clicks"),
+    prevent_initial_call=True
+)
+def toggle_export_modal(open_clicks, close_clicks):
+    if ctx.triggered_id == "btn-download-db":
+        site_options = [{"label": label, "value": siteid} for label, siteid in get_siteid_map().items()]
+        return True, site_options, typeahead_index.values("shipped_location")
+    return False, dash.no_update, dash.no_update
+
+# %% Callback to download the filtered export
+@app.callback(
+    Output("download-db-csv", "data"),
+    Output("export-feedback", "children"),
+    Input("btn-export-download", "n_clicks"),
+    State("export-date-range", "start_date"),
+    State("export-date-range", "end_date"),
+    State("export-sites", "value"),
+    State("export-kitids", "value"),
+    State("export-locations", "value"),
+    State("export-columns", "value"),
+    State("export-format", "value"),
+    State("export-include-archive", "value"),
     prevent_initial_call=True
 )
-def download_db_csv(n_clicks):
+@offload
+def download_db_export(n_clicks, start_date, end_date, siteids, kitids_text, locations, columns, fmt, include_archive):
+    kitids = [k.strip() for k in (kitids_text or "").split(",") if k.strip()]
+    filters = dict(start_date=start_date, end_date=end_date, siteids=siteids, kitids=kitids, locations=locations)
     try:
-        db_df = pd.read_sql_query("SELECT * FROM pas_tracking", mercury_sql_engine)
-        for col in ["sample_start", "sample_end"]:
-            if col in db_df.columns:
-                db_df[col] = pd.to_datetime(db_df[col], errors='coerce').dt.strftime("%Y-%m-%d %H:%M:%S")
+        columns = [c for c in EXPORT_COLUMNS if c in (columns or [])]
+        if not columns:
+            return dash.no_update, html.Div("Select at least one column to export.", style={"color": "red"})
+
+        source = tracking_archive.source(include_archive=bool(include_archive))
+        if is_unfiltered(**filters) and source == "pas_tracking":
+            # Whole hot table: the shared snapshot already holds it
+            db_df = tracking_snapshot.read()[columns]
+        else:
+            query, params = build_export_query(columns, **filters, source=source)
+            db_df = read_sql_shared(query, mercury_read_engine, params=params)
+
+        data = write_export(db_df, fmt)
         now_str = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        filename = f"pas_tracking_{now_str}.csv"
+        filename = f"pas_tracking_{now_str}{EXPORT_FORMATS[fmt][1]}"
+        logger.info(f"Exported {len(db_df)} rows x {len(columns)} columns as {fmt} ({len(data)} bytes)")
+        return (
+            dcc.send_bytes(lambda buf: buf.write(data), filename=filename),
+            html.Div(f"Exported {len(db_df)} rows.", style={"color": "green"})
+        )
+    except Exception as e:
+        logging.error(f"Error exporting pas_tracking: {e}")
+        return dash.no_update, html.Div(f"Error exporting data: {e}", style={"color": "red"})
+
+# %% Kit status summary panel
+def summary_table(df, columns):
+    if df.empty:
+        return html.P("None.", className="text-muted")
+    return dbc.Table.from_dataframe(
+        df[list(columns)].rename(columns=columns),
+        striped=True, bordered=True, hover=True, size="sm", color="dark"
+    )
 
-        csv_str = db_df.to_csv(index=False)
-        csv_bytes = csv_str.encode("utf-8-sig")
-        return dcc.send_bytes(lambda buf: buf.write(csv_bytes), filename=filename)
+@app.callback(
+    Output("kit-summary", "children"),
+    Input("kit-summary-interval", "n_intervals"),
+    Input("write-committed", "data")
+)
+@offload
+def render_kit_summary(n_intervals, committed):
+    try:
+        summary = kit_summary.get()
     except Exception as e:
-        logging.error(f"Error exporting pas_tracking to CSV: {e}")
-        return dash.no_update
+        logging.error(f"Error computing kit summary: {e}")
+        return html.Div(f"Kit summary unavailable: {e}", style={"color": "red"})
+
+    site_labels = {siteid: label for label, siteid in get_siteid_map().items()}
+    sites = summary["sites"].copy()
+    sites["siteid"] = sites["siteid"].map(lambda s: site_labels.get(s, s))
+    open_kits = summary["open_kits"]
+    overdue_kits = summary["overdue_kits"]
+
+    kit_columns = {
+        "kitid": "Kit ID", "shipped_location": "Shipped Location", "shipped_date": "Shipped Date",
+        "samplers": "Samplers", "samplerids": "Sampler IDs"
+    }
+    return [
+        html.P(
+            f"{len(open_kits)} kit(s) not yet returned, {len(overdue_kits)} shipped more than "
+            f"{kit_summary.overdue_days} days ago. Updated {summary['computed_at']:%Y-%m-%d %H:%M:%S}.",
+            className="mb-3"
+        ),
+        dbc.Tabs([
+            dbc.Tab(summary_table(overdue_kits, kit_columns), label=f"Overdue kits ({len(overdue_kits)})"),
+            dbc.Tab(summary_table(open_kits, kit_columns), label=f"Open kits ({len(open_kits)})"),
+            dbc.Tab(summary_table(sites, {
+                "siteid": "Site", "samples": "Samples", "samples_this_quarter": "This Quarter",
+                "kits": "Kits", "open_kits": "Open Kits"
+            }), label="By site"),
+        ])
+    ]
 
 # %% Delete row callbacks
+app.clientside_callback(
+    """
+    function(selectedRows) {
+        return !(selectedRows && selectedRows.length);
+    }
+    """,
+    Output("btn-delete-selected", "disabled"),
+    Input("database-table", "selectedRows")
+)
+
 @app.callback(
     Output("delete-confirm-modal", "is_open"),
-    Output("row-pending-delete", "data"),
+    Output("rows-pending-delete", "data"),
+    Output("delete-confirm-text", "children"),
     Input("database-table", "cellClicked"),
+    Input("btn-delete-selected", "n_clicks"),
+    State("database-table", "selectedRows"),
     State("database-table", "rowData"),
     prevent_initial_call=True
 )
-def open_delete_confirm(cell, rows):
-    if not cell:
-        raise dash.exceptions.PreventUpdate
-
-    # Only react to delete column
-    if cell.get("colId") != "delete":
-        raise dash.exceptions.PreventUpdate
+def open_delete_confirm(cell, n_clicks, selected_rows, rows):
+    if ctx.triggered_id == "btn-delete-selected":
+        pending = selected_rows or []
+    else:
+        # Only react to delete column
+        if not cell or cell.get("colId") != "delete":
+            raise dash.exceptions.PreventUpdate
 
-    row_index = cell.get("rowIndex")
+        row_id = cell.get("rowId")
+        row_index = cell.get("rowIndex")
+        pending = [r for r in rows if row_id is not None and r.get("rowid") == row_id]
+        if not pending and row_index is not None and row_index < len(rows):
+            pending = [rows[row_index]]
 
-    if row_index is None or row_index >= len(rows):
+    if not pending:
         raise dash.exceptions.PreventUpdate
 
-    return True, {
-        "rowIndex": row_index,
-        "rowData": rows[row_index]
-    }
+    if len(pending) == 1:
+        msg = "Are you sure you want to delete this entry from the database? This cannot be undone."
+    else:
+        msg = f"Are you sure you want to delete these {len(pending)} entries from the database? This cannot be undone."
+
+    return True, pending, msg
 
 # %% Cancel delete callback
 @app.callback(
@@ -1079,61 +1584,70 @@ def cancel_delete(n):
 
 # %% Confirm delete callback
 @app.callback(
-    Output("database-table", "rowData", allow_duplicate=True),
+    Output("database-table", "rowTransaction"),
     Output("delete-confirm-modal", "is_open",allow_duplicate=True),
     Output("edit-confirmation", "children"),
     Output("overwrite-confirmation", "children", allow_duplicate=True),
+    Output("write-committed", "data", allow_duplicate=True),
     Input("confirm-delete-btn", "n_clicks"),
-    State("row-pending-delete", "data"),
-    State("database-table", "rowData"),
+    State("rows-pending-delete", "data"),
     prevent_initial_call=True
 )
-def confirm_delete(n_clicks, pending, current_rows):
-    global database_df
-
+@offload
+def confirm_delete(n_clicks, pending):
     if not pending:
         raise dash.exceptions.PreventUpdate
 
-    row_index = pending["rowIndex"]
-    row = pending["rowData"]
-    sampleid = row.get("sampleid")
+    # Only rows loaded from (or already uploaded to) the database have an original_sampleid
+    persisted_ids = sorted({r["original_sampleid"] for r in pending if r.get("original_sampleid")})
 
-    # Delete from database (only if persisted)
-    if sampleid:
+    # Delete every selected row in one statement
+    deleted = []
+    committed = dash.no_update
+    if persisted_ids:
         try:
             with mercury_sql_engine.begin() as conn:
-                conn.execute(
-                    text("DELETE FROM pas_tracking WHERE sampleid = :sid"),
-                    {"sid": sampleid}
+                result = conn.execute(
+                    text_in("DELETE FROM pas_tracking WHERE sampleid IN :ids RETURNING *", "ids"),
+                    {"ids": persisted_ids}
                 )
+                deleted = [dict(r) for r in result.mappings()]
+            if deleted:
+                committed = tracking_snapshot.bump()
+            typeahead_index.remove_rows(deleted)
         except Exception as e:
+            logging.error(f"Delete failed: {e}")
             return (
                 dash.no_update,
                 False,
                 html.Div(f"Delete failed: {e}", style={"color": "red"}),
-                []
+                [],
+                dash.no_update
             )
 
-    # Remove from dataframe
-    database_df = database_df[
-        database_df["sampleid"] != sampleid
-    ]
+    messages = []
+    if deleted:
+        messages.append(f"Deleted {len(deleted)} sample(s) from the database: {', '.join(r['sampleid'] for r in deleted)}.")
+    unsaved = len(pending) - len(persisted_ids)
+    if unsaved:
+        messages.append(f"Removed {unsaved} unsaved row(s) from the table.")
 
     # Remove from grid
-    new_rows = [
-        r for i, r in enumerate(current_rows) if i != row_index
-    ]
-
     return (
-        new_rows,
+        {"remove": pending, "async": False},
         False,
-        html.Div(f"Deleted sample {sampleid} from the database.", style={"color": "orange"}),
-        []
+        html.Div(" ".join(messages), style={"color": "orange"}),
+        [],
+        committed
     )
 
 
 # Run the app
 app.layout = serve_layout
+
+# Per-action callback chains in logs/callback_traces.jsonl (only when CALLBACK_TRACE=1),
+# registered last so the whole callback graph is known
+configure_callback_trace(app, 'logs')
 if __name__ == "__main__":
     if host == "local":
         app.run(debug=True,port=8080)
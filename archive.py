@@ -0,0 +1,166 @@
+# archival of returned kits from pas_tracking into pas_tracking_archive
+#
+# pas_tracking is the hot table every screen and snapshot reads. Shipments whose
+# samplers have all come back more than ARCHIVE_AFTER_DAYS ago are moved, a whole
+# (kitid, shipped_date) shipment at a time, into pas_tracking_archive, which is
+# partitioned by year of return_date (sql/pas_tracking_archive.sql). Reads that
+# need history opt in to the pas_tracking_all view.
+#
+# Run from the app directory (same .env as the app), e.g. nightly from cron:
+#   python archive.py --older-than-days 365 [--dry-run]
+
+import argparse
+import logging
+import os
+import threading
+import time
+from datetime import date, timedelta
+import pandas as pd
+from sqlalchemy import create_engine, text
+from storage import backend_for
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", 365))
+HOT_TABLE = "pas_tracking"
+ALL_VIEW = "pas_tracking_all"
+
+# Shipments that are fully returned and older than the cutoff
+_DONE_SHIPMENTS = """
+    SELECT kitid, shipped_date
+    FROM pas_tracking
+    WHERE kitid IS NOT NULL
+    GROUP BY kitid, shipped_date
+    HAVING COUNT(*) = COUNT(return_date) AND MAX(return_date) < :cutoff
+"""
+
+CANDIDATES_QUERY = text(f"""
+    WITH done AS ({_DONE_SHIPMENTS})
+    SELECT CAST(EXTRACT(YEAR FROM t.return_date) AS integer) AS year,
+           COUNT(DISTINCT t.kitid) AS kits,
+           COUNT(*) AS samples
+    FROM pas_tracking t
+    JOIN done ON t.kitid = done.kitid AND t.shipped_date IS NOT DISTINCT FROM done.shipped_date
+    GROUP BY 1
+    ORDER BY 1
+""")
+
+# One statement, so a shipment is either still hot or already archived, never both
+ARCHIVE_QUERY = text(f"""
+    WITH done AS ({_DONE_SHIPMENTS}),
+    moved AS (
+        DELETE FROM pas_tracking t
+        USING done
+        WHERE t.kitid = done.kitid AND t.shipped_date IS NOT DISTINCT FROM done.shipped_date
+        RETURNING t.*
+    )
+    INSERT INTO pas_tracking_archive SELECT * FROM moved
+""")
+
+ARCHIVE_TABLE = "pas_tracking_archive"
+ARCHIVED_IDS_QUERY = text("SELECT sampleid FROM pas_tracking_archive WHERE sampleid = ANY(:ids)")
+
+def ensure_partition(conn, year):
+    year = int(year)
+    conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS pas_tracking_archive_{year} PARTITION OF pas_tracking_archive "
+        f"FOR VALUES FROM ('{year}-01-01') TO ('{year + 1}-01-01')"
+    ))
+
+# Sample IDs among ids that are already archived, on an open connection. Used by
+# every write path (offline_sync.apply_sync_ops); empty when the archive tables
+# are not installed or the backend has none (storage.py).
+def archived_sampleids(conn, ids):
+    if not ids or not backend_for(conn).has_archive:
+        return set()
+    if not conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": ARCHIVE_TABLE}).scalar():
+        return set()
+    return {r[0] for r in conn.execute(ARCHIVED_IDS_QUERY, {"ids": sorted(ids)})}
+
+# Per-year counts of what archive_returned_kits would move
+def archive_candidates(conn, older_than_days=ARCHIVE_AFTER_DAYS):
+    cutoff = date.today() - timedelta(days=older_than_days)
+    return pd.read_sql_query(CANDIDATES_QUERY, conn, params={"cutoff": cutoff})
+
+# Move fully returned shipments older than the cutoff, returns the number of rows moved
+def archive_returned_kits(conn, older_than_days=ARCHIVE_AFTER_DAYS):
+    cutoff = date.today() - timedelta(days=older_than_days)
+    candidates = archive_candidates(conn, older_than_days)
+    if candidates.empty:
+        return 0
+    for year in candidates["year"]:
+        ensure_partition(conn, year)
+    return conn.execute(ARCHIVE_QUERY, {"cutoff": cutoff}).rowcount
+
+# Whether the archive tables exist in this database (checked at most every ttl seconds)
+class ArchiveCatalog:
+    def __init__(self, engine, ttl=300):
+        self.engine = engine
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._available = None
+        self._checked_at = 0.0
+
+    def available(self):
+        with self._lock:
+            if not backend_for(self.engine).has_archive:
+                return False
+            if self._available is None or time.monotonic() - self._checked_at > self.ttl:
+                try:
+                    with self.engine.connect() as conn:
+                        self._available = conn.execute(
+                            text("SELECT to_regclass(:name) IS NOT NULL"), {"name": ALL_VIEW}
+                        ).scalar()
+                except Exception as e:
+                    logger.warning(f"Could not check for {ALL_VIEW}: {e}")
+                    self._available = False
+                self._checked_at = time.monotonic()
+            return bool(self._available)
+
+    # Table or view to read from; hot rows only unless the archive is asked for
+    def source(self, include_archive=False):
+        return ALL_VIEW if include_archive and self.available() else HOT_TABLE
+
+    # Sample IDs among ids that have already been archived
+    def archived_sampleids(self, ids):
+        if not ids or not self.available():
+            return set()
+        df = pd.read_sql_query(ARCHIVED_IDS_QUERY, self.engine, params={"ids": list(ids)})
+        return set(df["sampleid"].dropna().astype(str))
+
+def main():
+    from credentials import get_credentials
+    from snapshot_cache import TableSnapshot
+
+    parser = argparse.ArgumentParser(description="Move fully returned kits from pas_tracking to pas_tracking_archive.")
+    parser.add_argument("--older-than-days", type=int, default=ARCHIVE_AFTER_DAYS,
+                        help=f"archive shipments whose last sampler came back more than this many days ago (default {ARCHIVE_AFTER_DAYS})")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be moved")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    parent_dir = os.getcwd()
+    _, server, _, _, editor_user, editor_password, _, _ = get_credentials(parent_dir)
+    engine = create_engine(
+        f"postgresql://{editor_user}:{editor_password}@{server}/mercury_passive?sslmode=require",
+        pool_pre_ping=True
+    )
+
+    with engine.begin() as conn:
+        candidates = archive_candidates(conn, args.older_than_days)
+        if candidates.empty:
+            logger.info("Nothing to archive")
+            return
+        for row in candidates.itertuples():
+            logger.info(f"{row.year}: {row.kits} kits, {row.samples} samples")
+        if args.dry_run:
+            return
+        moved = archive_returned_kits(conn, args.older_than_days)
+    logger.info(f"Archived {moved} samples")
+
+    # Every worker reloads its pas_tracking snapshot on the next read
+    if moved:
+        TableSnapshot(None, None, os.path.join(parent_dir, 'cache'), 'pas_tracking').bump()
+
+if __name__ == "__main__":
+    main()
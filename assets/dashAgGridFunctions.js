@@ -94,6 +94,27 @@ window.dashAgGridFunctions.DateTimePicker = class {
   }
 };
 
+// Options loaded from the server (cellEditorParams.optionsUrl), fetched once per page
+// and shared by every editor; a failed fetch is retried on the next edit
+const editorOptionRequests = {};
+function loadEditorOptions(url) {
+  if (!editorOptionRequests[url]) {
+    const config = document.getElementById("_dash-config");
+    const prefix = config ? JSON.parse(config.textContent).requests_pathname_prefix : "/";
+    editorOptionRequests[url] = fetch(prefix + url)
+      .then(response => {
+        if (!response.ok) throw new Error(`${url}: ${response.status}`);
+        return response.json();
+      })
+      .then(body => body.values || [])
+      .catch(e => {
+        delete editorOptionRequests[url];
+        throw e;
+      });
+  }
+  return editorOptionRequests[url];
+}
+
 // Searchable dropdown editor
 window.dashAgGridFunctions.SearchableDropdownEditor = class {
 	init(params) {
@@ -102,8 +123,19 @@ window.dashAgGridFunctions.SearchableDropdownEditor = class {
 		this.eInput.className = "ag-input";
 		this.eInput.value = params.value || "";
 
-		// Ensure options exist
-		this.options = params.colDef.cellEditorParams?.values || [];
+		// Options given inline, or loaded asynchronously from optionsUrl
+		const editorParams = params.colDef.cellEditorParams || {};
+		this.options = editorParams.values || [];
+		this.optionsLoaded = Boolean(editorParams.values) || !editorParams.optionsUrl;
+		if (!this.optionsLoaded) {
+			loadEditorOptions(editorParams.optionsUrl)
+				.then(values => {
+					this.options = values;
+					this.optionsLoaded = true;
+					if (this.dropdown.style.display !== "none") this.updateDropdown();
+				})
+				.catch(e => console.warn("Could not load editor options", e));
+		}
 
 		// Create the dropdown safely
 		this.dropdown = document.createElement("div");
@@ -153,6 +185,7 @@ window.dashAgGridFunctions.SearchableDropdownEditor = class {
 
   getValue() {
     const value = this.eInput.value;
+    if (!this.optionsLoaded) return this.params.value;  // nothing to check against yet, keep the cell as it was
     const isValid = this.options.includes(value);
     return isValid ? value : null;  // or return "" or throw error
   }
@@ -202,7 +235,7 @@ window.dashAgGridFunctions.SearchableDropdownEditor = class {
 
     if (filtered.length === 0) {
       const empty = document.createElement("div");
-      empty.textContent = "No matches";
+      empty.textContent = this.optionsLoaded ? "No matches" : "Loading sites...";
       empty.style.padding = "4px";
       empty.style.color = "#999";
       this.dropdown.appendChild(empty);
@@ -234,4 +267,176 @@ window.dashAgGridFunctions.SearchableDropdownEditor = class {
       }
     }
   }
-};
\ No newline at end of file
+};
+
+// Grid edit validation: runs in the browser so editing needs no server round trip
+const SAMPLE_DATETIME_REGEX = /^\d{4}-\d{2}-\d{2} \d{2}:\d{2}$/;
+
+function editFeedbackDiv(message, color) {
+  return {
+    namespace: "dash_html_components",
+    type: "Div",
+    props: { children: message, style: { color: color } },
+  };
+}
+
+// Cells rejected by a valueSetter. A paste or fill rejects many cells in one go;
+// they are reported together once the batch is done, not one message per cell.
+const rejectedEdits = { cells: [], at: 0, timer: null };
+const REJECTED_EDITS_MAX_AGE = 1000;  // ms; older rejections belong to an earlier edit
+
+function rejectedEditsMessage() {
+  const rowsByHeader = {};
+  rejectedEdits.cells.forEach(({ header, row }) => {
+    (rowsByHeader[header] = rowsByHeader[header] || []).push(row);
+  });
+  const parts = Object.entries(rowsByHeader).map(([header, rows]) =>
+    `${header} at Row${rows.length > 1 ? "s" : ""} ${rows.sort((a, b) => a - b).join(", ")}`
+  );
+  return `Invalid datetime format for ${parts.join("; ")}. Expected format: YYYY-MM-DD HH:MM.`;
+}
+
+function takeRejectedEdits() {
+  const fresh = rejectedEdits.cells.length && Date.now() - rejectedEdits.at < REJECTED_EDITS_MAX_AGE;
+  const message = fresh ? rejectedEditsMessage() : null;
+  rejectedEdits.cells = [];
+  return message;
+}
+
+function rejectEdit(header, row) {
+  if (Date.now() - rejectedEdits.at >= REJECTED_EDITS_MAX_AGE) rejectedEdits.cells = [];
+  rejectedEdits.cells.push({ header, row });
+  rejectedEdits.at = Date.now();
+  // Shown on its own if no accepted change follows (editFeedback reports both otherwise)
+  if (!rejectedEdits.timer) {
+    rejectedEdits.timer = setTimeout(() => {
+      rejectedEdits.timer = null;
+      if (rejectedEdits.cells.length) {
+        window.dash_clientside.set_props("edit-confirmation", { children: editFeedbackDiv(rejectedEditsMessage(), "red") });
+      }
+    }, 0);
+  }
+}
+
+// sample_start / sample_end: reject anything that is not YYYY-MM-DD HH:MM
+window.dashAgGridFunctions.setSampleDatetime = function (params) {
+  const field = params.colDef.field;
+  const value = params.newValue == null ? "" : String(params.newValue).trim();
+  if (value && !SAMPLE_DATETIME_REGEX.test(value)) {
+    rejectEdit(params.colDef.headerName || field, params.node.rowIndex + 1);
+    return false;
+  }
+  params.data[field] = value;
+  return true;
+};
+
+// kitid / samplerid: keep sampleid in step
+window.dashAgGridFunctions.setSampleIdPart = function (params) {
+  params.data[params.colDef.field] = params.newValue;
+  const kitid = params.data.kitid == null ? "" : params.data.kitid;
+  const samplerid = params.data.samplerid == null ? "" : params.data.samplerid;
+  params.data.sampleid = `${kitid}_${samplerid}`;
+  return true;
+};
+
+// Single edits are described cell by cell; larger batches (paste, fill handle)
+// get one summary per column so a 200-cell paste is one short message
+const EDIT_DETAIL_LIMIT = 3;
+
+function describeEdit(event, header) {
+  const row = event.rowIndex + 1;
+  let message = (event.value === "" || event.value == null) && ["sample_start", "sample_end"].includes(event.colId)
+    ? `${header} at Row ${row}, value cleared.`
+    : `${header} at Row ${row}, changed from '${event.oldValue ?? ""}' to '${event.value ?? ""}'.`;
+  if (event.colId === "kitid" || event.colId === "samplerid") {
+    const data = event.data || {};
+    const before = event.colId === "kitid"
+      ? `${event.oldValue ?? ""}_${data.samplerid ?? ""}`
+      : `${data.kitid ?? ""}_${event.oldValue ?? ""}`;
+    if (data.sampleid !== before) {
+      message += ` Sample ID updated to '${data.sampleid}'.`;
+    }
+  }
+  return message;
+}
+
+function summarizeEdits(events, headerOf) {
+  const rows = new Set(), sampleidRows = new Set(), cellsByHeader = {};
+  events.forEach((event) => {
+    const rowKey = event.rowId ?? event.rowIndex;
+    rows.add(rowKey);
+    const header = headerOf(event.colId);
+    cellsByHeader[header] = (cellsByHeader[header] || 0) + 1;
+    if (event.colId === "kitid" || event.colId === "samplerid") sampleidRows.add(rowKey);
+  });
+  const columns = Object.entries(cellsByHeader).map(([header, count]) => `${header} (${count})`).join(", ");
+  let message = `Changed ${events.length} cells in ${rows.size} row(s): ${columns}.`;
+  if (sampleidRows.size) message += ` Sample ID updated in ${sampleidRows.size} row(s).`;
+  return message;
+}
+
+window.dash_clientside = window.dash_clientside || {};
+window.dash_clientside.grid = {
+  editFeedback: function (cellValueChanged) {
+    if (!cellValueChanged || !cellValueChanged.length) {
+      return [window.dash_clientside.no_update, window.dash_clientside.no_update];
+    }
+    let api = null;
+    try {
+      api = dash_ag_grid.getApi("database-table");
+    } catch (e) {
+      api = null;
+    }
+    const headers = {};
+    const headerOf = (colId) => {
+      if (!(colId in headers)) {
+        const colDef = api ? api.getColumnDef(colId) : null;
+        headers[colId] = (colDef && colDef.headerName) || colId;
+      }
+      return headers[colId];
+    };
+    const changed = cellValueChanged.length > EDIT_DETAIL_LIMIT
+      ? summarizeEdits(cellValueChanged, headerOf)
+      : cellValueChanged.map((event) => describeEdit(event, headerOf(event.colId))).join(" ");
+
+    // Cells of the same paste that were rejected are reported alongside
+    const rejected = takeRejectedEdits();
+    const feedback = rejected
+      ? { namespace: "dash_html_components", type: "Div", props: { children: [
+          editFeedbackDiv(changed, "green"), editFeedbackDiv(rejected, "red"),
+        ] } }
+      : editFeedbackDiv(changed, "green");
+    return [feedback, ""];
+  },
+};
+
+// Dirty-row tracking: rows loaded from the database carry their loaded values in
+// data.original; new rows have none. Only dirty rows are sent on upload.
+const EDITABLE_FIELDS = [
+  "sample_start", "sample_end", "kitid", "samplerid", "siteid", "shipped_location",
+  "shipped_date", "return_date", "sample_type", "note",
+];
+
+function normalizeCell(value) {
+  if (value == null || (typeof value === "number" && isNaN(value))) return "";
+  return String(value).trim();
+}
+
+window.dashAgGridFunctions.isRowDirty = function (data) {
+  if (!data) return false;
+  if (!data.original || !data.original_sampleid) return true;
+  return EDITABLE_FIELDS.some((field) => normalizeCell(data[field]) !== normalizeCell(data.original[field]));
+};
+
+window.dash_clientside.grid.collectUpload = function (n_clicks, rowData) {
+  if (!n_clicks) return window.dash_clientside.no_update;
+  const rows = [], cleanSampleids = [];
+  (rowData || []).forEach((row) => {
+    if (window.dashAgGridFunctions.isRowDirty(row)) {
+      rows.push(row);
+    } else {
+      cleanSampleids.push(row.sampleid);
+    }
+  });
+  return { rows: rows, clean_sampleids: cleanSampleids, requested_at: Date.now() };
+};
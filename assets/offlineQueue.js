@@ -0,0 +1,236 @@
+// assets/offlineQueue.js
+// Offline edit queue: grid edits and new kits are stored in IndexedDB while
+// "Offline mode" is on and sent to <prefix>api/sync in one batch when the
+// connection is available. One op is kept per grid row (keyed by rowid), so
+// repeated edits of a row collapse into a single change.
+
+window.sampleTrackOffline = (function () {
+  const DB_NAME = "sampletrack-offline";
+  const STORE = "ops";
+  const ROW_FIELDS = [
+    "sample_start", "sample_end", "sampleid", "kitid", "samplerid", "siteid",
+    "shipped_location", "shipped_date", "return_date", "sample_type", "note",
+  ];
+  let dbPromise = null;
+  let syncing = null;
+
+  function openDb() {
+    if (!dbPromise) {
+      dbPromise = new Promise((resolve, reject) => {
+        const req = indexedDB.open(DB_NAME, 1);
+        req.onupgradeneeded = () => req.result.createObjectStore(STORE, { keyPath: "key" });
+        req.onsuccess = () => resolve(req.result);
+        req.onerror = () => reject(req.error);
+      });
+    }
+    return dbPromise;
+  }
+
+  async function withStore(mode, fn) {
+    const db = await openDb();
+    return new Promise((resolve, reject) => {
+      const tx = db.transaction(STORE, mode);
+      const result = fn(tx.objectStore(STORE));
+      tx.oncomplete = () => resolve(result && "result" in result ? result.result : result);
+      tx.onerror = () => reject(tx.error);
+    });
+  }
+
+  const putOps = (ops) => withStore("readwrite", (store) => ops.forEach((op) => store.put(op)));
+  const allOps = () => withStore("readonly", (store) => store.getAll());
+  const removeOps = (keys) => withStore("readwrite", (store) => keys.forEach((key) => store.delete(key)));
+  const countOps = () => withStore("readonly", (store) => store.count());
+
+  function newId() {
+    return window.crypto && crypto.randomUUID
+      ? crypto.randomUUID().replace(/-/g, "")
+      : Date.now().toString(16) + Math.random().toString(16).slice(2);
+  }
+
+  function pick(data) {
+    const row = { rowid: data.rowid };
+    ROW_FIELDS.forEach((field) => { row[field] = data[field] === undefined ? null : data[field]; });
+    return row;
+  }
+
+  function syncUrl() {
+    const config = document.getElementById("_dash-config");
+    const prefix = config ? JSON.parse(config.textContent).requests_pathname_prefix : "/";
+    return prefix + "api/sync";
+  }
+
+  function statusText(count, extra) {
+    const queued = count ? `${count} change(s) waiting to sync.` : "No changes waiting to sync.";
+    return extra ? `${extra} ${queued}` : queued;
+  }
+
+  async function status(extra) {
+    return statusText(await countOps(), extra);
+  }
+
+  // Record a batch of committed cell edits (a single edit, or a whole paste / fill):
+  // one op per row, read in one transaction and written in another
+  async function queueGridEdits(events) {
+    const byRow = new Map();
+    events.forEach((event) => {
+      const data = event.data || {};
+      const entry = byRow.get(data.rowid) || { oldValues: {} };
+      entry.data = data;  // the latest event carries the row as it is now
+      if (!(event.colId in entry.oldValues)) entry.oldValues[event.colId] = event.oldValue;
+      byRow.set(data.rowid, entry);
+    });
+    const keys = [...byRow.keys()].map((rowid) => "row:" + rowid);
+    const existing = await withStore("readonly", (store) => {
+      const found = {};
+      keys.forEach((key) => {
+        const req = store.get(key);
+        req.onsuccess = () => { if (req.result) found[key] = req.result; };
+      });
+      return found;
+    });
+    const queuedAt = new Date().toISOString();
+    await putOps([...byRow.values()].map(({ data, oldValues }) => {
+      const key = "row:" + data.rowid;
+      const op = existing[key];
+      const original = data.original_sampleid || null;
+      const base = op
+        ? op.base
+        : original ? pick(data.original ? { ...data, ...data.original } : { ...data, ...oldValues }) : null;
+      return {
+        key: key,
+        opid: op ? op.opid : newId(),
+        original_sampleid: op ? op.original_sampleid : original,
+        row: pick(data),
+        base: base,
+        queued_at: queuedAt,
+      };
+    }));
+  }
+
+  const queueGridEdit = (event) => queueGridEdits([event]);
+
+  // Record the rows of a new kit, returns them for the grid
+  async function queueNewKit(kitid, samplers) {
+    const rows = samplers.map((s) => ({
+      ...pick({
+        kitid: kitid,
+        samplerid: s.samplerid,
+        sampleid: `${kitid}_${s.samplerid}`,
+        sample_type: s.sample_type,
+      }),
+      rowid: newId(),
+      delete: "Delete",
+      original_sampleid: null,
+    }));
+    await putOps(rows.map((row) => ({
+      key: "row:" + row.rowid,
+      opid: newId(),
+      original_sampleid: null,
+      row: pick(row),
+      base: null,
+      queued_at: new Date().toISOString(),
+    })));
+    return rows;
+  }
+
+  // Send the whole queue in one request; resending after a dropped response is safe
+  async function sync() {
+    if (syncing) return syncing;
+    syncing = (async () => {
+      const ops = await allOps();
+      if (!ops.length) return { text: statusText(0), applied: [], version: null };
+      const response = await fetch(syncUrl(), {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ ops: ops.map(({ key, ...op }) => op) }),
+      });
+      if (!response.ok) throw new Error(`sync failed (${response.status})`);
+      const { results, version } = await response.json();
+
+      const byOpid = Object.fromEntries(ops.map((op) => [op.opid, op]));
+      const done = [], applied = [], problems = [];
+      results.forEach((result) => {
+        const op = byOpid[result.opid];
+        if (!op) return;
+        done.push(op.key);
+        if (result.status === "applied" || result.status === "already_applied") {
+          const row = { ...op.row, sampleid: result.sampleid };
+          applied.push({ ...row, original_sampleid: result.sampleid, original: pick(row), delete: "Delete" });
+        } else {
+          problems.push(`${op.row.sampleid || op.row.samplerid}: ${result.message}`);
+        }
+      });
+      await removeOps(done);
+
+      let text = `Synced ${applied.length} change(s).`;
+      if (problems.length) text += ` Not synced: ${problems.join(" ")}`;
+      return { text: await status(text), applied: applied, version: version };
+    })();
+    try {
+      return await syncing;
+    } finally {
+      syncing = null;
+    }
+  }
+
+  // Sync as soon as the browser reports the connection is back
+  async function autoSync() {
+    if (!navigator.onLine || !(await countOps())) return;
+    try {
+      const result = await sync();
+      window.dash_clientside.set_props("offline-queue-status", { children: result.text });
+      if (result.applied.length) {
+        window.dash_clientside.set_props("database-table", { rowTransaction: { update: result.applied } });
+      }
+      if (result.version) {
+        window.dash_clientside.set_props("write-committed", { data: result.version });
+      }
+    } catch (e) {
+      console.warn("Offline queue sync failed", e);
+    }
+  }
+  window.addEventListener("online", autoSync);
+  window.addEventListener("load", () => setTimeout(autoSync, 2000));
+
+  return { queueGridEdit, queueGridEdits, queueNewKit, sync, status };
+})();
+
+window.dash_clientside = window.dash_clientside || {};
+window.dash_clientside.offline = {
+  queueGridEdit: async function (cellValueChanged, offline) {
+    const nu = window.dash_clientside.no_update;
+    if (!offline || !cellValueChanged || !cellValueChanged.length) return nu;
+    await window.sampleTrackOffline.queueGridEdits(cellValueChanged);
+    return window.sampleTrackOffline.status();
+  },
+
+  queueNewKit: async function (n_clicks, kitid, entries, offline) {
+    const nu = window.dash_clientside.no_update;
+    if (!offline || !n_clicks) return [nu, nu, nu, nu, nu];
+    kitid = (kitid || "").trim();
+    if (!/^EC-\d{4}$/.test(kitid)) {
+      return [nu, nu, "Invalid Kit ID format. Expected EC-####.", { color: "red" }, true];
+    }
+    const samplers = (entries || []).filter((e) => (e.value || "").trim() !== "");
+    const invalid = samplers.filter((e) => !/^ECCC\d{4}$/.test(e.value.trim())).map((e) => e.value);
+    if (invalid.length) {
+      return [nu, nu, `Invalid Sample ID(s): ${invalid.join(", ")}. Expected ECCC####.`, { color: "red" }, true];
+    }
+    const rows = await window.sampleTrackOffline.queueNewKit(
+      kitid,
+      samplers.map((e) => ({ samplerid: e.value.trim(), sample_type: e.radio || "" }))
+    );
+    return [await window.sampleTrackOffline.status(), { add: rows }, "", { color: "green" }, false];
+  },
+
+  sync: async function (n_clicks) {
+    const nu = window.dash_clientside.no_update;
+    if (!n_clicks) return [nu, nu, nu];
+    try {
+      const result = await window.sampleTrackOffline.sync();
+      return [result.text, result.applied.length ? { update: result.applied } : nu, result.version || nu];
+    } catch (e) {
+      return [await window.sampleTrackOffline.status(`Could not reach the server (${e.message}).`), nu, nu];
+    }
+  },
+};
@@ -0,0 +1,55 @@
+# callbacks per user action, from a trace recorded with CALLBACK_TRACE=1
+#
+#   python benchmarks/bench_callbacks.py logs/callback_traces.jsonl [baseline.jsonl|-] [max_callbacks]
+#
+# Prints one line per kind of action (the prop that started it). Exits with 1
+# when an action fires more than max_callbacks callbacks (default 6), when a
+# callback re-triggered itself, or when an action needs more callbacks than in
+# the baseline trace, so it can gate a before/after comparison.
+
+import json
+import statistics
+import sys
+from collections import defaultdict
+
+def load(path):
+    actions = defaultdict(list)
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                actions[", ".join(record["trigger"]) or "(page load)"].append(record)
+    return actions
+
+def median(records, key):
+    return statistics.median(r[key] for r in records)
+
+def main():
+    if len(sys.argv) < 2:
+        sys.exit("usage: bench_callbacks.py trace.jsonl [baseline.jsonl|-] [max_callbacks]")
+    actions = load(sys.argv[1])
+    baseline = load(sys.argv[2]) if len(sys.argv) > 2 and sys.argv[2] != "-" else {}
+    max_callbacks = int(sys.argv[3]) if len(sys.argv) > 3 else 6
+
+    problems = []
+    print(f"{'action':<48}{'n':>5}{'callbacks':>11}{'base':>6}{'server ms':>11}{'resp KB':>10}  flags")
+    for trigger, records in sorted(actions.items()):
+        callbacks = median(records, "count")
+        base = median(baseline[trigger], "count") if trigger in baseline else None
+        flags = sorted({flag for r in records for flag in r["flags"]})
+        print(
+            f"{trigger[:47]:<48}{len(records):>5}{callbacks:>11g}{'' if base is None else f'{base:g}':>6}"
+            f"{median(records, 'server_ms'):>11.1f}{median(records, 'response_bytes') / 1024:>10.1f}  {' '.join(flags)}"
+        )
+        if max(r["count"] for r in records) > max_callbacks:
+            problems.append(f"{trigger}: up to {max(r['count'] for r in records)} callbacks (budget {max_callbacks})")
+        if base is not None and callbacks > base:
+            problems.append(f"{trigger}: {callbacks:g} callbacks per action, baseline {base:g}")
+        problems += [f"{trigger}: {flag}" for flag in flags if flag.startswith("self_triggered:")]
+
+    if problems:
+        print("\n" + "\n".join(problems))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
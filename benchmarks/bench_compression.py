@@ -0,0 +1,52 @@
+# bytes on the wire for a typical Update search, uncompressed vs gzip vs brotli
+#
+#   python benchmarks/bench_compression.py [table_rows] [search_rows]
+
+import gzip
+import json
+import os
+import sys
+import brotli
+from sample_data import tracking_rows
+
+# same levels as compression.configure_compression
+GZIP_LEVEL = 6
+BR_LEVEL = 4
+ASSETS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "assets")
+
+def sizes(data):
+    return len(data), len(gzip.compress(data, GZIP_LEVEL)), len(brotli.compress(data, quality=BR_LEVEL))
+
+def callback_response(outputs):
+    return json.dumps({"multi": True, "response": outputs}).encode()
+
+def report(label, raw, gz, br):
+    print(f"{label:<38}{raw:>12,}{gz:>12,}{br:>12,}   ({raw / br:.1f}x)")
+
+def main():
+    table_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    search_rows = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    rows = tracking_rows(table_rows)
+
+    print(f"{'payload':<38}{'identity':>12}{'gzip':>12}{'br':>12}")
+    # "Update" click: pas_tracking into database-store
+    open_modal = callback_response({"update-kitid-modal": {"is_open": True}, "database-store": {"data": rows}, "db-loading-output": {"children": ""}})
+    report(f"Update click ({table_rows} rows)", *sizes(open_modal))
+    # "Done" click: matching rows into the grid
+    done = callback_response({"database-table": {"rowData": rows[:search_rows]}, "kitid-filtered-data": {"data": rows[:search_rows]}})
+    report(f"Search results ({search_rows} rows)", *sizes(done))
+
+    totals = [0, 0, 0]
+    for name in sorted(os.listdir(ASSETS)):
+        if name.endswith((".js", ".css")):
+            with open(os.path.join(ASSETS, name), "rb") as f:
+                data = f.read()
+            raw, gz = len(data), len(gzip.compress(data, 9))
+            br = len(brotli.compress(data, quality=11))  # precompressed at max level
+            totals = [totals[0] + raw, totals[1] + gz, totals[2] + br]
+    report("assets/ (first load, precompressed)", *totals)
+    # repeat visits: fingerprinted urls are served from the browser cache
+    print(f"{'assets/ (repeat load, immutable)':<38}{totals[0]:>12,}{0:>12,}{0:>12,}")
+
+if __name__ == "__main__":
+    main()
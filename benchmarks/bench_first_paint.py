@@ -0,0 +1,77 @@
+# bytes and estimated load time before the first paint, eager vs lazy component loading
+#
+#   python benchmarks/bench_first_paint.py [sites]
+#
+# Builds two small apps with the same component libraries as app.py: "eager"
+# (eager_loading=True, the grid and its site labels inline in the layout) and
+# "lazy" (no eager_loading, grid mounted after the page paints). Every script in
+# the index page plus the layout is fetched through the Flask test client and
+# brotli-compressed as the server would send it. The byte counts are measured;
+# the times are estimates from a model of a throttled connection (round trips
+# plus transfer), not a browser measurement, and leave out parsing, script
+# execution and rendering, so real time-to-interactive is longer.
+
+import re
+import sys
+import brotli
+import dash
+import dash_ag_grid as dag
+import dash_bootstrap_components as dbc
+from dash import dcc, html
+
+BR_LEVEL = 4  # same as compression.configure_compression
+# Chrome DevTools network presets: (download bytes/s, round trip s)
+PROFILES = {"Fast 3G": (1.44e6 / 8, 0.5625), "Slow 4G": (9e6 / 8, 0.17)}
+PARALLEL = 6  # connections per host
+
+def grid(sites):
+    return dag.AgGrid(
+        id="database-table",
+        enableEnterpriseModules=True,
+        columnDefs=[{"field": "siteid", "cellEditor": {"function": "SearchableDropdownEditor"},
+                     "cellEditorParams": {"values": sites} if sites else {"optionsUrl": "api/sites"}}],
+        rowData=[],
+    )
+
+def page(grid_component):
+    return html.Div([
+        html.H1("SampleTrack - Passive Mercury"),
+        dcc.Input(id="user"),
+        dbc.Button("New", id="btn-new"),
+        html.Div(grid_component, id="grid-container"),
+        dbc.Modal(id="export-modal", children=[dcc.DatePickerRange(id="export-date-range"), dcc.Dropdown(id="export-sites")]),
+    ])
+
+def build(eager, sites):
+    app = dash.Dash(__name__, eager_loading=eager, external_stylesheets=[dbc.themes.SLATE])
+    app.layout = page(grid(sites) if eager else None)
+    return app
+
+def first_paint(app):
+    client = app.server.test_client()
+    index = client.get("/").get_data(as_text=True)
+    scripts = re.findall(r'<script src="([^"]+)"', index)
+    sizes = [len(brotli.compress(client.get(src).get_data(), quality=BR_LEVEL)) for src in scripts]
+    layout = len(brotli.compress(client.get("/_dash-layout").get_data(), quality=BR_LEVEL))
+    return len(scripts), sum(sizes), layout
+
+def estimated_load_time(requests, total_bytes, profile):
+    bandwidth, rtt = PROFILES[profile]
+    # index, then the scripts PARALLEL at a time, then the layout request
+    rounds = 1 + -(-requests // PARALLEL) + 1
+    return rounds * rtt + total_bytes / bandwidth
+
+def main():
+    site_count = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    sites = [f"Mercury passive site {i} (SITE{i:03d})" for i in range(site_count)]
+    results = {"eager": first_paint(build(True, sites)), "lazy": first_paint(build(False, sites))}
+
+    print(f"{'':<10}{'scripts':>9}{'script KB':>12}{'layout KB':>12}" + "".join(f"{'est. ' + p + ' s':>17}" for p in PROFILES))
+    for label, (count, script_bytes, layout_bytes) in results.items():
+        times = [estimated_load_time(count, script_bytes + layout_bytes, p) for p in PROFILES]
+        print(f"{label:<10}{count:>9}{script_bytes / 1024:>12,.0f}{layout_bytes / 1024:>12,.1f}" + "".join(f"{t:>17.1f}" for t in times))
+    print("\nest. = network transfer model only, not measured in a browser")
+    print("lazy also skips the stations query serve_layout used to run before returning the layout")
+
+if __name__ == "__main__":
+    main()
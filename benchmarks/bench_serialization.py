@@ -0,0 +1,58 @@
+# encode time and size of a rowData response, to_dict + stdlib json vs to_grid_records + orjson
+#
+#   python benchmarks/bench_serialization.py [rows] [repeats]
+
+import json
+import os
+import sys
+import time
+import pandas as pd
+import plotly.io.json as pio_json
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sample_data import tracking_rows
+from working_set import TRACKING_SCHEMA, to_working_set, to_grid_records
+
+def timed(fn, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000, result
+
+# what Dash does with a callback return value (dash._utils.to_json)
+def encode(rows, engine):
+    pio_json.config.default_engine = engine
+    return pio_json.to_json_plotly({"multi": True, "response": {"database-table": {"rowData": rows}}})
+
+def reject_constant(name):
+    raise ValueError(f"{name} in encoded output")
+
+def old_records(df):
+    df = df.copy()
+    for col in ["sample_start", "sample_end"]:
+        df[col] = df[col].dt.strftime("%Y-%m-%d %H:%M")
+    return df.to_dict("records")
+
+def main():
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    rows = [{k: v for k, v in r.items() if k in TRACKING_SCHEMA} for r in tracking_rows(n_rows)]
+    df = to_working_set(pd.DataFrame(rows))
+
+    old_convert, old_rows = timed(lambda: old_records(df), repeats)
+    old_encode, old_json = timed(lambda: encode(old_rows, "json"), repeats)
+    new_convert, new_rows = timed(lambda: to_grid_records(df), repeats)
+    new_encode, new_json = timed(lambda: encode(new_rows, "orjson"), repeats)
+
+    # NaN/NaT must come out as null, never as bare NaN (invalid JSON)
+    json.loads(new_json, parse_constant=reject_constant)
+
+    print(f"{n_rows:,} rows, best of {repeats}")
+    print(f"{'':<24}{'convert ms':>12}{'encode ms':>12}{'total ms':>12}{'bytes':>12}")
+    print(f"{'to_dict + json':<24}{old_convert:>12.1f}{old_encode:>12.1f}{old_convert + old_encode:>12.1f}{len(old_json):>12,}")
+    print(f"{'to_grid_records + orjson':<24}{new_convert:>12.1f}{new_encode:>12.1f}{new_convert + new_encode:>12.1f}{len(new_json):>12,}")
+
+if __name__ == "__main__":
+    main()
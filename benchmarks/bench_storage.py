@@ -0,0 +1,73 @@
+# bulk writes and reads through the embedded SQLite backend (STORAGE_BACKEND=sqlite)
+#
+#   python benchmarks/bench_storage.py [table_rows] [batch_rows] [db_path]
+#
+# Runs the app's own code paths against a fresh SQLite file: apply_sync_ops in
+# batches (offline sync / api/kits), a bulk to_sql upload, the pas_tracking
+# snapshot load, the typeahead refresh and the kit summary. Point it at a file on
+# the target disk; the default is a temporary file.
+
+import os
+import sys
+import tempfile
+import time
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sample_data import tracking_rows
+from offline_sync import SYNC_COLUMNS, apply_sync_ops
+from storage import SQLiteStorage
+from snapshot_cache import TableSnapshot
+from typeahead import DistinctValueIndex
+from kit_summary import KitStatusSummary
+from working_set import to_working_set
+
+def timed(label, rows, fn):
+    started = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<36}{elapsed * 1000:>12,.0f} ms{rows / elapsed:>14,.0f} rows/s")
+    return result
+
+def sync_batches(engine, rows, batch_rows):
+    applied = 0
+    for start in range(0, len(rows), batch_rows):
+        ops = [{"opid": r["sampleid"], "original_sampleid": None, "row": r} for r in rows[start:start + batch_rows]]
+        with engine.begin() as conn:
+            results, _ = apply_sync_ops(conn, ops, {})
+        applied += sum(r["status"] == "applied" for r in results)
+    return applied
+
+def main():
+    table_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    batch_rows = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    workdir = tempfile.mkdtemp()
+    path = sys.argv[3] if len(sys.argv) > 3 else os.path.join(workdir, "bench.db")
+    if os.path.exists(path):
+        sys.exit(f"{path} exists, pass a new file")
+
+    # sample_data can repeat a sampleid; keep the first so every row is new
+    rows, seen = [], set()
+    for r in tracking_rows(table_rows * 2):
+        if r["sampleid"] not in seen:
+            seen.add(r["sampleid"])
+            rows.append({k: r[k] for k in ["sampleid"] + SYNC_COLUMNS})
+    synced, uploaded = rows[:table_rows], pd.DataFrame(rows[table_rows:])
+    engine = SQLiteStorage(path).write_engine
+
+    applied = timed(f"apply_sync_ops ({batch_rows}/batch)", len(synced), lambda: sync_batches(engine, synced, batch_rows))
+    # Same call as the upload button's insert of new rows
+    upload = to_working_set(uploaded)
+    timed("to_sql upload", len(upload), lambda: upload.to_sql("pas_tracking", engine, if_exists="append", index=False))
+
+    total = applied + len(upload)
+    snapshot = TableSnapshot(engine, "SELECT * FROM pas_tracking", os.path.join(workdir, "cache"), "bench", transform=to_working_set)
+    df = timed("snapshot load (SELECT *)", total, lambda: snapshot.read(copy=False))
+    timed("typeahead refresh", total, DistinctValueIndex(engine).refresh)
+    summary = timed("kit summary", total, KitStatusSummary(engine, snapshot).refresh)
+
+    print(f"\n{len(df):,} rows, {os.path.getsize(path) / 1e6:,.1f} MB on disk, "
+          f"{len(summary['open_kits']):,} open kits ({len(summary['overdue_kits']):,} overdue)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# memory and time of the Update search working set, object dtype vs typed
+#
+#   python benchmarks/bench_working_set.py [table_rows] [repeats]
+
+import io
+import json
+import os
+import sys
+import time
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sample_data import tracking_rows
+from working_set import TRACKING_SCHEMA, to_working_set, to_grid_records
+
+def timed(fn, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000, result
+
+def pickled_size(df):
+    buf = io.BytesIO()
+    df.to_pickle(buf)
+    return len(buf.getvalue())
+
+def report(label, old, new, unit):
+    print(f"{label:<36}{old:>14,.1f}{new:>14,.1f}  {unit:<4}({old / new:.1f}x)")
+
+def main():
+    table_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    rows = [{k: v for k, v in r.items() if k in TRACKING_SCHEMA} for r in tracking_rows(table_rows)]
+    kitid = rows[len(rows) // 2]["kitid"]
+    location = rows[0]["shipped_location"].lower()
+
+    object_df = pd.DataFrame(rows).astype(object)
+    typed_df = to_working_set(pd.DataFrame(rows))
+
+    # before: the table round-trips through database-store and is rebuilt from records per search
+    def object_search():
+        df = pd.DataFrame(json.loads(json.dumps(rows)))
+        kit = df[df["kitid"] == kitid]
+        loc = df[df["shipped_location"].str.strip().str.lower() == location].copy()
+        return kit.to_dict("records"), loc.to_dict("records")
+
+    # after: the typed snapshot stays on the server, one conversion per response
+    def typed_search():
+        kit = typed_df[typed_df["kitid"] == kitid]
+        locations = typed_df["shipped_location"].cat.categories
+        wanted = locations[locations.str.strip().str.lower() == location]
+        loc = typed_df[typed_df["shipped_location"].isin(wanted)]
+        return to_grid_records(kit), to_grid_records(loc)
+
+    print(f"{table_rows:,} rows, best of {repeats}")
+    print(f"{'':<36}{'object':>14}{'typed':>14}")
+    report("frame memory", object_df.memory_usage(deep=True).sum() / 1e6, typed_df.memory_usage(deep=True).sum() / 1e6, "MB")
+    report("snapshot pickle", pickled_size(object_df) / 1e6, pickled_size(typed_df) / 1e6, "MB")
+    # database-store went down on "Update" and back up on "Done"; now nothing is sent
+    print(f"{'store payload per search':<36}{len(json.dumps(rows)) * 2 / 1e6:>14,.1f}{0:>14,.1f}  MB")
+    old_ms, (old_kit, old_loc) = timed(object_search, repeats)
+    new_ms, (new_kit, new_loc) = timed(typed_search, repeats)
+    report("kit + location search", old_ms, new_ms, "ms")
+    assert len(old_kit) == len(new_kit) and len(old_loc) == len(new_loc)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+# synthetic pas_tracking rows shaped like the production table, for benchmarks
+
+import random
+from datetime import date, datetime, timedelta
+
+SITES = [f"S{n:03d}" for n in range(60)]
+LOCATIONS = ["Alert", "Egbert", "Kejimkujik", "Saturna", "Whistler", "Burnt Island", "Fort Vermilion", "Little Fox Lake"]
+
+def tracking_rows(n_rows, seed=0):
+    rng = random.Random(seed)
+    rows = []
+    kit = 0
+    while len(rows) < n_rows:
+        kit += 1
+        kitid = f"EC-{kit % 10000:04d}"
+        site = rng.choice(SITES)
+        location = rng.choice(LOCATIONS)
+        shipped = date(2021, 1, 1) + timedelta(days=rng.randrange(1800))
+        returned = shipped + timedelta(days=rng.randrange(20, 120)) if rng.random() < 0.9 else None
+        start = datetime.combine(shipped, datetime.min.time()) + timedelta(days=rng.randrange(3, 10), hours=rng.randrange(24))
+        for i in range(rng.choice([3, 4, 5])):
+            samplerid = f"ECCC{rng.randrange(10000):04d}"
+            rows.append({
+                "sample_start": start.strftime("%Y-%m-%d %H:%M:%S"),
+                "sample_end": (start + timedelta(days=14)).strftime("%Y-%m-%d %H:%M:%S"),
+                "sampleid": f"{kitid}_{samplerid}",
+                "kitid": kitid,
+                "samplerid": samplerid,
+                "siteid": site,
+                "shipped_location": location,
+                "shipped_date": shipped.isoformat(),
+                "return_date": returned.isoformat() if returned else None,
+                "sample_type": "Blank" if i == 0 else "Sample",
+                "note": rng.choice([None, None, None, "damaged cap", "resampled"]),
+                "screen_sampling_rate": None,
+                "delete": "Delete",
+            })
+    return rows[:n_rows]
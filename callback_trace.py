@@ -0,0 +1,223 @@
+# opt-in tracing of the callback chains each user action fires, written to logs/callback_traces.jsonl
+#
+# With CALLBACK_TRACE=1 every _dash-update-component request is recorded: the
+# callback, the prop that triggered it, server time and request/response bytes.
+# A request triggered by a prop that an earlier callback of the same client wrote
+# (directly, or through clientside callbacks) continues that client's chain;
+# anything else is a new user action. Each finished chain is one JSON line, with
+# flags for callbacks that ran more than once, changed nothing (PreventUpdate /
+# no_update) or were re-triggered by their own output.
+#
+# benchmarks/bench_callbacks.py summarizes a trace file per action and checks it
+# against a callbacks-per-action budget.
+
+import atexit
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+TRACE_FILE = "callback_traces.jsonl"
+CHAIN_IDLE_SECONDS = 2.0  # a chain with no request for this long is finished
+
+# "id.prop" with pattern-matching ids reduced to their type, so that
+# {"index":3,"type":"entry-input"}.value matches the ALL pattern in the graph
+def _prop_key(prop_id):
+    component_id, _, prop = prop_id.rpartition(".")
+    if component_id.startswith("{"):
+        try:
+            parsed = json.loads(component_id)
+            component_id = json.dumps({k: (v if k == "type" else "*") for k, v in sorted(parsed.items())})
+        except ValueError:
+            pass
+    return f"{component_id}.{prop}"
+
+# Output props of a callback_map key ("a.b", or "..a.b...c.d.." for several outputs)
+def _output_props(output_key):
+    key = output_key[2:-2] if output_key.startswith("..") else output_key
+    return [_prop_key(part.split("@")[0]) for part in key.split("...")]
+
+def _dep_key(dep):
+    component_id = dep["id"]
+    if isinstance(component_id, dict):
+        component_id = json.dumps(component_id, sort_keys=True)
+    return _prop_key(f"{component_id}.{dep['property']}")
+
+# Static view of the callback graph: names, inputs and outputs of every callback,
+# props written by more than one callback, and callbacks that feed their own inputs
+def callback_graph(callback_map):
+    callbacks = {}
+    for key, spec in callback_map.items():
+        fn = spec.get("callback")
+        callbacks[key] = {
+            "name": getattr(fn, "__name__", None) or f"clientside:{_output_props(key)[0]}",
+            "clientside": fn is None,
+            "inputs": {_dep_key(dep) for dep in spec.get("inputs", [])},
+            "outputs": set(_output_props(key)),
+        }
+    writers = {}
+    for cb in callbacks.values():
+        for prop in cb["outputs"]:
+            writers.setdefault(prop, []).append(cb["name"])
+    return {
+        "callbacks": callbacks,
+        "shared_outputs": {prop: names for prop, names in sorted(writers.items()) if len(names) > 1},
+        "self_loops": sorted(cb["name"] for cb in callbacks.values() if cb["inputs"] & cb["outputs"]),
+    }
+
+# Props that change in the browser once the given props are written, following clientside callbacks
+def _clientside_closure(props, callbacks):
+    props = set(props)
+    changed = True
+    while changed:
+        changed = False
+        for cb in callbacks.values():
+            if cb["clientside"] and cb["inputs"] & props and not cb["outputs"] <= props:
+                props |= cb["outputs"]
+                changed = True
+    return props
+
+class CallbackTracer:
+    def __init__(self, callback_map, trace_path, idle=CHAIN_IDLE_SECONDS):
+        self.trace_path = trace_path
+        self.idle = idle
+        self.graph = callback_graph(callback_map)
+        self._lock = threading.Lock()
+        self._chains = {}  # client -> open chain
+
+    def _client(self):
+        return request.headers.get("Dh-User") or f"{request.remote_addr} {request.user_agent.string}"
+
+    # Record one finished callback request for the current client
+    def record(self, payload, status, elapsed_ms, request_bytes, response_bytes, written):
+        spec = self.graph["callbacks"].get(payload.get("output"), {})
+        name = spec.get("name") or payload.get("output")
+        triggers = [_prop_key(p) for p in payload.get("changedPropIds") or []]
+        now = time.time()
+        client = self._client()
+        with self._lock:
+            self._flush_idle(now)
+            chain = self._chains.get(client)
+            # initial-load callbacks (no trigger) belong to the same page-load chain
+            continues = chain is not None and (
+                bool(set(triggers) & chain["reachable"]) or (not triggers and not chain["trigger"])
+            )
+            if not continues:
+                if chain is not None:
+                    self._write(self._chains.pop(client))
+                chain = self._chains[client] = {
+                    "action": uuid.uuid4().hex[:12],
+                    "client": client,
+                    "started": now - elapsed_ms / 1000,
+                    "trigger": triggers,
+                    "callbacks": [],
+                    "reachable": set(),
+                    "written_by": {},
+                }
+            self_triggered = any(chain["written_by"].get(t) == name for t in triggers)
+            chain["callbacks"].append({
+                "callback": name,
+                "trigger": triggers,
+                "ms": round(elapsed_ms, 1),
+                "request_bytes": request_bytes,
+                "response_bytes": response_bytes,
+                "no_op": status == 204 or not written,
+                "self_triggered": self_triggered,
+            })
+            for prop in _clientside_closure(written, self.graph["callbacks"]):
+                chain["written_by"].setdefault(prop, name)
+                chain["reachable"].add(prop)
+            chain["last"] = now
+
+    def _flush_idle(self, now):
+        for client, chain in list(self._chains.items()):
+            if now - chain["last"] > self.idle:
+                self._write(self._chains.pop(client))
+
+    # Write out every open chain (idle or not), e.g. at the end of a benchmark run
+    def flush(self):
+        with self._lock:
+            for client in list(self._chains):
+                self._write(self._chains.pop(client))
+
+    def _write(self, chain):
+        callbacks = chain["callbacks"]
+        names = [cb["callback"] for cb in callbacks]
+        flags = sorted({f"repeated:{n}" for n in names if names.count(n) > 1})
+        flags += sorted({f"no_op:{cb['callback']}" for cb in callbacks if cb["no_op"]})
+        flags += sorted({f"self_triggered:{cb['callback']}" for cb in callbacks if cb["self_triggered"]})
+        record = {
+            "action": chain["action"],
+            "client": chain["client"],
+            "started": round(chain["started"], 3),
+            "trigger": chain["trigger"],
+            "count": len(callbacks),
+            "server_ms": round(sum(cb["ms"] for cb in callbacks), 1),
+            "wall_ms": round((chain["last"] - chain["started"]) * 1000, 1),
+            "request_bytes": sum(cb["request_bytes"] for cb in callbacks),
+            "response_bytes": sum(cb["response_bytes"] for cb in callbacks),
+            "flags": flags,
+            "callbacks": callbacks,
+        }
+        try:
+            with open(self.trace_path, "a") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                f.write(json.dumps(record) + "\n")
+        except OSError as e:
+            logger.warning(f"Could not write callback trace: {e}")
+        if flags:
+            logger.info(f"Action {chain['trigger']} fired {len(callbacks)} callbacks: {', '.join(flags)}")
+
+# Props present in a callback response (what the browser will actually update)
+def _written_props(response):
+    if response.status_code != 200:
+        return []
+    try:
+        body = json.loads(response.get_data())
+    except ValueError:
+        return []
+    return [_prop_key(f"{component_id}.{prop}") for component_id, props in (body.get("response") or {}).items() for prop in props]
+
+def configure_callback_trace(app, log_dir):
+    if os.getenv("CALLBACK_TRACE", "").lower() not in ("1", "true", "yes"):
+        return None
+    server = app.server
+    os.makedirs(log_dir, exist_ok=True)
+    callback_path = app.config.routes_pathname_prefix + "_dash-update-component"
+    tracer = CallbackTracer(app.callback_map, os.path.join(log_dir, TRACE_FILE))
+    atexit.register(tracer.flush)
+
+    graph = tracer.graph
+    if graph["self_loops"]:
+        logger.info(f"Callbacks whose output is also their input: {', '.join(graph['self_loops'])}")
+    for prop, names in graph["shared_outputs"].items():
+        logger.info(f"{prop} is written by {len(names)} callbacks: {', '.join(names)}")
+
+    @server.before_request
+    def start_trace():
+        if request.path == callback_path and request.method == "POST":
+            g.trace_started = time.perf_counter()
+        return None
+
+    @server.after_request
+    def record_trace(response):
+        started = g.pop("trace_started", None)
+        if started is None:
+            return response
+        tracer.record(
+            request.get_json(silent=True) or {},
+            response.status_code,
+            (time.perf_counter() - started) * 1000,
+            request.content_length or 0,
+            response.calculate_content_length() or 0,
+            _written_props(response),
+        )
+        return response
+
+    return tracer
@@ -0,0 +1,89 @@
+# response compression, precompressed assets and long-lived caching of fingerprinted asset urls
+
+import gzip
+import logging
+import mimetypes
+import os
+import brotli
+from flask import request, send_file
+from flask_compress import Compress
+from werkzeug.security import safe_join
+
+logger = logging.getLogger(__name__)
+
+ASSET_CACHE_MAX_AGE = 31536000  # one year, asset urls change with the file (?m=<mtime>)
+PRECOMPRESSED_EXTENSIONS = (".js", ".css")
+ENCODING_SUFFIXES = (("br", ".br"), ("gzip", ".gz"))
+
+# Write .br / .gz siblings next to every js/css asset that is missing or stale
+def precompress_assets(assets_folder):
+    written = 0
+    for root, _, files in os.walk(assets_folder):
+        for name in files:
+            if not name.endswith(PRECOMPRESSED_EXTENSIONS):
+                continue
+            source = os.path.join(root, name)
+            with open(source, "rb") as f:
+                data = None
+                for encoding, suffix in ENCODING_SUFFIXES:
+                    target = source + suffix
+                    if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(source):
+                        continue
+                    data = data if data is not None else f.read()
+                    if encoding == "br":
+                        compressed = brotli.compress(data, quality=11)
+                    else:
+                        compressed = gzip.compress(data, compresslevel=9, mtime=0)
+                    # write then rename so concurrent workers never serve a partial file
+                    tmp = f"{target}.{os.getpid()}.tmp"
+                    with open(tmp, "wb") as out:
+                        out.write(compressed)
+                    os.replace(tmp, target)
+                    written += 1
+    return written
+
+def configure_compression(app):
+    server = app.server
+    assets_folder = app.config.assets_folder
+    assets_prefix = app.config.routes_pathname_prefix + app.config.assets_url_path.strip("/") + "/"
+
+    # brotli first for browsers that support it, gzip for everything else
+    server.config["COMPRESS_ALGORITHM"] = ["br", "gzip"]
+    server.config["COMPRESS_ALGORITHM_STREAMING"] = ["br", "deflate"]
+    server.config["COMPRESS_BR_LEVEL"] = 4
+    server.config["COMPRESS_LEVEL"] = 6
+    Compress(server)
+
+    try:
+        written = precompress_assets(assets_folder)
+        logger.info(f"Precompressed {written} asset file(s)")
+    except OSError as e:
+        logger.warning(f"Could not precompress assets, falling back to on-the-fly compression: {e}")
+
+    @server.before_request
+    def serve_precompressed_asset():
+        if request.method not in ("GET", "HEAD") or not request.path.startswith(assets_prefix):
+            return None
+        rel_path = request.path[len(assets_prefix):]
+        source = safe_join(assets_folder, rel_path)
+        if source is None or not rel_path.endswith(PRECOMPRESSED_EXTENSIONS) or not os.path.isfile(source):
+            return None
+
+        accept_encoding = request.headers.get("Accept-Encoding", "")
+        for encoding, suffix in ENCODING_SUFFIXES:
+            candidate = source + suffix
+            if encoding in accept_encoding and os.path.isfile(candidate) and os.path.getmtime(candidate) >= os.path.getmtime(source):
+                response = send_file(candidate, mimetype=mimetypes.guess_type(source)[0], conditional=True)
+                response.headers["Content-Encoding"] = encoding
+                response.headers["Vary"] = "Accept-Encoding"
+                return response
+        return None
+
+    @server.after_request
+    def cache_fingerprinted_assets(response):
+        if request.path.startswith(assets_prefix) and "m" in request.args and response.status_code in (200, 304):
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = ASSET_CACHE_MAX_AGE
+            response.cache_control.immutable = True
+        return response
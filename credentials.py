@@ -5,8 +5,10 @@ import logging
 import os
 import dash
 import dash_bootstrap_components as dbc
+import plotly.io as pio
 from dotenv import load_dotenv
 from pathlib import Path
+from compression import configure_compression
 
 logger = logging.getLogger(__name__)
 
@@ -42,6 +44,11 @@ def get_credentials(parent_dir):
         "URL_PREFIX": URL_PREFIX,
     }
 
+    # the embedded backend (STORAGE_BACKEND=sqlite, see storage.py) needs no database server
+    if os.getenv("STORAGE_BACKEND", "postgres").lower() == "sqlite":
+        for name in ("SERVER", "VIEWER_USER", "VIEWER_PASSWORD", "EDITOR_USER", "EDITOR_PASSWORD", "DATABASE"):
+            vars_dict.pop(name)
+
     missing = [name for name, value in vars_dict.items() if not value]
 
     if missing:
@@ -57,6 +64,24 @@ def get_credentials(parent_dir):
 
     return COMPUTER, SERVER, VIEWER_USER, VIEWER_PASSWORD, EDITOR_USER, EDITOR_PASSWORD, DATABASE, URL_PREFIX
 
+# optional settings for the storage backend and the database connection pools
+# (read engine can point at a replica)
+def get_engine_settings(server):
+    settings = {
+        "backend": os.getenv("STORAGE_BACKEND", "postgres").lower(),
+        "sqlite_path": os.getenv("SQLITE_PATH", os.path.join("data", "sampletrack.db")),
+        "read_server": os.getenv("READ_SERVER") or server,
+        "read_pool_size": int(os.getenv("READ_POOL_SIZE", "5")),
+        "read_max_overflow": int(os.getenv("READ_MAX_OVERFLOW", "10")),
+        "write_pool_size": int(os.getenv("WRITE_POOL_SIZE", "2")),
+        "write_max_overflow": int(os.getenv("WRITE_MAX_OVERFLOW", "3")),
+        "pool_recycle": int(os.getenv("POOL_RECYCLE_SECONDS", "1800")),
+        # server-side cap on a single statement, off unless set (not supported behind PgBouncer)
+        "statement_timeout_ms": int(os.getenv("STATEMENT_TIMEOUT_MS", "0")),
+    }
+    logger.debug(f"DATABASE_READ_SERVER: {settings['read_server']}")
+    return settings
+
 def get_host_environment(local_computer_name):
 
     # set a local switch to select host environment
@@ -77,15 +102,14 @@ def get_host_environment(local_computer_name):
     return host
 
 def create_dash_app(host, path_prefix, url_prefix):
+    # flatpickr, inputmask and custom.css are picked up from assets/ automatically,
+    # which gives them fingerprinted (?m=) urls that can be cached long term.
+    # No host uses eager_loading: the grid, date picker and dropdown bundles are
+    # fetched when those components first render, not before the first paint.
     external_stylesheets=[
-            dbc.themes.SLATE,
-            '/assets/flatpickr.min.css',
-            '/assets/custom.css'
-    ]
-    external_scripts = [
-        '/assets/flatpickr.min.js',
-        '/assets/inputmask.min.js',
+            dbc.themes.SLATE
     ]
+    external_scripts = []
 
     if host == "fsdh":
         app = dash.Dash(
@@ -104,8 +128,7 @@ def create_dash_app(host, path_prefix, url_prefix):
             requests_pathname_prefix=url_prefix,
             external_stylesheets=external_stylesheets,
             external_scripts=external_scripts,
-            suppress_callback_exceptions=True,
-            eager_loading=True
+            suppress_callback_exceptions=True
         )
 
     elif host == "sandbox":
@@ -115,8 +138,7 @@ def create_dash_app(host, path_prefix, url_prefix):
             requests_pathname_prefix=url_prefix,
             external_stylesheets=external_stylesheets,
             external_scripts=external_scripts,
-            suppress_callback_exceptions=True,
-            eager_loading=True
+            suppress_callback_exceptions=True
         )
 
     else:
@@ -127,5 +149,10 @@ def create_dash_app(host, path_prefix, url_prefix):
             suppress_callback_exceptions=True
         )
 
+    # Dash encodes layouts and callback responses with plotly's JSON encoder; orjson is
+    # several times faster than the standard library for large rowData payloads
+    pio.json.config.default_engine = "orjson"
+    configure_compression(app)
+
     logger.info(f"url_prefix: {url_prefix}")
     return app, app.server
\ No newline at end of file
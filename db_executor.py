@@ -0,0 +1,62 @@
+# bounded thread pool for database and pandas work
+#
+# Under threaded workers (gunicorn gthread, mod_wsgi threads) each request has its
+# own thread, so a slow query only holds the thread it runs on. This pool bounds
+# how many heavy jobs a worker runs at once, so a burst of uploads or exports
+# cannot take every request thread and pooled connection. Callers that would wait
+# longer than the timeout get DatabaseBusy (503) instead of piling up.
+
+import contextvars
+import functools
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from profiling import run_profiled
+
+logger = logging.getLogger(__name__)
+
+DB_WORKERS = int(os.getenv("DB_WORKERS", 4))
+DB_MAX_PENDING = int(os.getenv("DB_MAX_PENDING", 16))
+DB_TIMEOUT_SECONDS = float(os.getenv("DB_TIMEOUT_SECONDS", 90))
+
+class DatabaseBusy(RuntimeError):
+    pass
+
+class BoundedExecutor:
+    def __init__(self, max_workers=DB_WORKERS, max_pending=DB_MAX_PENDING, timeout=DB_TIMEOUT_SECONDS):
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db")
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+
+    # Run fn in the pool and wait for it; the caller's context (Dash callback
+    # context, Flask request, whether the request is being profiled) is copied
+    # so fn can use it as usual
+    def run(self, fn, *args, timeout=None, **kwargs):
+        timeout = self.timeout if timeout is None else timeout
+        if not self._slots.acquire(blocking=False):
+            raise DatabaseBusy("The server is busy with other database work, please try again shortly.")
+        try:
+            future = self._executor.submit(contextvars.copy_context().run, run_profiled, fn, *args, **kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            future.cancel()  # only helps if it has not started; a running query finishes in the background
+            logger.error(f"{getattr(fn, '__name__', fn)} did not finish within {timeout:g} s")
+            raise DatabaseBusy(f"The database did not answer within {timeout:g} seconds, please try again.")
+
+db_executor = BoundedExecutor()
+
+# Decorator for callbacks and routes whose body is database or pandas work
+def offload(fn=None, timeout=None):
+    if fn is None:
+        return functools.partial(offload, timeout=timeout)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        return db_executor.run(fn, *args, timeout=timeout, **kwargs)
+    return wrapper
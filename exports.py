@@ -0,0 +1,79 @@
+# filtered, column-pruned exports of pas_tracking (csv, parquet, xlsx)
+#
+# Filters and the column list are pushed into the SQL query, so only the rows
+# and columns asked for leave the database.
+
+import io
+from datetime import timedelta
+import pandas as pd
+from pandas.api.types import DatetimeTZDtype
+from storage import text_in
+
+EXPORT_COLUMNS = [
+    'sampleid', 'kitid', 'samplerid', 'sample_start', 'sample_end', 'siteid',
+    'shipped_location', 'shipped_date', 'return_date', 'sample_type', 'note'
+]
+
+EXPORT_FORMATS = {
+    "csv": ("CSV", ".csv"),
+    "parquet": ("Parquet", ".parquet"),
+    "xlsx": ("Excel (XLSX)", ".xlsx"),
+}
+
+# Build the SELECT for an export. Dates are inclusive; a row matches the date
+# range when its sampling period overlaps it. source is pas_tracking, or the
+# pas_tracking_all view when archived kits are included.
+def build_export_query(columns=None, start_date=None, end_date=None, siteids=None, kitids=None, locations=None,
+                       source="pas_tracking"):
+    columns = [c for c in EXPORT_COLUMNS if c in (columns or EXPORT_COLUMNS)]
+    if not columns:
+        raise ValueError("Select at least one column to export.")
+
+    where, params = [], {}
+    if start_date:
+        where.append("COALESCE(sample_end, sample_start) >= :start_date")
+        params["start_date"] = pd.Timestamp(start_date).to_pydatetime()
+    if end_date:
+        where.append("sample_start < :end_date")
+        params["end_date"] = (pd.Timestamp(end_date) + timedelta(days=1)).to_pydatetime()
+    if siteids:
+        where.append("siteid IN :siteids")
+        params["siteids"] = list(siteids)
+    if kitids:
+        where.append("kitid IN :kitids")
+        params["kitids"] = list(kitids)
+    if locations:
+        where.append("shipped_location IN :locations")
+        params["locations"] = list(locations)
+
+    query = f"SELECT {', '.join(columns)} FROM {source}"
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    query += " ORDER BY sample_start NULLS LAST, sampleid"
+    return text_in(query, *(name for name in ("siteids", "kitids", "locations") if name in params)), params
+
+def is_unfiltered(start_date=None, end_date=None, siteids=None, kitids=None, locations=None):
+    return not any([start_date, end_date, siteids, kitids, locations])
+
+# Serialize an export, returns the file contents as bytes
+def write_export(df, fmt):
+    if fmt == "parquet":
+        buf = io.BytesIO()
+        df.to_parquet(buf, index=False)
+        return buf.getvalue()
+
+    df = df.copy()
+    for col in ["sample_start", "sample_end"]:
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col], errors='coerce').dt.strftime("%Y-%m-%d %H:%M:%S")
+    if fmt == "csv":
+        return df.to_csv(index=False).encode("utf-8-sig")
+    if fmt == "xlsx":
+        # Excel cannot store timezone-aware datetimes
+        for col in df.columns:
+            if isinstance(df[col].dtype, DatetimeTZDtype):
+                df[col] = df[col].dt.tz_localize(None)
+        buf = io.BytesIO()
+        df.to_excel(buf, index=False, sheet_name="pas_tracking", engine="openpyxl")
+        return buf.getvalue()
+    raise ValueError(f"Unknown export format '{fmt}'")
@@ -0,0 +1,15 @@
+# gunicorn settings for the container (Dockerfile); each value can be overridden from the environment
+#
+# gthread workers serve every request on its own thread, so a slow query or upload
+# only holds one thread while the worker keeps answering other interactions.
+# Heavy callbacks additionally go through the bounded pool in db_executor.py.
+
+import os
+
+bind = "0.0.0.0:8080"
+worker_class = "gthread"
+workers = int(os.getenv("WEB_WORKERS", "2"))
+threads = int(os.getenv("WEB_THREADS", "8"))
+timeout = int(os.getenv("WEB_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
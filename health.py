@@ -0,0 +1,92 @@
+# liveness / readiness state: database pings, pool usage and startup warm-up
+
+import logging
+import threading
+import time
+from sqlalchemy import text
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger(__name__)
+
+# max_overflow is the value the engine was created with (None when unknown)
+def pool_status(engine, max_overflow=None):
+    pool = engine.pool
+    if not isinstance(pool, QueuePool):
+        return {"class": type(pool).__name__}
+    size, checked_out = pool.size(), pool.checkedout()
+    capacity = size + max(max_overflow, 0) if max_overflow is not None else None
+    return {
+        "size": size,
+        "checked_out": checked_out,
+        "overflow": max(pool.overflow(), 0),  # QueuePool counts from -size
+        "utilization": round(checked_out / capacity, 3) if capacity else None,
+    }
+
+# SELECT 1 on each engine, cached for `ttl` seconds so frequent probes stay cheap.
+# max_overflow maps engine names to their configured pool overflow.
+class DatabaseProbe:
+    def __init__(self, engines, max_overflow=None, ttl=5):
+        self.engines = engines
+        self.max_overflow = max_overflow or {}
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._results = None
+
+    def _ping(self, engine):
+        started = time.perf_counter()
+        try:
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+            return {"ok": True, "latency_ms": round((time.perf_counter() - started) * 1000, 1)}
+        except Exception as e:
+            return {"ok": False, "latency_ms": round((time.perf_counter() - started) * 1000, 1), "error": str(e).splitlines()[0]}
+
+    def check(self):
+        with self._lock:
+            if self._results is None or time.monotonic() - self._checked_at > self.ttl:
+                self._results = {name: self._ping(engine) for name, engine in self.engines.items()}
+                self._checked_at = time.monotonic()
+            return {
+                name: {**result, "pool": pool_status(self.engines[name], self.max_overflow.get(name)), "checked_s_ago": round(time.monotonic() - self._checked_at, 1)}
+                for name, result in self._results.items()
+            }
+
+# Runs startup steps (reference data, caches) in a background thread and records
+# how they went; failed steps are retried until they succeed
+class WarmUp:
+    def __init__(self, steps, retry_delay=15):
+        self.steps = steps  # [(name, callable)]
+        self.retry_delay = retry_delay
+        self.status = {name: {"state": "pending"} for name, _ in steps}
+        self.started_at = None
+        self.finished_at = None
+
+    def start(self):
+        self.started_at = time.time()
+        threading.Thread(target=self._run, name="warm-up", daemon=True).start()
+
+    def _run(self):
+        pending = list(self.steps)
+        while pending:
+            failed = []
+            for name, step in pending:
+                started = time.perf_counter()
+                attempts = self.status[name].get("attempts", 0) + 1
+                self.status[name] = {"state": "running", "attempts": attempts}
+                try:
+                    step()
+                    self.status[name] = {"state": "done", "attempts": attempts, "seconds": round(time.perf_counter() - started, 2)}
+                except Exception as e:
+                    logger.error(f"Warm-up step {name} failed (attempt {attempts}): {e}")
+                    self.status[name] = {"state": "failed", "attempts": attempts, "error": str(e).splitlines()[0]}
+                    failed.append((name, step))
+            pending = failed
+            if pending:
+                time.sleep(self.retry_delay)
+        self.finished_at = time.time()
+        logger.info(f"Warm-up finished in {self.finished_at - self.started_at:.1f} s")
+
+    @property
+    def complete(self):
+        return all(s["state"] == "done" for s in self.status.values())
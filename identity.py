@@ -0,0 +1,57 @@
+# who is making the current request: the Dh-User header set by the platform proxy,
+# matched against the dcp users table (cached with a TTL)
+
+import logging
+import threading
+import time
+import pandas as pd
+from flask import g, has_request_context, request
+from single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+USER_HEADER = "Dh-User"
+
+class UserDirectory:
+    def __init__(self, engine, table="users", key_column="email", ttl=600):
+        self.engine = engine
+        self.table = table
+        self.key_column = key_column
+        self.ttl = ttl
+        self.loaded_at = None
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+        self._by_key = {}
+
+    def refresh(self):
+        df = pd.read_sql_table(self.table, self.engine)
+        by_key = {}
+        if self.key_column in df.columns:
+            records = df.astype(object).where(df.notna(), None).to_dict("records")
+            by_key = {str(r[self.key_column]).strip().lower(): r for r in records if r[self.key_column]}
+        else:
+            logger.warning(f"{self.table} has no {self.key_column} column, users will not be matched")
+        with self._lock:
+            self._by_key = by_key
+            self.loaded_at = time.monotonic()
+
+    def get(self, user_id):
+        if self.loaded_at is None or time.monotonic() - self.loaded_at > self.ttl:
+            self._flight.do("refresh", self.refresh)
+        with self._lock:
+            return self._by_key.get(user_id.strip().lower())
+
+# Identity of the current request, resolved at most once per request and kept on flask.g
+def current_identity(directory):
+    if not has_request_context():
+        return None
+    if "identity" not in g:
+        user_id = (request.headers.get(USER_HEADER) or "").strip() or None
+        record = None
+        if user_id:
+            try:
+                record = directory.get(user_id)
+            except Exception as e:
+                logger.error(f"Could not look up user {user_id}: {e}")
+        g.identity = {"user_id": user_id, "user": record} if user_id else None
+    return g.identity
@@ -0,0 +1,100 @@
+# batch kit registration for POST api/kits (scanner station and scripts)
+#
+# Kits are validated and turned into sampleids exactly like the New modal, then
+# inserted through apply_sync_ops, so re-posting a kit that is already in the
+# table reports already_applied instead of failing. A client-supplied
+# Idempotency-Key additionally replays the stored response for a retried request
+# (sql/api_idempotency_keys.sql).
+
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import DateTime, bindparam, text
+from offline_sync import apply_sync_ops
+from storage import backend_for
+
+MAX_KIT_SAMPLERS = 10000
+IDEMPOTENCY_KEY_MAX_LENGTH = 200
+IDEMPOTENCY_KEY_TTL_DAYS = 7
+
+CLAIM_KEY = text("""
+    INSERT INTO api_idempotency_keys (key, request_hash)
+    VALUES (:key, :request_hash)
+    ON CONFLICT (key) DO NOTHING
+    RETURNING key
+""")
+STORED_RESPONSE = text("SELECT request_hash, response FROM api_idempotency_keys WHERE key = :key")
+EXPIRE_KEYS = text("DELETE FROM api_idempotency_keys WHERE created_at < :cutoff").bindparams(
+    bindparam("cutoff", type_=DateTime(timezone=True))
+)
+
+class KitRequestError(ValueError):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+# Turn {"kits": [{"kitid", "samplers": [{"samplerid", "sample_type"}]}]} into sync ops
+def kits_to_ops(payload):
+    if not isinstance(payload, dict) or not isinstance(payload.get("kits"), list):
+        raise KitRequestError("Expected a JSON object with a 'kits' list.")
+    ops = []
+    for kit in payload["kits"]:
+        if not isinstance(kit, dict) or not isinstance(kit.get("samplers"), list):
+            raise KitRequestError("Each kit needs a 'kitid' and a 'samplers' list.")
+        kitid = str(kit.get("kitid") or "").strip()
+        for sampler in kit["samplers"]:
+            if isinstance(sampler, str):
+                sampler = {"samplerid": sampler}
+            if not isinstance(sampler, dict):
+                raise KitRequestError("Each sampler is a samplerid or an object with 'samplerid' and 'sample_type'.")
+            samplerid = str(sampler.get("samplerid") or "").strip()
+            ops.append({
+                "opid": f"{kitid}/{samplerid}",
+                "original_sampleid": None,
+                "row": {"kitid": kitid, "samplerid": samplerid, "sample_type": sampler.get("sample_type") or ""},
+            })
+    if len(ops) > MAX_KIT_SAMPLERS:
+        raise KitRequestError(f"At most {MAX_KIT_SAMPLERS} samplers per request.", status=413)
+    return ops
+
+def request_hash(payload):
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+# Register kits on an open transaction, returns (response, applied rows, replayed)
+def register_kits(conn, payload, idempotency_key=None):
+    ops = kits_to_ops(payload)
+
+    if idempotency_key:
+        if len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            raise KitRequestError(f"Idempotency-Key is longer than {IDEMPOTENCY_KEY_MAX_LENGTH} characters.")
+        digest = request_hash(payload)
+        conn.execute(EXPIRE_KEYS, {"cutoff": datetime.now(timezone.utc) - timedelta(days=IDEMPOTENCY_KEY_TTL_DAYS)})
+        # Blocks while another request holding the same key is still running
+        if conn.execute(CLAIM_KEY, {"key": idempotency_key, "request_hash": digest}).first() is None:
+            stored = conn.execute(STORED_RESPONSE, {"key": idempotency_key}).mappings().first()
+            if stored["request_hash"] != digest:
+                raise KitRequestError("Idempotency-Key was already used for a different request.", status=422)
+            return backend_for(conn).load_response(stored["response"]), [], True
+
+    results, applied_rows = apply_sync_ops(conn, ops, {})
+    response = {"results": [], "counts": {"applied": 0, "already_applied": 0, "conflict": 0, "invalid": 0}}
+    for op, result in zip(ops, results_in_order(ops, results)):
+        response["results"].append({
+            "kitid": op["row"]["kitid"],
+            "samplerid": op["row"]["samplerid"],
+            "sampleid": result.get("sampleid"),
+            "status": result["status"],
+            "message": result.get("message"),
+        })
+        response["counts"][result["status"]] += 1
+
+    if idempotency_key:
+        conn.execute(backend_for(conn).store_response, {"key": idempotency_key, "response": json.dumps(response)})
+    return response, applied_rows, False
+
+# apply_sync_ops reports invalid ops first; put results back in request order
+def results_in_order(ops, results):
+    by_opid = {}
+    for result in results:
+        by_opid.setdefault(result["opid"], []).append(result)
+    return [by_opid[op["opid"]].pop(0) for op in ops]
@@ -0,0 +1,91 @@
+# kit status summary (per-site counts, open kits, overdue kits) from SQL aggregates
+#
+# Results are cached per pas_tracking snapshot version, so any write through the
+# app (in any worker) makes the next read recompute them.
+
+import logging
+import threading
+import time
+from datetime import date, timedelta
+import pandas as pd
+from sqlalchemy import Date, bindparam, text
+from storage import backend_for
+
+logger = logging.getLogger(__name__)
+
+OVERDUE_DAYS = 60
+
+# Date cutoffs are computed here rather than with date_trunc / CURRENT_DATE so the
+# same SQL runs on Postgres and on the embedded SQLite backend (storage.py)
+SITE_COUNTS_QUERY = text("""
+    SELECT
+        siteid,
+        COUNT(*) AS samples,
+        COUNT(*) FILTER (WHERE sample_start >= :quarter_start) AS samples_this_quarter,
+        COUNT(DISTINCT kitid) AS kits,
+        COUNT(DISTINCT kitid) FILTER (WHERE return_date IS NULL) AS open_kits
+    FROM pas_tracking
+    GROUP BY siteid
+    ORDER BY siteid NULLS LAST
+""").bindparams(bindparam("quarter_start", type_=Date))
+
+# {samplerids} is the backend's string aggregate (storage.py)
+OPEN_KITS_QUERY = """
+    SELECT
+        kitid,
+        MIN(shipped_location) AS shipped_location,
+        MIN(shipped_date) AS shipped_date,
+        COUNT(*) AS samplers,
+        {samplerids} AS samplerids,
+        MIN(shipped_date) < :overdue_before AS overdue
+    FROM pas_tracking
+    WHERE return_date IS NULL
+    GROUP BY kitid
+    ORDER BY MIN(shipped_date) NULLS LAST, kitid
+"""
+
+def quarter_start(day):
+    return date(day.year, 3 * ((day.month - 1) // 3) + 1, 1)
+
+class KitStatusSummary:
+    def __init__(self, engine, snapshot, overdue_days=OVERDUE_DAYS, max_age=300):
+        self.engine = engine
+        self.snapshot = snapshot  # TableSnapshot whose version tracks writes
+        self.overdue_days = overdue_days
+        self.backend = backend_for(engine)
+        self.open_kits_query = text(OPEN_KITS_QUERY.format(samplerids=self.backend.string_agg("samplerid"))).bindparams(
+            bindparam("overdue_before", type_=Date)
+        )
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._version = None
+        self._loaded_at = 0.0
+        self._summary = None
+
+    def refresh(self):
+        started = time.perf_counter()
+        today = date.today()
+        sites = pd.read_sql_query(SITE_COUNTS_QUERY, self.engine, params={"quarter_start": quarter_start(today)})
+        open_kits = pd.read_sql_query(
+            self.open_kits_query, self.engine, params={"overdue_before": today - timedelta(days=self.overdue_days)}
+        )
+        open_kits["samplerids"] = self.backend.sorted_lists(open_kits["samplerids"])
+        open_kits["overdue"] = open_kits["overdue"].fillna(False).astype(bool)
+        summary = {
+            "sites": sites,
+            "open_kits": open_kits,
+            "overdue_kits": open_kits[open_kits["overdue"]],
+            "computed_at": pd.Timestamp.now(),
+        }
+        logger.info(f"Kit summary refreshed in {(time.perf_counter() - started) * 1000:.0f} ms")
+        return summary
+
+    # Cached summary, recomputed when the table version changes or max_age passes
+    def get(self):
+        with self._lock:
+            version = self.snapshot.version()
+            if self._summary is None or self._version != version or time.monotonic() - self._loaded_at > self.max_age:
+                self._summary = self.refresh()
+                self._version = version
+                self._loaded_at = time.monotonic()
+            return self._summary
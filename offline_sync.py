@@ -0,0 +1,149 @@
+# applies the offline edit queue (assets/offlineQueue.js) to pas_tracking
+#
+# Each queued op carries the row as edited on the laptop and, for rows that came
+# from the database, the values it had when it was loaded ("base"). An op is
+#   - applied          when the database still holds the base values (or, for
+#                      new rows, the sampleid is free)
+#   - already_applied  when the database already holds the edited values, so
+#                      resending the same batch is harmless
+#   - conflict         when someone else changed or deleted the row meanwhile,
+#                      or the sampleid belongs to an archived kit
+#   - invalid          when the row fails the same checks as the upload button
+
+import re
+import pandas as pd
+from sqlalchemy import text
+from storage import backend_for, text_in
+from archive import archived_sampleids
+
+SYNC_COLUMNS = [
+    'sample_start', 'sample_end', 'kitid', 'samplerid', 'siteid', 'shipped_location',
+    'shipped_date', 'return_date', 'sample_type', 'note'
+]
+DATETIME_COLUMNS = ['sample_start', 'sample_end']
+DATE_COLUMNS = ['shipped_date', 'return_date']
+MAX_SYNC_OPS = 5000
+
+INSERT_ROW = text("""
+    INSERT INTO pas_tracking (sampleid, kitid, samplerid, sample_start, sample_end, siteid,
+                              shipped_location, shipped_date, return_date, sample_type, note)
+    VALUES (:sampleid, :kitid, :samplerid, :sample_start, :sample_end, :siteid,
+            :shipped_location, :shipped_date, :return_date, :sample_type, :note)
+""")
+
+UPDATE_ROW = text("""
+    UPDATE pas_tracking
+    SET
+        sampleid = :sampleid,
+        kitid = :kitid,
+        samplerid = :samplerid,
+        sample_start = :sample_start,
+        sample_end = :sample_end,
+        siteid = :siteid,
+        shipped_location = :shipped_location,
+        shipped_date = :shipped_date,
+        return_date = :return_date,
+        sample_type = :sample_type,
+        note = :note
+    WHERE sampleid = :old_sid
+""")
+
+# Bring grid values and database values to the same representation so they can be compared
+def normalize_row(row, siteid_map):
+    values = {}
+    for col in SYNC_COLUMNS:
+        val = row.get(col)
+        if isinstance(val, str):
+            val = val.strip() or None
+        if val is None or (not isinstance(val, str) and pd.isna(val)):
+            values[col] = None
+        elif col in DATETIME_COLUMNS:
+            values[col] = pd.Timestamp(val).strftime("%Y-%m-%d %H:%M")
+        elif col in DATE_COLUMNS:
+            values[col] = pd.Timestamp(val).strftime("%Y-%m-%d")
+        elif col == "siteid":
+            values[col] = siteid_map.get(val, val)
+        else:
+            values[col] = str(val)
+    return values
+
+def validate_row(values):
+    if not values["kitid"] or not re.fullmatch(r"EC-\d{4}", values["kitid"]):
+        return f"Invalid Kit ID '{values['kitid']}' (expected format EC-XXXX)"
+    if not values["samplerid"] or not re.fullmatch(r"ECCC\d{4}", values["samplerid"]):
+        return f"Invalid Sampler ID '{values['samplerid']}' (expected format ECCCXXXX)"
+    return None
+
+# Apply a batch of queued ops on an open transaction, returns (results, applied rows)
+def apply_sync_ops(conn, ops, siteid_map):
+    results = []
+    prepared = []
+    for op in ops:
+        opid = op.get("opid")
+        try:
+            values = normalize_row(op.get("row") or {}, siteid_map)
+            base = normalize_row(op["base"], siteid_map) if op.get("base") else None
+        except (ValueError, TypeError) as e:
+            results.append({"opid": opid, "status": "invalid", "message": f"Unreadable value: {e}"})
+            continue
+        problem = validate_row(values)
+        if problem:
+            results.append({"opid": opid, "status": "invalid", "message": problem})
+            continue
+        sampleid = f"{values['kitid']}_{values['samplerid']}"
+        prepared.append((opid, op.get("original_sampleid") or None, sampleid, values, base))
+
+    # Sample IDs of archived kits cannot be used again (sql/pas_tracking_archive.sql)
+    archived = archived_sampleids(conn, {p[2] for p in prepared if p[1] != p[2]})
+
+    # Lock every row the batch touches and read it once (on SQLite the database
+    # file lock serializes writers instead, see storage.py)
+    ids = {p[2] for p in prepared} | {p[1] for p in prepared if p[1]}
+    current = {}
+    if ids:
+        query = f"SELECT sampleid, {', '.join(SYNC_COLUMNS)} FROM pas_tracking WHERE sampleid IN :ids"
+        query += backend_for(conn).lock_rows
+        rows = conn.execute(text_in(query, "ids"), {"ids": sorted(ids)})
+        for r in rows.mappings():
+            current[r["sampleid"]] = normalize_row(r, {})
+
+    inserts, updates = [], []
+    for opid, original_sampleid, sampleid, values, base in prepared:
+        if sampleid in archived:
+            status, message = "conflict", f"{sampleid} is already used by an archived kit."
+        elif original_sampleid is None:
+            existing = current.get(sampleid)
+            if existing is None:
+                inserts.append({"sampleid": sampleid, **values})
+                current[sampleid] = values
+                status, message = "applied", None
+            elif existing == values:
+                status, message = "already_applied", None
+            else:
+                status, message = "conflict", f"{sampleid} already exists in the database with different values."
+        else:
+            existing = current.get(original_sampleid)
+            if existing is None:
+                if current.get(sampleid) == values:
+                    status, message = "already_applied", None
+                else:
+                    status, message = "conflict", f"{original_sampleid} was deleted from the database."
+            elif existing == values:
+                status, message = "already_applied", None
+            elif base is not None and existing != base:
+                status, message = "conflict", f"{original_sampleid} was changed in the database after it was loaded."
+            elif sampleid != original_sampleid and sampleid in current:
+                status, message = "conflict", f"{sampleid} already exists in the database."
+            else:
+                updates.append({"sampleid": sampleid, "old_sid": original_sampleid, **values})
+                del current[original_sampleid]
+                current[sampleid] = values
+                status, message = "applied", None
+        results.append({"opid": opid, "status": status, "sampleid": sampleid, "message": message})
+
+    if inserts:
+        conn.execute(INSERT_ROW, inserts)
+    if updates:
+        conn.execute(UPDATE_ROW, updates)
+
+    return results, inserts + updates
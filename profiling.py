@@ -0,0 +1,153 @@
+# opt-in cProfile capture of Dash callback requests, written to logs/profiles/
+#
+# Profiling is armed either per request (X-Profile: <PROFILE_TOKEN> header) or for
+# the next N callback requests in any worker (POST <prefix>api/profile?count=N with
+# the same token in X-Admin-Token). With PROFILE_TOKEN unset nothing is registered;
+# with it set, an unprofiled callback request costs one stat() of the arm file.
+# Callback bodies offloaded to the db_executor pool are profiled on their worker
+# thread (run_profiled) and merged into the request's profile.
+
+import contextvars
+import cProfile
+import fcntl
+import glob
+import hmac
+import io
+import logging
+import os
+import pstats
+import re
+import time
+from flask import g, jsonify, request
+
+logger = logging.getLogger(__name__)
+
+MAX_PROFILES = 50
+MAX_ARMED = 20
+
+# Set while a request is profiled; carried to the pool thread with the copied
+# context, collects the profiles of the jobs the request ran there
+_job_profiles = contextvars.ContextVar("job_profiles", default=None)
+
+# Run fn, under its own profiler when the request that submitted it is profiled
+def run_profiled(fn, *args, **kwargs):
+    profiles = _job_profiles.get()
+    if profiles is None:
+        return fn(*args, **kwargs)
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Python 3.12+ allows one active profiler, which already sees every thread
+        return fn(*args, **kwargs)
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        profiler.disable()
+        profiles.append(profiler)
+
+def _take_armed(arm_file):
+    if not os.path.exists(arm_file):
+        return False
+    try:
+        f = open(arm_file, "r+")
+    except FileNotFoundError:  # another worker took the last one
+        return False
+    with f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            remaining = int(f.read().strip() or 0)
+        except ValueError:
+            remaining = 0
+        if remaining <= 1:
+            os.remove(arm_file)
+        else:
+            f.seek(0)
+            f.truncate()
+            f.write(str(remaining - 1))
+        return remaining > 0
+
+def _callback_tag(payload):
+    output = (payload or {}).get("output") or "unknown"
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", output).strip("_.")[:80] or "callback"
+
+def _prune(profile_dir, keep):
+    files = sorted(glob.glob(os.path.join(profile_dir, "*.prof")), key=os.path.getmtime)
+    for path in files[:-keep] if len(files) > keep else []:
+        for stale in (path, path[:-len(".prof")] + ".txt"):
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+
+def configure_profiling(app, log_dir, max_profiles=MAX_PROFILES):
+    token = os.getenv("PROFILE_TOKEN")
+    if not token:
+        return
+    server = app.server
+    profile_dir = os.path.join(log_dir, "profiles")
+    os.makedirs(profile_dir, exist_ok=True)
+    arm_file = os.path.join(profile_dir, "armed")
+    callback_path = app.config.routes_pathname_prefix + "_dash-update-component"
+
+    @server.route(f"{app.config.routes_pathname_prefix}api/profile", methods=["POST"])
+    def arm_profiler():
+        if not hmac.compare_digest(request.headers.get("X-Admin-Token", ""), token):
+            return jsonify({"error": "Forbidden"}), 403
+        count = min(max(request.args.get("count", 1, type=int), 0), MAX_ARMED)
+        tmp = f"{arm_file}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            f.write(str(count))
+        os.replace(tmp, arm_file)
+        return jsonify({"armed": count, "profiles": profile_dir})
+
+    @server.before_request
+    def start_profile():
+        if request.path != callback_path or request.method != "POST":
+            return None
+        if not hmac.compare_digest(request.headers.get("X-Profile", ""), token) and not _take_armed(arm_file):
+            return None
+        g.profiler = cProfile.Profile()
+        g.job_profiles = []
+        _job_profiles.set(g.job_profiles)
+        g.profile_started = time.perf_counter()
+        g.profiler.enable()
+        return None
+
+    @server.after_request
+    def write_profile(response):
+        profiler = g.pop("profiler", None)
+        if profiler is None:
+            return response
+        profiler.disable()
+        _job_profiles.set(None)
+        jobs = g.pop("job_profiles", [])
+        elapsed_ms = (time.perf_counter() - g.profile_started) * 1000
+        payload = request.get_json(silent=True) or {}
+        inputs = payload.get("inputs") or []
+        state = payload.get("state") or []
+        name = (
+            f"{time.strftime('%Y%m%d-%H%M%S')}.{int(time.time() * 1000) % 1000:03d}_{os.getpid()}_{_callback_tag(payload)}"
+            f"_{request.content_length or 0}b_{int(elapsed_ms)}ms"
+        )
+        path = os.path.join(profile_dir, name)
+        try:
+            summary = io.StringIO()
+            summary.write(
+                f"callback: {payload.get('output')}\n"
+                f"inputs: {len(inputs)}, state: {len(state)}, request bytes: {request.content_length or 0}, "
+                f"response bytes: {response.calculate_content_length() or 0}, elapsed: {elapsed_ms:.1f} ms, "
+                f"pool jobs merged: {len(jobs)}\n\n"
+            )
+            stats = pstats.Stats(profiler, stream=summary)
+            for job in jobs:
+                stats.add(job)
+            stats.dump_stats(path + ".prof")
+            stats.sort_stats("cumulative").print_stats(40)
+            with open(path + ".txt", "w") as f:
+                f.write(summary.getvalue())
+            _prune(profile_dir, max_profiles)
+            logger.info(f"Profile written to {path}.prof")
+        except OSError as e:
+            logger.warning(f"Could not write profile {path}: {e}")
+        return response
@@ -0,0 +1,59 @@
+# coalescing of identical concurrent reads within a worker
+#
+# The first caller for a key runs the query; callers arriving while it is in
+# flight wait for it and share its result (or its exception) instead of sending
+# their own copy of the query to the database.
+
+import json
+import threading
+import pandas as pd
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.stats = {"executed": 0, "coalesced": 0}
+
+    # Returns (result, shared); shared is True when the result is also handed to other callers
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.stats["executed"] += 1
+            else:
+                call.waiters += 1
+                self.stats["coalesced"] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, call.waiters > 0
+
+shared_reads = SingleFlight()
+
+# pd.read_sql_query, coalesced per (database, query, params); every caller gets its own frame
+def read_sql_shared(query, engine, params=None):
+    key = (engine.url.render_as_string(hide_password=True), str(query), json.dumps(params, sort_keys=True, default=str))
+    df, shared = shared_reads.do(key, lambda: pd.read_sql_query(query, engine, params=params))
+    return df.copy() if shared else df
@@ -0,0 +1,99 @@
+# on-disk snapshot of a whole table, shared by every worker on the host
+#
+# The snapshot is tagged with a version number kept in <name>.version. Code that
+# writes to the table calls bump(); the next read in any worker sees the new
+# version and reloads. Snapshots are pickled to disk so restarted workers start
+# warm, and max_age bounds staleness from writes made outside this app.
+
+import fcntl
+import glob
+import logging
+import os
+import threading
+import time
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+class TableSnapshot:
+    def __init__(self, engine, query, cache_dir, name, max_age=300, transform=None):
+        self.engine = engine
+        self.query = query
+        self.transform = transform  # applied once per load, before the snapshot is written
+        self.cache_dir = cache_dir
+        self.name = name
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._version = None
+        self._df = None
+        self._loaded_at = 0.0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, suffix):
+        return os.path.join(self.cache_dir, f"{self.name}{suffix}")
+
+    def version(self):
+        try:
+            with open(self._path(".version")) as f:
+                return int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    # Version, age and size of the copy this worker holds (None before the first read)
+    def status(self):
+        if self._df is None:
+            return None
+        return {"version": self._version, "age_s": round(time.time() - self._loaded_at, 1), "rows": len(self._df)}
+
+    # Call after every committed write to the table
+    def bump(self):
+        with open(self._path(".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            version = self.version() + 1
+            tmp = self._path(f".version.{os.getpid()}.tmp")
+            with open(tmp, "w") as f:
+                f.write(str(version))
+            os.replace(tmp, self._path(".version"))
+        for old in glob.glob(self._path(".*.pkl")):
+            if old != self._path(f".{version}.pkl"):
+                try:
+                    os.remove(old)
+                except OSError:
+                    pass
+        logger.info(f"{self.name} snapshot version bumped to {version}")
+        return version
+
+    # Current table contents; pass copy=False only if the caller never modifies the frame
+    def read(self, copy=True):
+        with self._lock:
+            version = self.version()
+            now = time.time()
+            if self._df is not None and self._version == version and now - self._loaded_at < self.max_age:
+                return self._df.copy() if copy else self._df
+
+            data_path = self._path(f".{version}.pkl")
+            df = None
+            if os.path.exists(data_path) and now - os.path.getmtime(data_path) < self.max_age:
+                try:
+                    df = pd.read_pickle(data_path)
+                    loaded_at = os.path.getmtime(data_path)
+                    logger.info(f"{self.name} snapshot v{version} loaded from disk")
+                except Exception as e:
+                    logger.warning(f"Discarding unreadable {self.name} snapshot: {e}")
+                    df = None
+
+            if df is None:
+                df = pd.read_sql_query(self.query, self.engine)
+                if self.transform is not None:
+                    df = self.transform(df)
+                loaded_at = now
+                tmp = self._path(f".{version}.{os.getpid()}.tmp")
+                try:
+                    df.to_pickle(tmp)
+                    os.replace(tmp, data_path)
+                except OSError as e:
+                    logger.warning(f"Could not write {self.name} snapshot: {e}")
+                logger.info(f"{self.name} snapshot v{version} loaded from database ({len(df)} rows)")
+
+            self._df, self._version, self._loaded_at = df, version, loaded_at
+            return df.copy() if copy else df
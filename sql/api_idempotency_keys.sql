@@ -0,0 +1,12 @@
+-- Stored responses for POST api/kits, keyed by the client's Idempotency-Key (run once against mercury_passive)
+
+CREATE TABLE IF NOT EXISTS api_idempotency_keys (
+    key          text PRIMARY KEY,
+    request_hash text NOT NULL,
+    response     jsonb,
+    created_at   timestamptz NOT NULL DEFAULT now()
+);
+
+-- Keys only need to outlive client retries
+CREATE INDEX IF NOT EXISTS api_idempotency_keys_created_at_idx
+    ON api_idempotency_keys (created_at);
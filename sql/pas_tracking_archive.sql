@@ -0,0 +1,37 @@
+-- Cold storage for completed shipments, partitioned by year of return_date
+-- (run once against mercury_passive, after pas_tracking_modified_at.sql if you use it;
+-- yearly partitions are created by `python archive.py` as needed)
+--
+-- pas_tracking keeps open and recently returned kits, so the app's default
+-- queries only touch hot rows. pas_tracking_all is the explicit "include archive" view.
+
+CREATE TABLE IF NOT EXISTS pas_tracking_archive (LIKE pas_tracking INCLUDING DEFAULTS)
+    PARTITION BY RANGE (return_date);
+
+-- Not a unique index (a partitioned table cannot have one without return_date).
+-- sampleid stays unique across hot and archive because archive.py only moves
+-- rows out of pas_tracking, and the trigger below refuses hot rows whose
+-- sampleid is already archived.
+CREATE INDEX IF NOT EXISTS pas_tracking_archive_sampleid_idx ON pas_tracking_archive (sampleid);
+CREATE INDEX IF NOT EXISTS pas_tracking_archive_kitid_idx ON pas_tracking_archive (kitid);
+CREATE INDEX IF NOT EXISTS pas_tracking_archive_samplerid_idx ON pas_tracking_archive (samplerid);
+
+CREATE OR REPLACE FUNCTION pas_tracking_refuse_archived_sampleid() RETURNS trigger AS $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pas_tracking_archive WHERE sampleid = NEW.sampleid) THEN
+        RAISE EXCEPTION 'Sample ID % is already used by an archived kit', NEW.sampleid
+            USING ERRCODE = 'unique_violation';
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS pas_tracking_refuse_archived_sampleid ON pas_tracking;
+CREATE TRIGGER pas_tracking_refuse_archived_sampleid
+    BEFORE INSERT OR UPDATE OF sampleid ON pas_tracking
+    FOR EACH ROW EXECUTE FUNCTION pas_tracking_refuse_archived_sampleid();
+
+CREATE OR REPLACE VIEW pas_tracking_all AS
+    SELECT * FROM pas_tracking
+    UNION ALL
+    SELECT * FROM pas_tracking_archive;
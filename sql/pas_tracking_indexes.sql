@@ -0,0 +1,9 @@
+-- Indexes backing the lookups in app.py (run once against mercury_passive)
+
+-- "Most recent kit for sampler" (CURRENT_KIT_FOR_SAMPLER_QUERY)
+CREATE INDEX IF NOT EXISTS pas_tracking_samplerid_idx
+    ON pas_tracking (samplerid, (return_date IS NULL) DESC, shipped_date DESC NULLS LAST);
+
+-- Loading every row of a kit
+CREATE INDEX IF NOT EXISTS pas_tracking_kitid_idx
+    ON pas_tracking (kitid);
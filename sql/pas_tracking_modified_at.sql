@@ -0,0 +1,19 @@
+-- Last-modified timestamp for pas_tracking, used by GET api/tracking?modified_since= (run once against mercury_passive)
+
+ALTER TABLE pas_tracking
+    ADD COLUMN IF NOT EXISTS modified_at timestamptz NOT NULL DEFAULT now();
+
+CREATE OR REPLACE FUNCTION pas_tracking_touch_modified_at() RETURNS trigger AS $$
+BEGIN
+    NEW.modified_at := now();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS pas_tracking_modified_at ON pas_tracking;
+CREATE TRIGGER pas_tracking_modified_at
+    BEFORE UPDATE ON pas_tracking
+    FOR EACH ROW EXECUTE FUNCTION pas_tracking_touch_modified_at();
+
+CREATE INDEX IF NOT EXISTS pas_tracking_modified_at_idx
+    ON pas_tracking (modified_at);
@@ -0,0 +1,51 @@
+-- Tables for the embedded backend (STORAGE_BACKEND=sqlite), created by storage.py on first use.
+-- Same columns as the Postgres tables the app reads; `python storage.py pull` replaces
+-- stations and users with the dcp tables as they are.
+
+CREATE TABLE IF NOT EXISTS pas_tracking (
+    sampleid             text PRIMARY KEY,
+    sample_start         timestamp,
+    sample_end           timestamp,
+    kitid                text,
+    samplerid            text,
+    siteid               text,
+    shipped_location     text,
+    shipped_date         date,
+    return_date          date,
+    sample_type          text,
+    note                 text,
+    screen_sampling_rate real,
+    modified_at          timestamp NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now'))
+);
+
+-- Same as pas_tracking_modified_at.sql; recursive_triggers is off, so the UPDATE does not re-fire it
+CREATE TRIGGER IF NOT EXISTS pas_tracking_modified_at
+    AFTER UPDATE ON pas_tracking
+    FOR EACH ROW WHEN NEW.modified_at = OLD.modified_at
+BEGIN
+    UPDATE pas_tracking SET modified_at = strftime('%Y-%m-%d %H:%M:%f', 'now') WHERE sampleid = NEW.sampleid;
+END;
+
+CREATE INDEX IF NOT EXISTS pas_tracking_samplerid_idx ON pas_tracking (samplerid);
+CREATE INDEX IF NOT EXISTS pas_tracking_kitid_idx ON pas_tracking (kitid);
+CREATE INDEX IF NOT EXISTS pas_tracking_modified_at_idx ON pas_tracking (modified_at);
+
+CREATE TABLE IF NOT EXISTS stations (
+    siteid      text PRIMARY KEY,
+    description text,
+    projectid   text
+);
+
+CREATE TABLE IF NOT EXISTS users (
+    email text PRIMARY KEY,
+    name  text
+);
+
+CREATE TABLE IF NOT EXISTS api_idempotency_keys (
+    key          text PRIMARY KEY,
+    request_hash text NOT NULL,
+    response     text,
+    created_at   timestamp NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now'))
+);
+
+CREATE INDEX IF NOT EXISTS api_idempotency_keys_created_at_idx ON api_idempotency_keys (created_at);
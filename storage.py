@@ -0,0 +1,238 @@
+# where the app's tables live: the dcp and mercury_passive Postgres databases, or
+# one embedded SQLite file
+#
+# STORAGE_BACKEND=postgres (the default) is the deployed setup. With
+# STORAGE_BACKEND=sqlite, pas_tracking, stations, users and api_idempotency_keys
+# live in SQLITE_PATH, which is created from sql/sqlite_schema.sql on first use.
+# That is for local runs, laptops without the VPN and benchmarks. Both backends
+# expose the same three engines, so the app's reads and bulk writes (read_sql,
+# to_sql, executemany) run unchanged on either; SQL shared by both sticks to what
+# both dialects accept (list parameters go through text_in). The few statements
+# that differ live on the backend classes below; modules look them up with
+# backend_for(engine or connection) rather than checking the dialect themselves.
+#
+# Run from the app directory (same .env as the app):
+#   python storage.py pull   copy stations, users and pas_tracking from Postgres into SQLITE_PATH
+#   python storage.py push   send rows added or changed in SQLITE_PATH since the pull to Postgres
+
+import argparse
+import json
+import logging
+import os
+import pandas as pd
+from sqlalchemy import bindparam, create_engine, event, inspect, text
+
+logger = logging.getLogger(__name__)
+
+POSTGRES = "postgres"
+SQLITE = "sqlite"
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sql", "sqlite_schema.sql")
+PULLED_TABLE = "pas_tracking_pulled"  # pas_tracking as of the last pull, the base for push
+SQLITE_POOL_SIZE = 5      # SQLAlchemy's QueuePool defaults, set explicitly so /readyz
+SQLITE_MAX_OVERFLOW = 10  # knows the capacity of the single SQLite engine
+
+# text() whose list parameters render as "IN (...)" on either backend
+def text_in(query, *list_params):
+    return text(query).bindparams(*(bindparam(name, expanding=True) for name in list_params))
+
+class PostgresStorage:
+    name = POSTGRES
+    dialect = "postgresql"
+    snapshot_name = "pas_tracking"
+    has_archive = True        # pas_tracking_archive / pas_tracking_all, when installed (archive.py)
+    lock_rows = " FOR UPDATE"  # appended to a SELECT to lock the rows a write batch reads
+    store_response = text("UPDATE api_idempotency_keys SET response = CAST(:response AS jsonb) WHERE key = :key")
+
+    # viewer and editor are (user, password); reads use the viewer account
+    # (optionally on a replica), writes the editor account, each with its own pool
+    def __init__(self, server, viewer, editor, settings):
+        self.settings = settings
+        # configured pool overflow, for the pool utilization in /readyz (dcp uses the read pool settings)
+        self.read_max_overflow = settings["read_max_overflow"]
+        self.write_max_overflow = settings["write_max_overflow"]
+        self.dcp_engine = self._engine(
+            *viewer, settings["read_server"], 'dcp',
+            settings["read_pool_size"], settings["read_max_overflow"]
+        )
+        self.read_engine = self._engine(
+            *viewer, settings["read_server"], 'mercury_passive',
+            settings["read_pool_size"], settings["read_max_overflow"]
+        )
+        self.write_engine = self._engine(
+            *editor, server, 'mercury_passive',
+            settings["write_pool_size"], settings["write_max_overflow"]
+        )
+
+    def _engine(self, user, password, server, database, pool_size, max_overflow):
+        engine_string = ('postgresql://{}:{}@{}/{}?sslmode=require').format(user, password, server, database)
+        connect_args = {}
+        if self.settings["statement_timeout_ms"]:
+            connect_args["options"] = f"-c statement_timeout={self.settings['statement_timeout_ms']}"
+        return create_engine(
+            engine_string,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_pre_ping=True,
+            pool_recycle=self.settings["pool_recycle"],
+            connect_args=connect_args
+        )
+
+    # "a, b, c" of column's values in each group, sorted
+    @staticmethod
+    def string_agg(column):
+        return f"string_agg({column}, ', ' ORDER BY {column})"
+
+    # Lists as string_agg returned them (already sorted here)
+    @staticmethod
+    def sorted_lists(lists):
+        return lists
+
+    # api_idempotency_keys.response as stored by store_response (jsonb arrives decoded)
+    @staticmethod
+    def load_response(response):
+        return response
+
+def _sqlite_pragmas(dbapi_conn, _):
+    cursor = dbapi_conn.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")  # readers do not wait for the writer
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+class SQLiteStorage:
+    name = SQLITE
+    dialect = "sqlite"
+    snapshot_name = "pas_tracking_sqlite"  # separate cache/ snapshot from the Postgres one
+    has_archive = False
+    lock_rows = ""  # no row locks, writers are serialized by the database file lock
+    store_response = text("UPDATE api_idempotency_keys SET response = :response WHERE key = :key")
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        engine = create_engine(
+            f"sqlite:///{path}",
+            pool_size=SQLITE_POOL_SIZE,
+            max_overflow=SQLITE_MAX_OVERFLOW,
+            connect_args={"timeout": 30, "check_same_thread": False}
+        )
+        event.listen(engine, "connect", _sqlite_pragmas)
+        with open(SCHEMA_FILE) as f:
+            schema = f.read()
+        with engine.connect() as conn:
+            conn.connection.driver_connection.executescript(schema)
+        self.path = path
+        self.dcp_engine = self.read_engine = self.write_engine = engine
+        self.read_max_overflow = self.write_max_overflow = SQLITE_MAX_OVERFLOW
+
+    # SQLite before 3.44 has no ORDER BY inside group_concat; sorted_lists sorts afterwards
+    @staticmethod
+    def string_agg(column):
+        return f"group_concat({column}, ', ')"
+
+    @staticmethod
+    def sorted_lists(lists):
+        return lists.map(lambda ids: ", ".join(sorted(ids.split(", "))) if isinstance(ids, str) else ids)
+
+    # response is a text column here
+    @staticmethod
+    def load_response(response):
+        return json.loads(response) if isinstance(response, str) else response
+
+BACKENDS = {backend.dialect: backend for backend in (PostgresStorage, SQLiteStorage)}
+
+# Backend class of an engine or connection, for the statements that differ between them
+def backend_for(bind):
+    return BACKENDS[bind.dialect.name]
+
+def open_storage(settings, server=None, viewer=None, editor=None):
+    backend = settings["backend"]
+    if backend == SQLITE:
+        logger.info(f"Using embedded storage at {settings['sqlite_path']}")
+        return SQLiteStorage(settings["sqlite_path"])
+    if backend != POSTGRES:
+        raise ValueError(f"Unknown STORAGE_BACKEND '{backend}' (expected '{POSTGRES}' or '{SQLITE}')")
+    return PostgresStorage(server, viewer, editor, settings)
+
+# Replace the local copy with the current Postgres data, returns the number of pas_tracking rows
+def pull(remote, local):
+    from offline_sync import SYNC_COLUMNS
+
+    stations = pd.read_sql_query("SELECT * FROM stations", remote.dcp_engine)
+    users = pd.read_sql_query("SELECT * FROM users", remote.dcp_engine)
+    tracking = pd.read_sql_query("SELECT * FROM pas_tracking", remote.read_engine)
+
+    with local.write_engine.begin() as conn:
+        columns = [c["name"] for c in inspect(conn).get_columns("pas_tracking")]
+        stations.to_sql("stations", conn, if_exists="replace", index=False)
+        users.to_sql("users", conn, if_exists="replace", index=False)
+        conn.execute(text("DELETE FROM pas_tracking"))
+        tracking[[c for c in tracking.columns if c in columns]].to_sql("pas_tracking", conn, if_exists="append", index=False)
+        tracking[["sampleid"] + SYNC_COLUMNS].to_sql(PULLED_TABLE, conn, if_exists="replace", index=False)
+    return len(tracking)
+
+# Send local inserts and edits made since the pull, with the pulled values as the
+# base so rows changed in Postgres meanwhile come back as conflicts.
+# Returns (apply_sync_ops results, sampleids removed or renamed locally, which are not sent)
+def push(local, remote):
+    from offline_sync import SYNC_COLUMNS, apply_sync_ops, normalize_row
+
+    columns = ", ".join(["sampleid"] + SYNC_COLUMNS)
+    with local.read_engine.connect() as conn:
+        if not inspect(conn).has_table(PULLED_TABLE):
+            raise RuntimeError("Nothing was pulled into this database yet, run `python storage.py pull` first.")
+        current = pd.read_sql_query(f"SELECT {columns} FROM pas_tracking", conn)
+        pulled = pd.read_sql_query(f"SELECT {columns} FROM {PULLED_TABLE}", conn)
+
+    bases = {r["sampleid"]: r for r in pulled.astype(object).where(pulled.notna(), None).to_dict("records")}
+    ops = []
+    for row in current.astype(object).where(current.notna(), None).to_dict("records"):
+        base = bases.pop(row["sampleid"], None)
+        if base is not None and normalize_row(base, {}) == normalize_row(row, {}):
+            continue
+        ops.append({"opid": row["sampleid"], "original_sampleid": row["sampleid"] if base else None, "row": row, "base": base})
+
+    with remote.write_engine.begin() as conn:
+        results, _ = apply_sync_ops(conn, ops, {})
+
+    # What Postgres now holds becomes the base for the next push
+    synced = [r["sampleid"] for r in results if r["status"] in ("applied", "already_applied")]
+    if synced:
+        with local.write_engine.begin() as conn:
+            conn.execute(text_in(f"DELETE FROM {PULLED_TABLE} WHERE sampleid IN :ids", "ids"), {"ids": synced})
+            current[current["sampleid"].isin(synced)].to_sql(PULLED_TABLE, conn, if_exists="append", index=False)
+    return results, sorted(bases)
+
+def main():
+    from credentials import get_credentials, get_engine_settings
+    from snapshot_cache import TableSnapshot
+
+    parser = argparse.ArgumentParser(description="Copy data between Postgres and the embedded SQLite database.")
+    parser.add_argument("command", choices=["pull", "push"])
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    parent_dir = os.getcwd()
+    _, server, viewer_user, viewer_password, editor_user, editor_password, _, _ = get_credentials(parent_dir)
+    if not all([server, viewer_user, viewer_password, editor_user, editor_password]):
+        raise SystemExit("pull and push need the Postgres settings (SERVER, VIEWER_*, EDITOR_*) in .env")
+    settings = get_engine_settings(server)
+    remote = PostgresStorage(server, (viewer_user, viewer_password), (editor_user, editor_password), settings)
+    local = SQLiteStorage(settings["sqlite_path"])
+
+    if args.command == "pull":
+        rows = pull(remote, local)
+        TableSnapshot(None, None, os.path.join(parent_dir, 'cache'), local.snapshot_name).bump()
+        logger.info(f"Pulled {rows} pas_tracking rows into {local.path}")
+        return
+
+    results, not_sent = push(local, remote)
+    counts = {}
+    for result in results:
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+        if result["status"] in ("conflict", "invalid"):
+            logger.warning(f"{result.get('sampleid') or result['opid']}: {result['message']}")
+    logger.info(f"Pushed {len(results)} rows: {counts or 'nothing changed'}")
+    if not_sent:
+        logger.warning(f"Removed or renamed locally, not pushed: {', '.join(not_sent)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+# shared fixtures: a fresh embedded (SQLite) database per test, and app.py
+# imported once against its own empty one (STORAGE_BACKEND=sqlite, see storage.py)
+
+import os
+import sys
+import pytest
+from sqlalchemy import text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from storage import SQLiteStorage
+
+@pytest.fixture
+def storage(tmp_path):
+    return SQLiteStorage(str(tmp_path / "sampletrack.db"))
+
+@pytest.fixture
+def engine(storage):
+    return storage.write_engine
+
+# Insert pas_tracking rows given as dicts (missing columns are NULL)
+@pytest.fixture
+def insert_rows(engine):
+    def insert(rows):
+        with engine.begin() as conn:
+            for row in rows:
+                conn.execute(
+                    text(f"INSERT INTO pas_tracking ({', '.join(row)}) VALUES ({', '.join(':' + c for c in row)})"),
+                    row
+                )
+    return insert
+
+@pytest.fixture(scope="session")
+def app_module(tmp_path_factory):
+    workdir = tmp_path_factory.mktemp("app")
+    patch = pytest.MonkeyPatch()
+    for name in ("SERVER", "VIEWER_USER", "VIEWER_PASSWORD", "EDITOR_USER", "EDITOR_PASSWORD", "DATABASE"):
+        patch.delenv(name, raising=False)
+    patch.setenv("COMPUTER", "test")
+    patch.setenv("URL_PREFIX", "/")
+    patch.setenv("STORAGE_BACKEND", "sqlite")
+    patch.setenv("SQLITE_PATH", str(workdir / "app.db"))
+    # app.py writes logs/ and cache/ under the working directory
+    patch.chdir(workdir)
+    import app
+    yield app
+    patch.undo()
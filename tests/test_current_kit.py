@@ -0,0 +1,27 @@
+# CURRENT_KIT_FOR_SAMPLER_QUERY: the shipment a Sampler ID search loads
+
+import pandas as pd
+
+def current_kit(app_module, engine, samplerid):
+    df = pd.read_sql_query(app_module.CURRENT_KIT_FOR_SAMPLER_QUERY, engine, params={"samplerid": samplerid})
+    return df["sampleid"].tolist()
+
+def test_open_kit_comes_first(app_module, engine, insert_rows):
+    insert_rows([
+        {"sampleid": "EC-0001_ECCC0001", "kitid": "EC-0001", "samplerid": "ECCC0001", "shipped_date": "2024-06-01", "return_date": "2024-07-01"},
+        {"sampleid": "EC-0002_ECCC0001", "kitid": "EC-0002", "samplerid": "ECCC0001", "shipped_date": "2024-01-01"},
+        {"sampleid": "EC-0002_ECCC0002", "kitid": "EC-0002", "samplerid": "ECCC0002", "shipped_date": "2024-01-01"},
+    ])
+    assert current_kit(app_module, engine, "ECCC0001") == ["EC-0002_ECCC0001", "EC-0002_ECCC0002"]
+
+def test_reused_kit_id_returns_only_the_current_shipment(app_module, engine, insert_rows):
+    insert_rows([
+        # EC-0001's first trip, returned
+        {"sampleid": "EC-0001_ECCC0009", "kitid": "EC-0001", "samplerid": "ECCC0009", "shipped_date": "2023-03-01", "return_date": "2023-04-01"},
+        {"sampleid": "EC-0001_ECCC0008", "kitid": "EC-0001", "samplerid": "ECCC0008", "shipped_date": "2023-03-01", "return_date": "2023-04-01"},
+        # the same kit shipped again, not back yet and not given a shipped date
+        {"sampleid": "EC-0001_ECCC0001", "kitid": "EC-0001", "samplerid": "ECCC0001"},
+        {"sampleid": "EC-0001_ECCC0002", "kitid": "EC-0001", "samplerid": "ECCC0002"},
+    ])
+    assert current_kit(app_module, engine, "ECCC0001") == ["EC-0001_ECCC0001", "EC-0001_ECCC0002"]
+    assert current_kit(app_module, engine, "ECCC0009") == ["EC-0001_ECCC0008", "EC-0001_ECCC0009"]
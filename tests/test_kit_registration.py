@@ -0,0 +1,74 @@
+# register_kits: batch registration and Idempotency-Key replay
+
+from datetime import datetime, timedelta, timezone
+import pytest
+from sqlalchemy import text
+from kit_registration import IDEMPOTENCY_KEY_TTL_DAYS, KitRequestError, register_kits
+
+KITS = {"kits": [{"kitid": "EC-0001", "samplers": ["ECCC0001", {"samplerid": "ECCC0002", "sample_type": "Blank"}]}]}
+
+def register(engine, payload, key=None):
+    with engine.begin() as conn:
+        return register_kits(conn, payload, key)
+
+def stored_keys(engine):
+    with engine.connect() as conn:
+        return [r[0] for r in conn.execute(text("SELECT key FROM api_idempotency_keys ORDER BY key"))]
+
+def test_registers_every_sampler(engine):
+    response, applied, replayed = register(engine, KITS)
+    assert response["counts"] == {"applied": 2, "already_applied": 0, "conflict": 0, "invalid": 0}
+    assert [r["sampleid"] for r in response["results"]] == ["EC-0001_ECCC0001", "EC-0001_ECCC0002"]
+    assert len(applied) == 2 and not replayed
+
+def test_reposting_without_key_reports_already_applied(engine):
+    register(engine, KITS)
+    response, applied, replayed = register(engine, KITS)
+    assert response["counts"]["already_applied"] == 2
+    assert applied == [] and not replayed
+
+def test_results_keep_request_order_with_invalid_samplers(engine):
+    payload = {"kits": [{"kitid": "EC-0001", "samplers": ["ECCC0001", "bad", "ECCC0002"]}]}
+    response, _, _ = register(engine, payload)
+    assert [r["status"] for r in response["results"]] == ["applied", "invalid", "applied"]
+
+def test_same_key_replays_stored_response(engine):
+    first, _, _ = register(engine, KITS, "key-1")
+    second, applied, replayed = register(engine, KITS, "key-1")
+    assert replayed and applied == []
+    assert second == first
+    assert second["counts"]["applied"] == 2
+
+def test_same_key_with_different_body_is_rejected(engine):
+    register(engine, KITS, "key-1")
+    other = {"kits": [{"kitid": "EC-0002", "samplers": ["ECCC0003"]}]}
+    with pytest.raises(KitRequestError) as e:
+        register(engine, other, "key-1")
+    assert e.value.status == 422
+
+def test_expired_keys_are_removed_and_can_be_reused(engine):
+    register(engine, KITS, "old-key")
+    expired = datetime.now(timezone.utc) - timedelta(days=IDEMPOTENCY_KEY_TTL_DAYS + 1)
+    with engine.begin() as conn:
+        conn.execute(
+            text("UPDATE api_idempotency_keys SET created_at = :created_at WHERE key = 'old-key'"),
+            {"created_at": expired.strftime("%Y-%m-%d %H:%M:%S")}
+        )
+
+    register(engine, {"kits": [{"kitid": "EC-0002", "samplers": ["ECCC0003"]}]}, "new-key")
+    assert stored_keys(engine) == ["new-key"]
+
+    # the expired key is free again, even for a different body
+    response, _, replayed = register(engine, {"kits": [{"kitid": "EC-0003", "samplers": ["ECCC0004"]}]}, "old-key")
+    assert not replayed and response["counts"]["applied"] == 1
+
+def test_fresh_keys_are_kept(engine):
+    register(engine, KITS, "key-1")
+    register(engine, {"kits": [{"kitid": "EC-0002", "samplers": ["ECCC0003"]}]}, "key-2")
+    assert stored_keys(engine) == ["key-1", "key-2"]
+
+@pytest.mark.parametrize("payload", [None, {}, {"kits": "EC-0001"}, {"kits": [{"kitid": "EC-0001"}]}])
+def test_malformed_requests_are_rejected(engine, payload):
+    with pytest.raises(KitRequestError) as e:
+        register(engine, payload)
+    assert e.value.status == 400
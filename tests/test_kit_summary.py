@@ -0,0 +1,21 @@
+# KitStatusSummary: open and overdue kits from SQL aggregates on the embedded backend
+
+from datetime import date, timedelta
+from kit_summary import KitStatusSummary
+
+def test_open_kits_list_samplerids_sorted(engine, insert_rows):
+    shipped = date.today() - timedelta(days=90)
+    insert_rows([
+        {"sampleid": "EC-0002_ECCC0003", "kitid": "EC-0002", "samplerid": "ECCC0003", "siteid": "A", "shipped_date": shipped},
+        {"sampleid": "EC-0002_ECCC0001", "kitid": "EC-0002", "samplerid": "ECCC0001", "siteid": "A", "shipped_date": shipped},
+        {"sampleid": "EC-0002_ECCC0002", "kitid": "EC-0002", "samplerid": "ECCC0002", "siteid": "A", "shipped_date": shipped},
+        {"sampleid": "EC-0001_ECCC0004", "kitid": "EC-0001", "samplerid": "ECCC0004", "siteid": "B",
+         "shipped_date": shipped, "return_date": date.today()},
+    ])
+    summary = KitStatusSummary(engine, snapshot=None).refresh()
+
+    open_kits = summary["open_kits"]
+    assert open_kits["kitid"].tolist() == ["EC-0002"]
+    assert open_kits["samplerids"].tolist() == ["ECCC0001, ECCC0002, ECCC0003"]
+    assert summary["overdue_kits"]["kitid"].tolist() == ["EC-0002"]
+    assert dict(zip(summary["sites"]["siteid"], summary["sites"]["open_kits"])) == {"A": 1, "B": 0}
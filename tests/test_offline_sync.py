@@ -0,0 +1,101 @@
+# apply_sync_ops: outcome of each queued op against the current table
+
+import pandas as pd
+from offline_sync import apply_sync_ops
+
+ROW = {"kitid": "EC-0001", "samplerid": "ECCC0001", "sample_type": "Sample", "shipped_location": "Alert"}
+
+def sync(engine, ops, siteid_map=None):
+    with engine.begin() as conn:
+        return apply_sync_ops(conn, ops, siteid_map or {})
+
+def table(engine):
+    return pd.read_sql_query("SELECT sampleid, shipped_location, note FROM pas_tracking ORDER BY sampleid", engine)
+
+def new_op(opid="1", **row):
+    return {"opid": opid, "original_sampleid": None, "row": {**ROW, **row}}
+
+def edit_op(base, opid="1", original_sampleid="EC-0001_ECCC0001", **changes):
+    return {"opid": opid, "original_sampleid": original_sampleid, "row": {**base, **changes}, "base": base}
+
+def test_new_row_is_inserted(engine):
+    results, applied = sync(engine, [new_op()])
+    assert results == [{"opid": "1", "status": "applied", "sampleid": "EC-0001_ECCC0001", "message": None}]
+    assert [r["sampleid"] for r in applied] == ["EC-0001_ECCC0001"]
+    assert table(engine)["sampleid"].tolist() == ["EC-0001_ECCC0001"]
+
+def test_resending_a_batch_is_already_applied(engine):
+    sync(engine, [new_op()])
+    results, applied = sync(engine, [new_op()])
+    assert results[0]["status"] == "already_applied"
+    assert applied == []
+
+def test_new_row_with_taken_sampleid_is_a_conflict(engine):
+    sync(engine, [new_op()])
+    results, applied = sync(engine, [new_op(note="different")])
+    assert results[0]["status"] == "conflict"
+    assert "already exists" in results[0]["message"]
+    assert applied == []
+
+def test_invalid_ids_are_reported_and_skipped(engine):
+    results, applied = sync(engine, [new_op("bad-kit", kitid="EC-1"), new_op("bad-sampler", samplerid="XX"), new_op("ok")])
+    status = {r["opid"]: r["status"] for r in results}
+    assert status == {"bad-kit": "invalid", "bad-sampler": "invalid", "ok": "applied"}
+    assert "EC-XXXX" in next(r["message"] for r in results if r["opid"] == "bad-kit")
+    assert len(applied) == 1
+
+def test_unreadable_date_is_invalid(engine):
+    results, _ = sync(engine, [new_op(shipped_date="not a date")])
+    assert results[0]["status"] == "invalid"
+    assert results[0]["message"].startswith("Unreadable value")
+
+def test_edit_of_unchanged_row_is_applied(engine):
+    sync(engine, [new_op()])
+    results, _ = sync(engine, [edit_op(ROW, shipped_location="Saturna")])
+    assert results[0]["status"] == "applied"
+    assert table(engine)["shipped_location"].tolist() == ["Saturna"]
+
+def test_edit_of_row_changed_meanwhile_is_a_conflict(engine):
+    sync(engine, [new_op()])
+    sync(engine, [edit_op(ROW, note="someone else")])
+    results, applied = sync(engine, [edit_op(ROW, shipped_location="Saturna")])
+    assert results[0]["status"] == "conflict"
+    assert "changed in the database" in results[0]["message"]
+    assert applied == []
+    assert table(engine)["shipped_location"].tolist() == ["Alert"]
+
+def test_edit_matching_database_is_already_applied(engine):
+    sync(engine, [new_op()])
+    sync(engine, [edit_op(ROW, shipped_location="Saturna")])
+    results, _ = sync(engine, [edit_op(ROW, shipped_location="Saturna")])
+    assert results[0]["status"] == "already_applied"
+
+def test_edit_of_deleted_row_is_a_conflict(engine):
+    results, _ = sync(engine, [edit_op(ROW, shipped_location="Saturna")])
+    assert results[0]["status"] == "conflict"
+    assert "was deleted" in results[0]["message"]
+
+def test_rename_onto_existing_sampleid_is_a_conflict(engine):
+    sync(engine, [new_op("a"), new_op("b", samplerid="ECCC0002")])
+    results, _ = sync(engine, [edit_op(ROW, samplerid="ECCC0002")])
+    assert results[0]["status"] == "conflict"
+    assert "EC-0001_ECCC0002 already exists" in results[0]["message"]
+
+def test_rename_moves_the_row(engine):
+    sync(engine, [new_op()])
+    results, _ = sync(engine, [edit_op(ROW, samplerid="ECCC0003")])
+    assert results[0] == {"opid": "1", "status": "applied", "sampleid": "EC-0001_ECCC0003", "message": None}
+    assert table(engine)["sampleid"].tolist() == ["EC-0001_ECCC0003"]
+
+def test_site_labels_are_mapped_to_siteids(engine):
+    sync(engine, [new_op(siteid="Site one (S1)")], {"Site one (S1)": "S1"})
+    assert pd.read_sql_query("SELECT siteid FROM pas_tracking", engine)["siteid"].tolist() == ["S1"]
+
+def test_archived_sampleids_are_not_reused(engine, monkeypatch):
+    import offline_sync
+    # the archive lookup itself is Postgres-only (archive.archived_sampleids)
+    monkeypatch.setattr(offline_sync, "archived_sampleids", lambda conn, ids: {"EC-0001_ECCC0001"} & set(ids))
+    results, applied = sync(engine, [new_op("a"), new_op("b", samplerid="ECCC0002")])
+    assert [r["status"] for r in results] == ["conflict", "applied"]
+    assert "archived kit" in results[0]["message"]
+    assert [r["sampleid"] for r in applied] == ["EC-0001_ECCC0002"]
@@ -0,0 +1,46 @@
+# tracking_page / build_page_query: keyset pages of pas_tracking for GET api/tracking
+
+import pandas as pd
+from tracking_api import build_page_query, tracking_page
+from working_set import to_working_set
+
+def snapshot(sampleids):
+    # as app.load_tracking_frame builds it: typed, sorted by sampleid
+    df = pd.DataFrame({"sampleid": sampleids, "kitid": [s.split("_")[0] if s else "EC-0009" for s in sampleids]})
+    return to_working_set(df).sort_values("sampleid", ignore_index=True)
+
+def all_pages(df, limit, **kwargs):
+    pages, after = [], None
+    while True:
+        page, after = tracking_page(df, after=after, limit=limit, **kwargs)
+        pages.append(page["sampleid"].tolist())
+        if after is None:
+            return pages
+
+def test_pages_cover_every_row_once():
+    ids = [f"EC-000{k}_ECCC000{s}" for k in range(1, 4) for s in range(1, 4)]
+    pages = all_pages(snapshot(ids), limit=4)
+    assert [len(p) for p in pages] == [4, 4, 1]
+    assert sum(pages, []) == sorted(ids)
+
+def test_rows_without_sampleid_are_skipped():
+    ids = ["EC-0001_ECCC0002", None, "EC-0001_ECCC0001", "EC-0002_ECCC0001"]
+    pages = all_pages(snapshot(ids), limit=1)
+    assert pages == [["EC-0001_ECCC0001"], ["EC-0001_ECCC0002"], ["EC-0002_ECCC0001"]]
+
+def test_cursor_order_is_bytewise_like_the_sql_path():
+    # "C" collation in build_page_query: uppercase before lowercase, "-" before digits
+    ids = ["ec-0001_eccc0001", "EC-0001_ECCC0001", "EC-0001-X", None]
+    df = snapshot(ids)
+    assert sum(all_pages(df, limit=2), []) == sorted(i for i in ids if i)
+
+def test_filters_apply_after_the_cursor():
+    ids = ["EC-0001_ECCC0001", "EC-0002_ECCC0002", None, "EC-0001_ECCC0003"]
+    page, after = tracking_page(snapshot(ids), after="EC-0001_ECCC0001", limit=10, filters={"kitid": ["EC-0001"]})
+    assert page["sampleid"].tolist() == ["EC-0001_ECCC0003"] and after is None
+
+def test_page_query_excludes_rows_without_sampleid():
+    query, params = build_page_query("pas_tracking", after="EC-0001_ECCC0001", limit=5)
+    sql = str(query)
+    assert "sampleid IS NOT NULL" in sql and 'sampleid COLLATE "C" > :after' in sql
+    assert params == {"limit": 6, "after": "EC-0001_ECCC0001"}
@@ -0,0 +1,59 @@
+# DistinctValueIndex: suggestions loaded from pas_tracking and kept current after writes
+
+from snapshot_cache import TableSnapshot
+from typeahead import DistinctValueIndex
+
+ROWS = [
+    {"sampleid": "EC-0001_ECCC0001", "kitid": "EC-0001", "samplerid": "ECCC0001", "shipped_location": "Alert"},
+    {"sampleid": "EC-0002_ECCC0002", "kitid": "EC-0002", "samplerid": "ECCC0002", "shipped_location": "Saturna"},
+]
+
+def loaded_index(engine, insert_rows):
+    insert_rows(ROWS)
+    index = DistinctValueIndex(engine)
+    index.refresh()
+    return index
+
+def test_refresh_and_search(engine, insert_rows):
+    index = loaded_index(engine, insert_rows)
+    assert index.search("shipped_location", "sat") == ["Saturna"]
+    assert index.values("kitid") == ["EC-0001", "EC-0002"]
+
+def test_edit_replacing_only_occurrence_drops_the_old_value(engine, insert_rows):
+    index = loaded_index(engine, insert_rows)
+    old = ROWS[0]
+    index.update_rows([(old, {**old, "shipped_location": "Whistler"})])
+
+    assert index.values("shipped_location") == ["Saturna", "Whistler"]
+    assert index.search("shipped_location", "al") == []
+    # unchanged fields are not counted again
+    assert index._counts["kitid"]["EC-0001"] == 1
+    assert index._counts["samplerid"]["ECCC0001"] == 1
+
+def test_edit_keeps_values_still_used_by_other_rows(engine, insert_rows):
+    index = loaded_index(engine, insert_rows)
+    index.add_rows([{"shipped_location": "Alert"}])
+    index.update_rows([(ROWS[0], {"shipped_location": "Whistler"})])
+    assert index.values("shipped_location") == ["Alert", "Saturna", "Whistler"]
+
+def test_remove_rows(engine, insert_rows):
+    index = loaded_index(engine, insert_rows)
+    index.remove_rows([ROWS[1]])
+    assert index.values("kitid") == ["EC-0001"]
+    assert index.values("shipped_location") == ["Alert"]
+
+def test_write_from_another_worker_shows_up(engine, insert_rows, tmp_path):
+    insert_rows(ROWS[:1])
+    # one TableSnapshot per worker process, sharing the cache directory's version file
+    workers = [TableSnapshot(engine, "SELECT * FROM pas_tracking", str(tmp_path), "pas_tracking") for _ in range(2)]
+    indexes = [DistinctValueIndex(engine, version=w.version) for w in workers]
+    assert indexes[1].values("kitid") == ["EC-0001"]
+
+    # worker 0 commits a row, updates its own index and bumps the version
+    insert_rows(ROWS[1:])
+    indexes[0].add_rows(ROWS[1:])
+    workers[0].bump()
+
+    # worker 1 picks it up on its next search, long before max_age
+    assert indexes[1].search("shipped_location", "sat") == ["Saturna"]
+    assert indexes[1].values("kitid") == ["EC-0001", "EC-0002"]
@@ -0,0 +1,95 @@
+# paginated, filtered reads of pas_tracking for GET api/tracking (LIMS and QA scripts)
+#
+# Pages are cut from the shared snapshot, which is kept sorted by sampleid, so a
+# page is a binary search for the cursor plus a slice. Clients pass the last
+# sampleid they received as ?after= to get the next page. With ?include_archive=1
+# the same pages are read from the pas_tracking_all view in SQL instead, since
+# archived kits are not in the snapshot.
+
+import pandas as pd
+from sqlalchemy import text
+
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+FILTER_COLUMNS = {"kitid": "kitid", "samplerid": "samplerid", "siteid": "siteid"}
+
+class TrackingQueryError(ValueError):
+    pass
+
+def parse_page_args(args):
+    try:
+        limit = int(args.get("limit", DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise TrackingQueryError("limit must be an integer.")
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise TrackingQueryError(f"limit must be between 1 and {MAX_PAGE_SIZE}.")
+
+    filters = {}
+    for param, col in FILTER_COLUMNS.items():
+        values = [v.strip() for v in args.get(param, "").split(",") if v.strip()]
+        if values:
+            filters[col] = values
+
+    modified_since = None
+    if args.get("modified_since"):
+        try:
+            modified_since = pd.Timestamp(args["modified_since"])
+        except ValueError:
+            raise TrackingQueryError("modified_since must be an ISO 8601 timestamp.")
+        if modified_since.tzinfo is None:
+            modified_since = modified_since.tz_localize("UTC")
+
+    return {
+        "after": args.get("after") or None,
+        "limit": limit,
+        "filters": filters,
+        "modified_since": modified_since,
+        "include_archive": args.get("include_archive", "").lower() in ("1", "true", "yes"),
+    }
+
+# Slice one page from a snapshot frame sorted by sampleid, returns (page, next cursor or None).
+# Rows without a sampleid cannot be paged to, so they are left out (as in build_page_query).
+def tracking_page(df, after=None, limit=DEFAULT_PAGE_SIZE, filters=None, modified_since=None):
+    if df["sampleid"].hasnans:
+        df = df[df["sampleid"].notna()]
+    if after is not None:
+        df = df.iloc[df["sampleid"].searchsorted(after, side="right"):]
+
+    mask = pd.Series(True, index=df.index)
+    for col, values in (filters or {}).items():
+        mask &= df[col].isin(values)
+    if modified_since is not None:
+        if "modified_at" not in df.columns:
+            raise TrackingQueryError("modified_since needs the modified_at column (sql/pas_tracking_modified_at.sql).")
+        modified_at = pd.to_datetime(df["modified_at"], utc=True)
+        mask &= modified_at >= modified_since
+
+    # one match beyond the page means there is a next page
+    matches = df.index[mask.to_numpy()]
+    page = df.loc[matches[:limit]]
+    next_after = page["sampleid"].iloc[-1] if len(matches) > limit else None
+    return page, next_after
+
+# The same page as tracking_page, as a query against source. Sample IDs are compared
+# in "C" collation so the order (and the cursor) matches the snapshot's.
+def build_page_query(source, after=None, limit=DEFAULT_PAGE_SIZE, filters=None, modified_since=None):
+    where, params = ["sampleid IS NOT NULL"], {"limit": limit + 1}
+    if after is not None:
+        where.append('sampleid COLLATE "C" > :after')
+        params["after"] = after
+    for col, values in (filters or {}).items():
+        where.append(f"{col} = ANY(:{col})")
+        params[col] = list(values)
+    if modified_since is not None:
+        where.append("modified_at >= :modified_since")
+        params["modified_since"] = modified_since.to_pydatetime()
+
+    query = f"SELECT * FROM {source} WHERE " + " AND ".join(where)
+    query += ' ORDER BY sampleid COLLATE "C" LIMIT :limit'
+    return text(query), params
+
+# Split the limit + 1 rows read by build_page_query into (page, next cursor or None)
+def split_page(df, limit):
+    page = df.iloc[:limit]
+    next_after = page["sampleid"].iloc[-1] if len(df) > limit else None
+    return page, next_after
@@ -0,0 +1,129 @@
+# cached, sorted distinct-value index used for ID and location suggestions
+
+import bisect
+import logging
+import threading
+import time
+from collections import Counter
+import pandas as pd
+from single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+TYPEAHEAD_FIELDS = ("shipped_location", "kitid", "samplerid")
+
+class DistinctValueIndex:
+    # version: optional callable returning the table's write counter (TableSnapshot.version),
+    # shared by every worker; a change means someone else wrote and triggers a refresh
+    def __init__(self, engine, fields=TYPEAHEAD_FIELDS, max_age=600, version=None):
+        self.engine = engine
+        self.fields = tuple(fields)
+        self.max_age = max_age  # seconds before a full refresh, for writes that do not bump the version
+        self.version = version
+        self.loaded_at = None
+        self.loaded_version = None
+        self._lock = threading.Lock()
+        self._refresh_flight = SingleFlight()
+        self._counts = {field: Counter() for field in self.fields}
+        self._keys = {field: [] for field in self.fields}    # lowercased, sorted
+        self._values = {field: [] for field in self.fields}  # original values, same order as _keys
+
+    # Reload every field from pas_tracking in one round trip
+    def refresh(self):
+        # read before the query, so a write landing during the load still counts as new
+        loaded_version = self.version() if self.version else None
+        query = " UNION ALL ".join(
+            f"SELECT '{field}' AS field, CAST({field} AS TEXT) AS value, COUNT(*) AS n "
+            f"FROM pas_tracking WHERE {field} IS NOT NULL GROUP BY {field}"
+            for field in self.fields
+        )
+        df = pd.read_sql_query(query, self.engine)
+
+        counts = {field: Counter() for field in self.fields}
+        for field, value, n in df.itertuples(index=False):
+            value = value.strip()
+            if value:
+                counts[field][value] += int(n)
+
+        with self._lock:
+            self._counts = counts
+            for field in self.fields:
+                values = sorted(counts[field], key=str.lower)
+                self._values[field] = values
+                self._keys[field] = [v.lower() for v in values]
+            self.loaded_at = time.monotonic()
+            self.loaded_version = loaded_version
+        logger.info(f"Typeahead index refreshed: {', '.join(f'{f}={len(self._values[f])}' for f in self.fields)}")
+
+    def ensure_fresh(self):
+        if (
+            self.loaded_at is None
+            or time.monotonic() - self.loaded_at > self.max_age
+            or (self.version and self.version() != self.loaded_version)
+        ):
+            # concurrent searches that find the index stale wait for one refresh
+            self._refresh_flight.do("refresh", self.refresh)
+
+    # Incremental maintenance after uploads and deletes
+    def add_rows(self, rows):
+        with self._lock:
+            for row in rows:
+                for field in self.fields:
+                    value = self._clean(row.get(field))
+                    if value is None:
+                        continue
+                    if self._counts[field][value] == 0:
+                        pos = bisect.bisect_left(self._keys[field], value.lower())
+                        self._keys[field].insert(pos, value.lower())
+                        self._values[field].insert(pos, value)
+                    self._counts[field][value] += 1
+
+    def remove_rows(self, rows):
+        with self._lock:
+            for row in rows:
+                for field in self.fields:
+                    value = self._clean(row.get(field))
+                    if value is None or self._counts[field][value] == 0:
+                        continue
+                    self._counts[field][value] -= 1
+                    if self._counts[field][value] == 0:
+                        del self._counts[field][value]
+                        pos = bisect.bisect_left(self._keys[field], value.lower())
+                        while pos < len(self._keys[field]) and self._values[field][pos] != value:
+                            pos += 1
+                        if pos < len(self._keys[field]):
+                            del self._keys[field][pos]
+                            del self._values[field][pos]
+
+    # Edited rows as (old values, new values) pairs: only fields whose value
+    # changed move from the old value to the new one
+    def update_rows(self, changes):
+        removed, added = [], []
+        for old, new in changes:
+            fields = [f for f in self.fields if f in new and self._clean(old.get(f)) != self._clean(new.get(f))]
+            removed.append({f: old.get(f) for f in fields})
+            added.append({f: new.get(f) for f in fields})
+        self.remove_rows(removed)
+        self.add_rows(added)
+
+    # Case-insensitive prefix search, returns at most `limit` values in sorted order
+    def search(self, field, prefix="", limit=20):
+        self.ensure_fresh()
+        prefix = (prefix or "").strip().lower()
+        with self._lock:
+            keys = self._keys[field]
+            start = bisect.bisect_left(keys, prefix)
+            end = bisect.bisect_right(keys, prefix + "\uffff", lo=start)
+            return self._values[field][start:min(end, start + limit)]
+
+    def values(self, field):
+        self.ensure_fresh()
+        with self._lock:
+            return list(self._values[field])
+
+    @staticmethod
+    def _clean(value):
+        if value is None or pd.isna(value):
+            return None
+        value = str(value).strip()
+        return value or None
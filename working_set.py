@@ -0,0 +1,70 @@
+# typed, fixed-schema frames for pas_tracking rows
+#
+# Low-cardinality text columns are categoricals and timestamps are datetime64,
+# which keeps the shared snapshot small and makes the Update searches vectorized.
+# to_grid_records is the single conversion to the strings the grid edits.
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import DatetimeTZDtype
+
+TRACKING_SCHEMA = {
+    'sample_start': 'datetime64[ns]',
+    'sample_end': 'datetime64[ns]',
+    'sampleid': 'string',
+    'kitid': 'category',
+    'samplerid': 'string',
+    'siteid': 'category',
+    'shipped_location': 'category',
+    'shipped_date': 'datetime64[ns]',
+    'return_date': 'datetime64[ns]',
+    'sample_type': 'category',
+    'note': 'string',
+}
+
+# how each datetime column is shown in the grid: to the minute or to the day
+GRID_DATETIME_UNITS = {
+    'sample_start': 'm',
+    'sample_end': 'm',
+    'shipped_date': 'D',
+    'return_date': 'D',
+}
+
+# Coerce a frame (from SQL or from grid records) to TRACKING_SCHEMA; extra columns are kept as-is
+def to_working_set(df):
+    df = df.copy()
+    for col, dtype in TRACKING_SCHEMA.items():
+        if col not in df.columns:
+            df[col] = pd.Series(pd.NA, index=df.index, dtype=dtype)
+        elif dtype.startswith('datetime64'):
+            values = pd.to_datetime(df[col], errors='coerce')
+            if isinstance(values.dtype, DatetimeTZDtype):
+                values = values.dt.tz_localize(None)  # keep the wall-clock time the table shows
+            df[col] = values.astype(dtype)
+        elif dtype == 'category':
+            df[col] = df[col].astype('string').str.strip().replace('', pd.NA).astype('category')
+        else:
+            df[col] = df[col].astype(dtype)
+    extra = [c for c in df.columns if c not in TRACKING_SCHEMA]
+    return df[list(TRACKING_SCHEMA) + extra]
+
+# Column as a list of JSON-ready values (None for NaN/NaT/NA), without per-cell pandas calls
+def _column_values(series, datetime_unit=None):
+    if datetime_unit and pd.api.types.is_datetime64_any_dtype(series):
+        values = series.to_numpy(dtype='datetime64[ns]')
+        text = np.datetime_as_string(values, unit=datetime_unit)
+        if datetime_unit == 'm':
+            text = np.char.replace(text, 'T', ' ')
+        out = text.astype(object)
+        out[np.isnat(values)] = None
+        return out.tolist()
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        categories = np.append(series.cat.categories.to_numpy(dtype=object), None)
+        return categories[series.cat.codes.to_numpy()].tolist()  # code -1 picks the trailing None
+    return series.to_numpy(dtype=object, na_value=None).tolist()
+
+# Serialize a working-set frame to grid rows (JSON-ready dicts, None for missing)
+def to_grid_records(df):
+    columns = list(df.columns)
+    values = [_column_values(df[col], GRID_DATETIME_UNITS.get(col)) for col in columns]
+    return [dict(zip(columns, row)) for row in zip(*values)]